@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+离线下载性能测试
+
+启动本地模拟服务器 (mock_zhihu_server.py)，在独立的子进程中运行完整的下载流程，报告:
+
+- 解析耗时: 每个视频从页面/小节 API 到拿到播放列表的平均耗时
+- 吞吐量: 从开始解析到输出文件完成的端到端 MB/s
+- 峰值内存: 下载进程的最大常驻内存 (RSS)
+
+测试场景:
+
+- mp4: 单个大 MP4 视频 (多连接 Range 下载)
+- hls: 单个 HLS 视频 (分片并发下载 + ffmpeg 合并，需要 ffmpeg)
+- hls-pipe: 同上，使用流式合并 (--pipe-remux)
+- hls-aes: AES-128 加密的 HLS 视频 (分片下载后在下载线程中解密，需要 cryptography)
+- hls-clip: 只下载 HLS 视频中间四分之一的片段 (--start / --end，只下载覆盖片段的分片)
+- batch: 整课批量下载 (MP4 和 HLS 交替)
+
+使用方法:
+    python benchmarks/bench_download.py [--runs 3] [--workloads mp4 hls] [--latency-ms 20]
+                                        [--bandwidth 20M] [--rate-429 0.02]
+                                        [--mirrors 2] [--mirror-bandwidth 2M]
+                                        [--output results.json] [--compare baseline.json]
+
+结果 (含 git 提交、Python 版本和全部测试参数) 可以用 --output 保存为 JSON，之后用
+--compare 与另一个提交的结果对比。只有测试参数相同的结果才有可比性。
+任何场景下载失败时以退出码 1 结束。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+import statistics
+import subprocess
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+
+from mock_zhihu_server import MockZhihuServer, parse_size
+
+WORKLOADS = ("mp4", "hls", "hls-pipe", "hls-aes", "hls-clip", "batch")
+
+# 计入解析耗时的阶段 (见 DownloadMetrics)
+RESOLVE_PHASES = ("page", "page_parse", "training_section", "training_catalog", "lens_video")
+
+
+def _peak_rss_mb() -> float:
+    """当前进程的峰值 RSS (MB)，不支持的平台返回 0"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_workload(config: dict) -> dict:
+    """在当前进程中运行一个测试场景 (由子进程调用)"""
+    sys.path.insert(0, str(PACKAGE_DIR))
+    from zhihu_downloader import ClipRange, ZhihuVideoDownloader
+    from mock_zhihu_server import point_downloader_at
+    
+    workload = config["workload"]
+    downloader = ZhihuVideoDownloader(
+        use_chrome_cookies=False,
+        segment_workers=config["segment_workers"],
+        mp4_connections=config["mp4_connections"],
+        pipe_remux=workload == "hls-pipe",
+        parallel_videos=config["jobs"] if workload == "batch" else 1,
+    )
+    point_downloader_at(downloader, config["base_url"])
+    
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        # 下载器的输出会干扰结果解析
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if workload == "batch":
+                report = downloader.download_course(
+                    config["url"], output_dir, jobs=config["jobs"]
+                )
+                videos = report["total"] if report else 0
+                succeeded = bool(report) and report["downloaded"] == report["total"]
+            else:
+                videos = 1
+                clip = ClipRange(*config["clip"]) if config.get("clip") else None
+                succeeded = downloader.download_video(
+                    config["url"], output_dir, clip=clip
+                ) is not None
+        elapsed = time.perf_counter() - start
+    
+    snapshot = downloader.metrics.snapshot()
+    resolve_seconds = sum(
+        snapshot["phases"].get(name, {}).get("seconds", 0) for name in RESOLVE_PHASES
+    )
+    hosts = snapshot["hosts"].values()
+    return {
+        "success": succeeded,
+        "elapsed": elapsed,
+        "bytes": sum(host["bytes"] for host in hosts),
+        "resolve_ms": resolve_seconds / max(1, videos) * 1000,
+        "requests": sum(host["requests"] for host in hosts),
+        "retries": sum(host["retries"] for host in hosts),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_child(config: dict) -> dict:
+    """在新进程中运行测试场景，峰值内存只包含下载器本身"""
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", json.dumps(config)],
+        capture_output=True, text=True
+    )
+    if output.returncode != 0:
+        print(output.stderr.strip().splitlines()[-1] if output.stderr.strip() else "子进程失败")
+        return {"success": False}
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def git_revision() -> dict:
+    """当前 git 提交，以及工作区是否有未提交的修改"""
+    def git(*args) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=PACKAGE_DIR, capture_output=True, text=True
+        ).stdout.strip()
+    
+    try:
+        return {"commit": git("rev-parse", "--short", "HEAD") or None,
+                "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": False}
+
+
+def summarize(results: list) -> dict:
+    """多次运行的中位数"""
+    succeeded = [result for result in results if result.get("success")]
+    if not succeeded:
+        return {"success": False, "runs": len(results), "failures": len(results)}
+    
+    def median(key):
+        return statistics.median(result[key] for result in succeeded)
+    
+    elapsed = median("elapsed")
+    return {
+        "success": len(succeeded) == len(results),
+        "runs": len(results),
+        "failures": len(results) - len(succeeded),
+        "elapsed": round(elapsed, 3),
+        "mb": round(median("bytes") / 1024 / 1024, 2),
+        "mb_per_s": round(statistics.median(
+            result["bytes"] / result["elapsed"] / 1024 / 1024 for result in succeeded
+        ), 2),
+        "resolve_ms": round(median("resolve_ms"), 1),
+        "requests": median("requests"),
+        "retries": median("retries"),
+        "peak_rss_mb": round(max(result["peak_rss_mb"] for result in succeeded), 1),
+    }
+
+
+def print_comparison(summaries: dict, baseline: dict):
+    """与基准结果对比，显示变化百分比"""
+    print(f"\n与基准对比 ({baseline.get('git', {}).get('commit') or '未知提交'}):")
+    if baseline.get("parameters") != summaries["parameters"]:
+        print("⚠ 测试参数与基准不同，结果不可直接比较")
+    
+    def change(new, old):
+        if not old or new is None:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}%"
+    
+    print(f"{'场景':<12}{'MB/s':>12}{'解析(ms)':>12}{'峰值内存':>12}")
+    for name, summary in summaries["workloads"].items():
+        old = baseline.get("workloads", {}).get(name)
+        if not old or not old.get("success") or not summary.get("success"):
+            print(f"{name:<12}{'-':>12}{'-':>12}{'-':>12}")
+            continue
+        print(
+            f"{name:<12}{change(summary['mb_per_s'], old['mb_per_s']):>12}"
+            f"{change(summary['resolve_ms'], old['resolve_ms']):>12}"
+            f"{change(summary['peak_rss_mb'], old['peak_rss_mb']):>12}"
+        )
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        print(json.dumps(run_workload(json.loads(sys.argv[2]))))
+        return 0
+    
+    parser = argparse.ArgumentParser(description="离线下载性能测试")
+    parser.add_argument("--runs", type=int, default=3, help="每个场景的运行次数 (默认: 3)")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS),
+                        help="要运行的场景 (默认: 全部)")
+    parser.add_argument("--mp4-size", type=parse_size, default="64M", help="MP4 视频大小 (默认: 64M)")
+    parser.add_argument("--hls-segments", type=int, default=32, help="HLS 视频分片数 (默认: 32)")
+    parser.add_argument("--segment-size", type=parse_size, default="1M", help="HLS 分片大小 (默认: 1M)")
+    parser.add_argument("--batch-videos", type=int, default=8, help="批量课程的视频数 (默认: 8)")
+    parser.add_argument("--batch-video-size", type=parse_size, default="8M",
+                        help="批量课程中每个视频的大小 (默认: 8M)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的延迟，毫秒 (默认: 0)")
+    parser.add_argument("--bandwidth", type=parse_size, default="0",
+                        help="每个连接的带宽上限，字节/秒 (默认: 不限制)")
+    parser.add_argument("--rate-403", type=float, default=0, help="CDN 返回 403 的概率 (默认: 0)")
+    parser.add_argument("--rate-429", type=float, default=0, help="CDN 返回 429 的概率 (默认: 0)")
+    parser.add_argument("--drop-rate", type=float, default=0, help="CDN 中途断开连接的概率 (默认: 0)")
+    parser.add_argument("--url-ttl", type=float, default=0,
+                        help="播放地址的有效期，秒，用于测试地址过期后的刷新 (默认: 不过期)")
+    parser.add_argument("--seed", type=int, default=0, help="故障注入的随机数种子 (默认: 0)")
+    parser.add_argument("--mirrors", type=int, default=0,
+                        help="CDN 镜像节点数，用于测试主机选择和故障转移 (默认: 0)")
+    parser.add_argument("--mirror-bandwidth", type=parse_size, default="0",
+                        help="第一个镜像节点每个连接的带宽上限，模拟较慢的节点 (默认: 与 --bandwidth 相同)")
+    parser.add_argument("--segment-workers", type=int, default=8, help="分片下载线程数 (默认: 8)")
+    parser.add_argument("--mp4-connections", type=int, default=4, help="MP4 下载连接数 (默认: 4)")
+    parser.add_argument("--jobs", type=int, default=3, help="批量下载时同时下载的视频数 (默认: 3)")
+    parser.add_argument("--output", help="把结果保存为 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    args = parser.parse_args()
+    
+    parameters = {
+        key: value for key, value in vars(args).items()
+        if key not in ("runs", "workloads", "output", "compare")
+    }
+    
+    print("正在启动模拟服务器...")
+    server = MockZhihuServer(
+        mp4_size=args.mp4_size, hls_segments=args.hls_segments,
+        segment_size=args.segment_size, batch_videos=args.batch_videos,
+        batch_video_size=args.batch_video_size, latency=args.latency_ms / 1000,
+        bandwidth=args.bandwidth, rate_403=args.rate_403, rate_429=args.rate_429,
+        drop_rate=args.drop_rate, url_ttl=args.url_ttl, seed=args.seed,
+        mirrors=args.mirrors, mirror_bandwidth=args.mirror_bandwidth
+    ).start()
+    
+    urls = {
+        "mp4": server.section_url(server.SAMPLE_COURSE, "1"),
+        "hls": server.section_url(server.SAMPLE_COURSE, "2"),
+        "hls-pipe": server.section_url(server.SAMPLE_COURSE, "2"),
+        "hls-aes": server.section_url(server.SAMPLE_COURSE, "3"),
+        "hls-clip": server.section_url(server.SAMPLE_COURSE, "2"),
+        "batch": server.course_url(server.BATCH_COURSE),
+    }
+    
+    summaries = {
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "parameters": parameters,
+        "workloads": {},
+    }
+    
+    # hls-clip 下载的片段: 视频的第二个四分之一
+    hls_duration = args.hls_segments * MockZhihuServer.SEGMENT_DURATION
+    clip = [hls_duration / 4, hls_duration / 2]
+    
+    print(f"\n{'场景':<12}{'大小(MB)':>10}{'MB/s':>10}{'解析(ms)':>10}{'请求数':>8}"
+          f"{'重试':>6}{'峰值内存(MB)':>14}  结果")
+    failed = False
+    try:
+        for name in args.workloads:
+            results = []
+            for _ in range(args.runs):
+                # 每次运行看到相同的故障序列
+                server.reset()
+                results.append(run_child({
+                    "workload": name,
+                    "url": urls[name],
+                    "base_url": server.base_url,
+                    "segment_workers": args.segment_workers,
+                    "mp4_connections": args.mp4_connections,
+                    "jobs": args.jobs,
+                    "clip": clip if name == "hls-clip" else None,
+                }))
+            
+            summary = summarize(results)
+            summaries["workloads"][name] = summary
+            if not summary["success"]:
+                failed = True
+            if "mb_per_s" not in summary:
+                print(f"{name:<12}{'-':>10}{'-':>10}{'-':>10}{'-':>8}{'-':>6}{'-':>14}  ✗ 全部失败")
+                continue
+            status = "✓" if summary["success"] else f"⚠ 失败 {summary['failures']}/{summary['runs']} 次"
+            print(
+                f"{name:<12}{summary['mb']:>10.1f}{summary['mb_per_s']:>10.1f}"
+                f"{summary['resolve_ms']:>10.1f}{summary['requests']:>8.0f}"
+                f"{summary['retries']:>6.0f}{summary['peak_rss_mb']:>14.1f}  {status}"
+            )
+    finally:
+        server.stop()
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summaries, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ 结果已保存: {args.output}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(summaries, json.load(f))
+    
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+页面解析性能测试
+
+测量 extract_video_from_page 在知乎页面上的解析耗时，确保保持在几毫秒以内。
+
+使用方法:
+    python benchmarks/bench_page_parser.py [页面文件或目录 ...] [--runs 50] [--budget-ms 10]
+
+页面文件是在浏览器中「另存为」的训练营视频页面 HTML。不提供页面时使用生成的合成页面。
+任何页面的中位耗时超过 --budget-ms 时以退出码 1 结束，便于在 CI 中使用。
+"""
+
+import sys
+import json
+import time
+import argparse
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from zhihu_downloader import extract_video_from_page
+
+
+VIDEO_ID = "4zbweJq7bVyP6FeOy6FMVyqjFQ4ooFeo46bRe46fFe4b6FV_yqbFW4oFFe4h6be24qGReyzFFeZZx_6EC"
+
+
+def _filler_entities(count: int) -> dict:
+    """生成与知乎页面初始状态类似的大量无关实体"""
+    return {
+        str(index): {
+            "id": str(10 ** 18 + index),
+            "type": "answer",
+            "title": f"问题 {index}",
+            "content": "<p>" + "知乎内容" * 40 + "</p>",
+            "author": {"name": f"user{index}", "headline": "简介" * 10},
+        }
+        for index in range(count)
+    }
+
+
+def build_state_page(entity_count: int, training_video: bool = True) -> str:
+    """
+    视频资源位于初始状态 JSON 末尾的页面
+    
+    training_video 为 False 时视频资源不在 trainingVideo 键下，需要解析整个初始状态
+    """
+    section = {
+        "title": "第三讲 示例",
+        "resource": {"type": "video", "data": {"id": VIDEO_ID, "duration": 1800}},
+    }
+    if training_video:
+        video_state = {
+            "__connectedAutoFetch": {
+                "trainingVideo": {
+                    "data": {"title": section["title"], "videoInfo": section},
+                    "error": None,
+                }
+            }
+        }
+    else:
+        video_state = {"sections": {"1973778517947865002": section}}
+    
+    state = {
+        "initialState": {
+            "entities": {"answers": _filler_entities(entity_count)},
+            **video_state,
+        }
+    }
+    return (
+        "<!doctype html><html><head><title>知乎</title></head><body>"
+        '<div id="root"></div>'
+        '<script id="js-initialData" type="text/json">'
+        + json.dumps(state, ensure_ascii=False)
+        + "</script></body></html>"
+    )
+
+
+def build_inline_page(entity_count: int, video: bool = True) -> str:
+    """
+    没有初始状态脚本、数据直接写在内联脚本中的页面
+    
+    video 为 False 时页面中没有视频，测量所有解析方式都失败时的最坏耗时
+    """
+    body = json.dumps(_filler_entities(entity_count), ensure_ascii=False)
+    resource = {"title": "示例"}
+    if video:
+        resource["resource"] = {"type": "video", "data": {"id": VIDEO_ID}}
+    return (
+        f"<html><body><script>window.data = {body}; "
+        f"window.video = {json.dumps(resource, ensure_ascii=False)};</script></body></html>"
+    )
+
+
+def synthetic_pages() -> dict:
+    return {
+        "trainingVideo-1MB": build_state_page(3500),
+        "trainingVideo-4MB": build_state_page(14000),
+        "initialState-1MB": build_state_page(3500, training_video=False),
+        "inline-1MB": build_inline_page(3500),
+        "no-video-1MB": build_inline_page(3500, video=False),
+    }
+
+
+def load_pages(paths) -> dict:
+    pages = {}
+    for path in map(Path, paths):
+        files = sorted(path.glob("*.htm*")) if path.is_dir() else [path]
+        for file in files:
+            pages[file.name] = file.read_text(encoding="utf-8", errors="replace")
+    return pages
+
+
+def bench(html: str, runs: int):
+    timings = []
+    result = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = extract_video_from_page(html)
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="页面解析性能测试")
+    parser.add_argument("pages", nargs="*", help="保存的页面 HTML 文件或目录")
+    parser.add_argument("--runs", type=int, default=50, help="每个页面的运行次数 (默认: 50)")
+    parser.add_argument("--budget-ms", type=float, default=10.0,
+                        help="允许的中位耗时，毫秒 (默认: 10)")
+    args = parser.parse_args()
+    
+    pages = load_pages(args.pages) if args.pages else synthetic_pages()
+    if not pages:
+        print("⚠ 没有找到页面文件")
+        return 1
+    
+    print(f"{'页面':<24}{'大小':>10}{'中位(ms)':>12}{'p95(ms)':>12}  结果")
+    over_budget = False
+    for name, html in pages.items():
+        result, timings = bench(html, args.runs)
+        median = statistics.median(timings)
+        p95 = sorted(timings)[int(len(timings) * 0.95) - 1]
+        found = f"{result['source']}: {result['video_id'][:20]}..." if result else "未找到视频 ID"
+        flag = " ⚠ 超出预算" if median > args.budget_ms else ""
+        over_budget = over_budget or bool(flag)
+        print(f"{name:<24}{len(html) / 1024 / 1024:>8.1f}MB{median:>12.2f}{p95:>12.2f}  {found}{flag}")
+    
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+启动耗时测试
+
+在新的 Python 进程中测量导入 zhihu_downloader 的耗时，以及创建下载器并完成第一个
+HTTP 请求 (本地服务器) 的耗时。批量任务会启动大量短时进程，这部分开销会累积。
+
+同时检查不需要 Chrome cookies 的运行方式 (--no-cookies / -c cookies.json) 没有导入
+browser_cookie3 及其加密库依赖，也没有在下载 M3U8 之前导入 m3u8。
+
+使用方法:
+    python benchmarks/bench_startup.py [--runs 10] [--budget-ms 250]
+
+任何场景到第一个请求完成的中位耗时超过 --budget-ms，或导入了不需要的模块时，
+以退出码 1 结束，便于在 CI 中使用。
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+
+# 只在特定代码路径上才应该导入的模块
+LAZY_MODULES = ("browser_cookie3", "Cryptodome", "Crypto", "m3u8")
+
+# 在子进程中运行的测量代码
+CHILD_CODE = """
+import sys, json, time
+start = time.perf_counter()
+sys.path.insert(0, {package_dir!r})
+from zhihu_downloader import ZhihuVideoDownloader
+imported = time.perf_counter()
+downloader = ZhihuVideoDownloader(use_chrome_cookies=False, cookie_file={cookie_file!r})
+response = downloader.session.get({url!r}, timeout=10)
+response.raise_for_status()
+done = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "first_request_ms": (done - start) * 1000,
+    "lazy_modules": [name for name in {lazy_modules!r} if name in sys.modules],
+}}))
+"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+def run_child(code: str) -> dict:
+    """在新进程中运行测量代码，返回测量结果和进程总耗时"""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        check=True, capture_output=True, text=True
+    ).stdout
+    wall_ms = (time.perf_counter() - start) * 1000
+    
+    # 下载器初始化时可能会输出提示信息，结果在最后一行
+    result = json.loads(output.strip().splitlines()[-1])
+    result["wall_ms"] = wall_ms
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时测试")
+    parser.add_argument("--runs", type=int, default=10, help="每个场景的运行次数 (默认: 10)")
+    parser.add_argument("--budget-ms", type=float, default=250.0,
+                        help="允许的到第一个请求完成的中位耗时，毫秒 (默认: 250)")
+    args = parser.parse_args()
+    
+    server = HTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/api/v4/me"
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cookie_file = os.path.join(tmp_dir, "cookies.json")
+        with open(cookie_file, "w") as f:
+            json.dump([{"name": "z_c0", "value": "test", "domain": ".zhihu.com"}], f)
+        
+        scenarios = {
+            "--no-cookies": None,
+            "-c cookies.json": cookie_file,
+        }
+        
+        # 解释器本身的启动耗时，作为参照
+        baseline = statistics.median(
+            run_child('print("{}")')["wall_ms"] for _ in range(args.runs)
+        )
+        print(f"Python 解释器启动: {baseline:.1f} ms\n")
+        
+        print(f"{'场景':<20}{'导入(ms)':>12}{'首个请求(ms)':>16}{'进程总耗时(ms)':>18}  多余的模块")
+        failed = False
+        for name, cookie in scenarios.items():
+            code = CHILD_CODE.format(
+                package_dir=str(PACKAGE_DIR), cookie_file=cookie, url=url,
+                lazy_modules=LAZY_MODULES
+            )
+            results = [run_child(code) for _ in range(args.runs)]
+            
+            import_ms = statistics.median(r["import_ms"] for r in results)
+            first_request_ms = statistics.median(r["first_request_ms"] for r in results)
+            wall_ms = statistics.median(r["wall_ms"] for r in results)
+            extra_modules = sorted({m for r in results for m in r["lazy_modules"]})
+            
+            flag = ""
+            if first_request_ms > args.budget_ms:
+                flag = " ⚠ 超出预算"
+            if extra_modules or flag:
+                failed = True
+            print(
+                f"{name:<20}{import_ms:>12.1f}{first_request_ms:>16.1f}{wall_ms:>18.1f}  "
+                f"{', '.join(extra_modules) or '无'}{flag}"
+            )
+    
+    server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    exit(main())
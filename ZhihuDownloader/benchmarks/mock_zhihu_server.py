@@ -0,0 +1,783 @@
+#!/usr/bin/env python3
+"""
+本地模拟知乎 / CDN 服务器
+
+提供 ZhihuVideoDownloader 会请求的所有端点，用于离线测试和性能测试:
+
+- 训练营视频页面: /xen/market/training/training-video/{productId}/{sectionId}
+- 训练营小节 API: /api/infinity/training/section/{sectionId}
+- 训练营课程目录 API: /api/infinity/training/{productId}/catalog
+- Lens 视频 API: /api/v4/videos/{videoId}
+- 鉴权检查: /api/v4/me
+- CDN: /cdn/hls/{videoId}/index.m3u8、/cdn/hls/{videoId}/{n}.ts、/cdn/hls/{videoId}/key{n}.bin、
+  /cdn/mp4/{videoId}.mp4 (支持 Range；带有按时间索引的 moov，可以测试片段下载的字节范围计算)
+
+CDN 请求可以注入延迟、带宽限制、403/429 响应和中途断开的连接 (--fault-api 时 API 请求也会)。
+使用 --url-ttl 时播放地址和分片地址带有 expires 签名参数，过期后 CDN 返回 403。
+使用 --mirrors 时在其他端口上额外启动 CDN 镜像节点 (与主服务器共用数据和故障注入)，
+Lens 视频 API 把镜像节点的地址作为 sd / ld 清晰度的播放地址返回；--mirror-bandwidth 单独
+限制第一个镜像节点的带宽，模拟较慢的节点。
+
+内置的课程:
+
+- 课程 100: 小节 1 为一个大 MP4 视频，小节 2 为一个 HLS 视频，小节 3 为 AES-128 加密的 HLS 视频
+  (内容与小节 2 相同，前一半分片的 IV 使用媒体序号，后一半使用另一个密钥和指定的 IV；
+  需要 cryptography)
+- 课程 200: batch_videos 个较小的视频，MP4 和 HLS 交替，用于整课批量下载
+
+使用方法:
+    python benchmarks/mock_zhihu_server.py [--port 8900] [--latency-ms 20] [--bandwidth 10M]
+                                           [--rate-403 0.01] [--rate-429 0.05] [--drop-rate 0.01]
+                                           [--mirrors 2] [--mirror-bandwidth 1M]
+
+在代码中使用:
+    server = MockZhihuServer(latency=0.02).start()
+    downloader = ZhihuVideoDownloader(use_chrome_cookies=False)
+    point_downloader_at(downloader, server.base_url)
+    downloader.download_video(server.section_url("100", "1"))
+    server.stop()
+"""
+
+import os
+import re
+import json
+import math
+import time
+import random
+import struct
+import hashlib
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# MPEG-TS 包大小
+TS_PACKET_SIZE = 188
+
+# 带宽限制时每次写入的大小
+WRITE_CHUNK_SIZE = 64 * 1024
+
+_RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+_SIZE_PATTERN = re.compile(r"^(\d+(?:\.\d+)?)([KMG]?)$", re.IGNORECASE)
+
+
+@dataclass
+class MockVideo:
+    """模拟的视频"""
+    video_id: str
+    title: str
+    format: str          # mp4 或 m3u8
+    size: int            # MP4 文件大小，或所有 HLS 分片的总大小
+    segments: int = 0    # HLS 分片数
+    encrypted: bool = False  # HLS 分片是否使用 AES-128 加密
+    
+    @property
+    def duration(self) -> float:
+        """视频时长 (秒)，按 HLS 分片时长或 1 MiB/秒 估算"""
+        if self.format == "m3u8":
+            return self.segments * MockZhihuServer.SEGMENT_DURATION
+        return max(1.0, self.size / (1024 * 1024))
+
+
+def parse_size(text: str) -> int:
+    """解析 10M / 512K / 1.5G 形式的字节数"""
+    match = _SIZE_PATTERN.match(text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"无效的大小: {text}")
+    unit = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}[match.group(2).upper()]
+    return int(float(match.group(1)) * unit)
+
+
+def _synthetic_bytes(seed: str, size: int) -> bytes:
+    """由种子确定的伪随机数据 (不可压缩，且每次生成的内容相同)"""
+    return random.Random(seed).getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+
+def _hls_key(video_id: str, number: int) -> bytes:
+    """加密 HLS 视频的第 number 个密钥 (16 字节)"""
+    return hashlib.sha256(f"{video_id}:key{number}".encode()).digest()[:16]
+
+
+# 加密 HLS 视频后一半分片使用的 IV (前一半不指定 IV，使用媒体序号)
+_HLS_EXPLICIT_IV = bytes(range(16))
+
+
+def _segment_encryption(video: MockVideo, index: int) -> Tuple[int, bytes]:
+    """分片使用的 (密钥编号, IV)"""
+    if index < video.segments // 2:
+        return 0, index.to_bytes(16, "big")
+    return 1, _HLS_EXPLICIT_IV
+
+
+def _encrypt_segment(data: bytes, key: bytes, iv: bytes) -> bytes:
+    """AES-128-CBC 加密 (PKCS7 填充)，只有请求加密的 HLS 视频时才导入 cryptography"""
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    padding = 16 - len(data) % 16
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    return encryptor.update(data + bytes([padding]) * padding) + encryptor.finalize()
+
+
+def _mp4_box(box_type: bytes, *payload: bytes) -> bytes:
+    body = b"".join(payload)
+    return struct.pack(">I4s", 8 + len(body), box_type) + body
+
+
+def _mp4_track(handler: bytes, samples: int, delta: int, sample_size: int,
+               per_chunk: int, offsets: List[int], sync_every: int = 0) -> bytes:
+    """只包含下载器用到的采样表的 trak (时间单位为毫秒，采样大小相同)"""
+    tables = [
+        _mp4_box(b"stts", struct.pack(">IIII", 0, 1, samples, delta)),
+        _mp4_box(b"stsc", struct.pack(">IIIII", 0, 1, 1, per_chunk, 1)),
+        _mp4_box(b"stsz", struct.pack(">III", 0, sample_size, samples)),
+        _mp4_box(b"stco", struct.pack(f">II{len(offsets)}I", 0, len(offsets), *offsets)),
+    ]
+    if sync_every:
+        sync = range(1, samples + 1, sync_every)
+        tables.append(_mp4_box(b"stss", struct.pack(f">II{len(sync)}I", 0, len(sync), *sync)))
+    return _mp4_box(
+        b"trak",
+        _mp4_box(
+            b"mdia",
+            _mp4_box(b"mdhd", struct.pack(">IIIIIHH", 0, 0, 0, 1000, samples * delta, 0, 0)),
+            _mp4_box(b"hdlr", struct.pack(">II4s12x", 0, 0, handler), b"\0"),
+            _mp4_box(b"minf", _mp4_box(b"stbl", *tables)),
+        ),
+    )
+
+
+def _build_mp4(payload: memoryview, size: int, duration: float) -> "_JoinedBytes":
+    """
+    生成 size 字节的 MP4 结构: ftyp + mdat (payload 的前缀) + moov
+    
+    moov 描述每秒交替的视频 chunk (25 fps，每 2 秒一个关键帧) 和音频 chunk (每秒 50 个采样)，
+    采样数据是伪随机字节，不能解码，只用于测试片段下载的索引读取和字节范围计算。
+    """
+    ftyp = _mp4_box(b"ftyp", b"isom", struct.pack(">I", 0x200), b"isomiso2mp41")
+    seconds = max(1, math.ceil(duration))
+    
+    def build_moov(data_size: int) -> bytes:
+        # 视频占 9/10 的数据，音频占 1/10
+        video_size = max(1, data_size * 9 // 10 // (seconds * 25))
+        audio_size = max(1, data_size // 10 // (seconds * 50))
+        video_offsets, audio_offsets = [], []
+        position = len(ftyp) + 8
+        for _ in range(seconds):
+            video_offsets.append(position)
+            position += video_size * 25
+            audio_offsets.append(position)
+            position += audio_size * 50
+        return _mp4_box(
+            b"moov",
+            _mp4_track(b"vide", seconds * 25, 40, video_size, 25, video_offsets, 50),
+            _mp4_track(b"soun", seconds * 50, 20, audio_size, 50, audio_offsets),
+        )
+    
+    # moov 的大小与采样大小无关，先按估计的数据大小生成一次得到 moov 大小
+    moov_size = len(build_moov(size))
+    data_size = size - len(ftyp) - 8 - moov_size
+    if data_size <= 0:
+        raise ValueError(f"MP4 视频太小: {size} 字节")
+    moov = build_moov(data_size)
+    mdat = struct.pack(">I4s", 8 + data_size, b"mdat")
+    return _JoinedBytes([ftyp + mdat, payload[:data_size], moov])
+
+
+class _JoinedBytes:
+    """把几段数据 (bytes / memoryview) 当作一段连续数据切片，不复制整个文件"""
+    
+    def __init__(self, parts: List):
+        self.parts = parts
+        self._length = sum(len(part) for part in parts)
+    
+    def __len__(self) -> int:
+        return self._length
+    
+    def __getitem__(self, key: slice) -> bytes:
+        start, stop, _ = key.indices(self._length)
+        pieces = []
+        position = 0
+        for part in self.parts:
+            if stop <= position:
+                break
+            if start < position + len(part):
+                pieces.append(bytes(part[max(0, start - position):stop - position]))
+            position += len(part)
+        return b"".join(pieces)
+
+
+def _build_ts_segment(size: int, duration: float) -> bytes:
+    """
+    生成大约 size 字节、时长 duration 秒的 MPEG-TS 分片
+    
+    有 ffmpeg 时用测试图案编码一个真实的分片，这样下载器的 ffmpeg 合并流程可以完整运行；
+    否则退回到由空包组成的分片 (只能测试下载，不能合并)。
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        bitrate = max(64 * 1024, int(size * 8 / duration))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "segment.ts")
+            result = subprocess.run(
+                [ffmpeg, "-hide_banner", "-loglevel", "error",
+                 "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=25:duration={duration}",
+                 "-c:v", "mpeg2video", "-b:v", str(bitrate), "-minrate", str(bitrate),
+                 "-maxrate", str(bitrate), "-bufsize", str(bitrate),
+                 "-f", "mpegts", "-y", path],
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            if result.returncode == 0 and os.path.getsize(path) > 0:
+                with open(path, "rb") as f:
+                    return f.read()
+    
+    # 空包 (PID 0x1FFF)
+    null_packet = b"\x47\x1f\xff\x10" + b"\xff" * (TS_PACKET_SIZE - 4)
+    return null_packet * max(1, size // TS_PACKET_SIZE)
+
+
+class MockZhihuServer:
+    """模拟知乎 API 和 CDN 的本地 HTTP 服务器"""
+    
+    # HLS 分片时长 (秒)
+    SEGMENT_DURATION = 4.0
+    
+    # 内置课程 ID
+    SAMPLE_COURSE = "100"
+    BATCH_COURSE = "200"
+    
+    # 镜像节点的播放地址作为这些清晰度返回 (名称, 宽, 高)，镜像节点最多这么多个
+    MIRROR_QUALITIES = [("sd", 848, 480), ("ld", 640, 360)]
+    
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 mp4_size: int = 32 * 1024 * 1024,
+                 hls_segments: int = 32,
+                 segment_size: int = 1024 * 1024,
+                 batch_videos: int = 8,
+                 batch_video_size: int = 4 * 1024 * 1024,
+                 latency: float = 0.0,
+                 bandwidth: int = 0,
+                 rate_403: float = 0.0,
+                 rate_429: float = 0.0,
+                 drop_rate: float = 0.0,
+                 retry_after: int = 1,
+                 fault_api: bool = False,
+                 url_ttl: float = 0,
+                 seed: int = 0,
+                 mirrors: int = 0,
+                 mirror_bandwidth: int = 0):
+        """
+        Args:
+            host, port: 监听地址，port 为 0 时自动选择空闲端口
+            mp4_size: 课程 100 中 MP4 视频的大小
+            hls_segments: 课程 100 中 HLS 视频的分片数
+            segment_size: HLS 分片的大约大小
+            batch_videos: 课程 200 中的视频数
+            batch_video_size: 课程 200 中每个视频的大约大小
+            latency: 每个请求在响应前等待的秒数
+            bandwidth: 每个连接的带宽上限 (字节/秒)，0 表示不限制
+            rate_403, rate_429: 返回 403 / 429 的概率
+            drop_rate: 发送一半响应体后断开连接的概率
+            retry_after: 429 响应的 Retry-After 秒数
+            fault_api: 故障是否也注入到 API 请求 (默认只注入到 CDN 请求)
+            url_ttl: 播放地址的有效期 (秒)，0 表示地址不过期
+            seed: 故障注入的随机数种子，相同的种子产生相同的故障序列
+            mirrors: CDN 镜像节点数 (最多 len(MIRROR_QUALITIES) 个)，在同一地址的其他端口上监听
+            mirror_bandwidth: 第一个镜像节点每个连接的带宽上限，0 表示与 bandwidth 相同
+        """
+        if mirrors > len(self.MIRROR_QUALITIES):
+            raise ValueError(f"镜像节点最多 {len(self.MIRROR_QUALITIES)} 个")
+        
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.rate_403 = rate_403
+        self.rate_429 = rate_429
+        self.drop_rate = drop_rate
+        self.retry_after = retry_after
+        self.fault_api = fault_api
+        self.url_ttl = url_ttl
+        
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            "requests": 0, "bytes_sent": 0, "403": 0, "429": 0, "dropped": 0, "expired": 0,
+        }
+        # 各镜像节点发送的媒体字节数 (mirror1_bytes, mirror2_bytes, ...)
+        for index in range(1, mirrors + 1):
+            self.stats[f"mirror{index}_bytes"] = 0
+        
+        # 各节点 (0 为主服务器，1.. 为镜像节点) 单独的带宽上限，没有设置的节点使用 bandwidth
+        self.node_bandwidth: Dict[int, int] = {1: mirror_bandwidth} if mirrors and mirror_bandwidth else {}
+        
+        # 所有 HLS 分片内容相同 (大小以实际生成的分片为准)
+        self.segment_data = _build_ts_segment(segment_size, self.SEGMENT_DURATION)
+        segment_size = len(self.segment_data)
+        
+        # 视频、小节、课程
+        self.videos: Dict[str, MockVideo] = {}
+        self.sections: Dict[str, Tuple[str, str]] = {}
+        self.courses: Dict[str, List[str]] = {}
+        self._add_section(self.SAMPLE_COURSE, "1", MockVideo("mp4-main", "示例 MP4 视频", "mp4", mp4_size))
+        self._add_section(self.SAMPLE_COURSE, "2", MockVideo(
+            "hls-main", "示例 HLS 视频", "m3u8", hls_segments * segment_size, hls_segments
+        ))
+        self._add_section(self.SAMPLE_COURSE, "3", MockVideo(
+            "hls-aes", "示例加密 HLS 视频", "m3u8", hls_segments * segment_size, hls_segments,
+            encrypted=True
+        ))
+        batch_segments = max(1, batch_video_size // segment_size)
+        for index in range(1, batch_videos + 1):
+            if index % 2:
+                video = MockVideo(f"mp4-{index:03d}", f"批量视频 {index}", "mp4", batch_video_size)
+            else:
+                video = MockVideo(
+                    f"hls-{index:03d}", f"批量视频 {index}", "m3u8",
+                    batch_segments * segment_size, batch_segments
+                )
+            self._add_section(self.BATCH_COURSE, str(200000 + index), video)
+        
+        # 所有 MP4 的采样数据共用同一份数据的前缀
+        mp4_videos = [video for video in self.videos.values() if video.format == "mp4"]
+        self.mp4_data = _synthetic_bytes("mp4", max((video.size for video in mp4_videos), default=0))
+        self.mp4_files = {
+            video.video_id: _build_mp4(memoryview(self.mp4_data), video.size, video.duration)
+            for video in mp4_videos
+        }
+        
+        self._nodes = [
+            ThreadingHTTPServer((host, port if index == 0 else 0), self._make_handler(index))
+            for index in range(mirrors + 1)
+        ]
+        for httpd in self._nodes:
+            httpd.daemon_threads = True
+        self._httpd = self._nodes[0]
+        self._threads: List[threading.Thread] = []
+    
+    def _add_section(self, product_id: str, section_id: str, video: MockVideo):
+        self.videos[video.video_id] = video
+        self.sections[section_id] = (product_id, video.video_id)
+        self.courses.setdefault(product_id, []).append(section_id)
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    @property
+    def mirror_urls(self) -> List[str]:
+        """镜像节点的地址"""
+        return [
+            "http://{}:{}".format(*httpd.server_address[:2]) for httpd in self._nodes[1:]
+        ]
+    
+    def section_url(self, product_id: str, section_id: str) -> str:
+        """训练营视频页面 URL"""
+        return f"{self.base_url}/xen/market/training/training-video/{product_id}/{section_id}"
+    
+    def course_url(self, product_id: str) -> str:
+        """训练营课程 URL"""
+        return f"{self.base_url}/xen/market/training/{product_id}"
+    
+    def course_size(self, product_id: str) -> int:
+        """课程中所有视频的总字节数"""
+        return sum(
+            self.videos[self.sections[section_id][1]].size
+            for section_id in self.courses.get(product_id, [])
+        )
+    
+    def start(self) -> "MockZhihuServer":
+        """在后台线程中启动服务器 (包括镜像节点)"""
+        for httpd in self._nodes:
+            thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+    
+    def serve_forever(self):
+        """在后台线程中启动镜像节点，在当前线程中运行主服务器"""
+        for httpd in self._nodes[1:]:
+            thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._httpd.serve_forever()
+    
+    def stop(self):
+        for httpd in self._nodes:
+            httpd.shutdown()
+            httpd.server_close()
+    
+    def reset(self):
+        """重置故障注入的随机数序列和统计数据，让每次测试运行看到相同的故障"""
+        with self._random_lock:
+            self._random = random.Random(self.seed)
+        with self._stats_lock:
+            for key in self.stats:
+                self.stats[key] = 0
+    
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+    
+    def _roll(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._random_lock:
+            return self._random.random() < rate
+    
+    def _make_handler(self, node: int = 0):
+        server = self
+        
+        class Handler(_MockHandler):
+            mock = server
+            node_index = node
+        
+        return Handler
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    """请求处理: 按路径分发到 API / 页面 / CDN"""
+    
+    protocol_version = "HTTP/1.1"
+    mock: MockZhihuServer = None
+    
+    # 0 为主服务器，1.. 为镜像节点
+    node_index = 0
+    
+    ROUTES = [
+        (re.compile(r"^/api/v4/me$"), "_handle_me"),
+        (re.compile(r"^/(?:api/infinity|api/v4/market|infinity)/training/section/([^/]+)$"), "_handle_section"),
+        (re.compile(r"^/(?:api/infinity|infinity)/training/([^/]+)/catalog$"), "_handle_catalog"),
+        (re.compile(r"^/api/v4/market/training/([^/]+)/sections$"), "_handle_catalog"),
+        (re.compile(r"^/api/(?:v4/)?videos/([^/]+)$"), "_handle_video"),
+        (re.compile(r"^/xen/market/training/training-video/([^/]+)/([^/]+)$"), "_handle_page"),
+        (re.compile(r"^/cdn/hls/([^/]+)/index\.m3u8$"), "_handle_playlist"),
+        (re.compile(r"^/cdn/hls/([^/]+)/(\d+)\.ts$"), "_handle_segment"),
+        (re.compile(r"^/cdn/hls/([^/]+)/key(\d)\.bin$"), "_handle_key"),
+        (re.compile(r"^/cdn/mp4/([^/]+)\.mp4$"), "_handle_mp4"),
+    ]
+    
+    def do_GET(self):
+        self._dispatch()
+    
+    def do_HEAD(self):
+        self._dispatch()
+    
+    def log_message(self, *args):
+        pass
+    
+    def _dispatch(self):
+        mock = self.mock
+        mock._count("requests")
+        parsed = urlparse(self.path)
+        path = parsed.path
+        
+        if mock.latency > 0:
+            time.sleep(mock.latency)
+        
+        is_cdn = path.startswith("/cdn/")
+        expires = parse_qs(parsed.query).get("expires")
+        if is_cdn and expires and expires[0].isdigit() and int(expires[0]) < time.time():
+            mock._count("expired")
+            self._send_json({"error": {"message": "signature expired"}}, 403)
+            return
+        
+        if is_cdn or mock.fault_api:
+            if mock._roll(mock.rate_403):
+                mock._count("403")
+                self._send_json({"error": {"message": "forbidden"}}, 403)
+                return
+            if mock._roll(mock.rate_429):
+                mock._count("429")
+                self._send_json(
+                    {"error": {"message": "too many requests"}}, 429,
+                    {"Retry-After": str(mock.retry_after)}
+                )
+                return
+        
+        for pattern, name in self.ROUTES:
+            match = pattern.match(path)
+            if match:
+                getattr(self, name)(*match.groups())
+                return
+        self._send_json({"error": {"message": "not found"}}, 404)
+    
+    # ---- 响应 ----
+    
+    def _send(self, status: int, body: bytes, content_type: str,
+              headers: Optional[Dict[str, str]] = None, media: bool = False):
+        """发送响应；media 为 True 时应用带宽限制和断开连接故障"""
+        mock = self.mock
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        
+        drop = (media or mock.fault_api) and len(body) > 1 and mock._roll(mock.drop_rate)
+        if drop:
+            mock._count("dropped")
+            body = body[:len(body) // 2]
+            self.close_connection = True
+        
+        bandwidth = mock.node_bandwidth.get(self.node_index, mock.bandwidth)
+        if bandwidth > 0 and media:
+            start = time.monotonic()
+            sent = 0
+            view = memoryview(body)
+            while sent < len(body):
+                chunk = view[sent:sent + WRITE_CHUNK_SIZE]
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                delay = sent / bandwidth - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+        else:
+            self.wfile.write(body)
+        mock._count("bytes_sent", len(body))
+        if media and self.node_index:
+            mock._count(f"mirror{self.node_index}_bytes", len(body))
+    
+    def _send_json(self, data, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+    
+    def _send_media(self, data, content_type: str, size: Optional[int] = None):
+        """发送媒体数据，支持单个 Range 请求"""
+        size = len(data) if size is None else size
+        range_header = self.headers.get("Range")
+        if not range_header:
+            self._send(200, bytes(data[:size]), content_type, {"Accept-Ranges": "bytes"}, media=True)
+            return
+        
+        match = _RANGE_PATTERN.match(range_header.strip())
+        if not match or not (match.group(1) or match.group(2)):
+            self._send(416, b"", content_type, {"Content-Range": f"bytes */{size}"})
+            return
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start = max(0, size - int(match.group(2)))
+            end = size - 1
+        if start >= size or start > end:
+            self._send(416, b"", content_type, {"Content-Range": f"bytes */{size}"})
+            return
+        
+        self._send(
+            206, bytes(data[start:end + 1]), content_type,
+            {"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{size}"},
+            media=True
+        )
+    
+    # ---- API ----
+    
+    def _handle_me(self):
+        self._send_json({"id": "mock-user", "name": "mock"})
+    
+    def _section_payload(self, section_id: str) -> Optional[dict]:
+        if section_id not in self.mock.sections:
+            return None
+        video = self.mock.videos[self.mock.sections[section_id][1]]
+        return {
+            "id": section_id,
+            "title": video.title,
+            "resource": {
+                "type": "video",
+                "data": {"id": video.video_id, "duration": round(video.duration)},
+            },
+        }
+    
+    def _handle_section(self, section_id: str):
+        payload = self._section_payload(section_id)
+        if payload is None:
+            self._send_json({"error": {"message": "section not found"}}, 404)
+            return
+        self._send_json(payload)
+    
+    def _handle_catalog(self, product_id: str):
+        section_ids = self.mock.courses.get(product_id)
+        if section_ids is None:
+            self._send_json({"error": {"message": "course not found"}}, 404)
+            return
+        # 目录中不带视频资源，下载器需要逐个请求小节 API 解析视频 ID
+        self._send_json({
+            "data": [
+                {"section_id": section_id, "title": self.mock.videos[self.mock.sections[section_id][1]].title}
+                for section_id in section_ids
+            ],
+            "paging": {"is_end": True},
+        })
+    
+    def _handle_video(self, video_id: str):
+        video = self.mock.videos.get(video_id)
+        if video is None:
+            self._send_json({"error": {"message": "video not found"}}, 404)
+            return
+        
+        base_url = f"http://{self.headers.get('Host')}"
+        if video.format == "m3u8":
+            play_url = f"{base_url}/cdn/hls/{video.video_id}/index.m3u8"
+        else:
+            play_url = f"{base_url}/cdn/mp4/{video.video_id}.mp4"
+        if self.mock.url_ttl:
+            play_url += f"?expires={int(time.time() + self.mock.url_ttl)}"
+        playlist = {
+            "hd": {
+                "play_url": play_url, "format": video.format,
+                "width": 1280, "height": 720, "size": video.size,
+            },
+        }
+        # 镜像节点提供相同的内容，作为较低清晰度返回
+        for mirror_url, (quality, width, height) in zip(self.mock.mirror_urls, MockZhihuServer.MIRROR_QUALITIES):
+            playlist[quality] = {
+                "play_url": play_url.replace(base_url, mirror_url, 1), "format": video.format,
+                "width": width, "height": height, "size": video.size,
+            }
+        self._send_json({
+            "id": video.video_id,
+            "title": video.title,
+            "duration": int(video.duration * 1000),
+            "playlist": playlist,
+        })
+    
+    def _handle_page(self, product_id: str, section_id: str):
+        payload = self._section_payload(section_id)
+        if payload is None:
+            self._send(404, b"<html><body>404</body></html>", "text/html; charset=utf-8")
+            return
+        state = {
+            "initialState": {
+                "__connectedAutoFetch": {
+                    "trainingVideo": {
+                        "data": {"title": payload["title"], "videoInfo": payload},
+                        "error": None,
+                    }
+                }
+            }
+        }
+        html = (
+            "<!doctype html><html><head><title>知乎</title></head><body>"
+            '<div id="root"></div>'
+            '<script id="js-initialData" type="text/json">'
+            + json.dumps(state, ensure_ascii=False)
+            + "</script></body></html>"
+        )
+        self._send(200, html.encode("utf-8"), "text/html; charset=utf-8")
+    
+    # ---- CDN ----
+    
+    def _handle_playlist(self, video_id: str):
+        video = self.mock.videos.get(video_id)
+        if video is None or video.format != "m3u8":
+            self._send(404, b"", "text/plain")
+            return
+        duration = MockZhihuServer.SEGMENT_DURATION
+        lines = [
+            "#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{int(duration)}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        # 分片地址使用与播放列表地址相同的签名
+        query = urlparse(self.path).query
+        suffix = f"?{query}" if query else ""
+        for index in range(video.segments):
+            if video.encrypted and index in (0, video.segments // 2):
+                number, iv = _segment_encryption(video, index)
+                key_line = f'#EXT-X-KEY:METHOD=AES-128,URI="key{number}.bin{suffix}"'
+                lines.append(key_line + (f",IV=0x{iv.hex()}" if number else ""))
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(f"{index}.ts?{query}" if query else f"{index}.ts")
+        lines.append("#EXT-X-ENDLIST")
+        self._send(200, ("\n".join(lines) + "\n").encode(), "application/vnd.apple.mpegurl")
+    
+    def _handle_segment(self, video_id: str, index: str):
+        video = self.mock.videos.get(video_id)
+        if video is None or video.format != "m3u8" or int(index) >= video.segments:
+            self._send(404, b"", "text/plain")
+            return
+        data = self.mock.segment_data
+        if video.encrypted:
+            number, iv = _segment_encryption(video, int(index))
+            data = _encrypt_segment(data, _hls_key(video_id, number), iv)
+        self._send_media(data, "video/mp2t")
+    
+    def _handle_key(self, video_id: str, number: str):
+        video = self.mock.videos.get(video_id)
+        if video is None or not video.encrypted or int(number) > 1:
+            self._send(404, b"", "text/plain")
+            return
+        self._send(200, _hls_key(video_id, int(number)), "application/octet-stream")
+    
+    def _handle_mp4(self, video_id: str):
+        video = self.mock.videos.get(video_id)
+        if video is None or video.format != "mp4":
+            self._send(404, b"", "text/plain")
+            return
+        self._send_media(self.mock.mp4_files[video_id], "video/mp4")
+
+
+def point_downloader_at(downloader, base_url: str):
+    """让下载器实例的所有 API 端点指向模拟服务器 (CDN 地址由 Lens API 返回)"""
+    downloader.LENS_VIDEO_APIS = [base_url + "/api/v4/videos/{video_id}"]
+    downloader.TRAINING_SECTION_APIS = [base_url + "/api/infinity/training/section/{section_id}"]
+    downloader.TRAINING_CATALOG_APIS = [base_url + "/api/infinity/training/{product_id}/catalog"]
+    downloader.cookies.COOKIE_CHECK_URL = base_url + "/api/v4/me"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟知乎 / CDN 服务器")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8900, help="监听端口 (默认: 8900)")
+    parser.add_argument("--mp4-size", type=parse_size, default="32M", help="MP4 视频大小 (默认: 32M)")
+    parser.add_argument("--hls-segments", type=int, default=32, help="HLS 视频分片数 (默认: 32)")
+    parser.add_argument("--segment-size", type=parse_size, default="1M", help="HLS 分片大小 (默认: 1M)")
+    parser.add_argument("--batch-videos", type=int, default=8, help="批量课程的视频数 (默认: 8)")
+    parser.add_argument("--batch-video-size", type=parse_size, default="4M",
+                        help="批量课程中每个视频的大小 (默认: 4M)")
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的延迟，毫秒 (默认: 0)")
+    parser.add_argument("--bandwidth", type=parse_size, default="0",
+                        help="每个连接的带宽上限，字节/秒，如 10M (默认: 不限制)")
+    parser.add_argument("--rate-403", type=float, default=0, help="返回 403 的概率 (默认: 0)")
+    parser.add_argument("--rate-429", type=float, default=0, help="返回 429 的概率 (默认: 0)")
+    parser.add_argument("--drop-rate", type=float, default=0, help="中途断开连接的概率 (默认: 0)")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After 秒数 (默认: 1)")
+    parser.add_argument("--fault-api", action="store_true", help="故障也注入到 API 请求")
+    parser.add_argument("--url-ttl", type=float, default=0, help="播放地址的有效期，秒 (默认: 不过期)")
+    parser.add_argument("--seed", type=int, default=0, help="故障注入的随机数种子 (默认: 0)")
+    parser.add_argument("--mirrors", type=int, default=0,
+                        help=f"CDN 镜像节点数，最多 {len(MockZhihuServer.MIRROR_QUALITIES)} 个 (默认: 0)")
+    parser.add_argument("--mirror-bandwidth", type=parse_size, default="0",
+                        help="第一个镜像节点每个连接的带宽上限，如 1M (默认: 与 --bandwidth 相同)")
+    args = parser.parse_args()
+    
+    server = MockZhihuServer(
+        args.host, args.port, args.mp4_size, args.hls_segments, args.segment_size,
+        args.batch_videos, args.batch_video_size, args.latency_ms / 1000, args.bandwidth,
+        args.rate_403, args.rate_429, args.drop_rate, args.retry_after, args.fault_api,
+        args.url_ttl, args.seed, args.mirrors, args.mirror_bandwidth
+    )
+    print(f"✓ 模拟服务器已启动: {server.base_url}")
+    for mirror_url in server.mirror_urls:
+        print(f"  CDN 镜像节点: {mirror_url}")
+    print(f"  MP4 视频: {server.section_url(server.SAMPLE_COURSE, '1')}")
+    print(f"  HLS 视频: {server.section_url(server.SAMPLE_COURSE, '2')}")
+    print(f"  加密 HLS 视频: {server.section_url(server.SAMPLE_COURSE, '3')}")
+    print(f"  批量课程: {server.course_url(server.BATCH_COURSE)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
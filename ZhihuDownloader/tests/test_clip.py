@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+片段下载 (--start / --end) 的测试: 时间解析和格式化、M3U8 覆盖分片的计算，
+以及从一个手工构造的小 moov 计算片段需要的 MP4 字节范围
+
+使用方法:
+    python -m pytest tests/test_clip.py
+    python tests/test_clip.py
+"""
+
+import os
+import sys
+import struct
+import argparse
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zhihu_downloader import (  # noqa: E402
+    ClipRange, Mp4Track, _covering_segments, _format_clip_time, _mp4_clip_ranges,
+    _parse_clip_time, _parse_mp4_tracks,
+)
+
+
+def box(box_type: bytes, *payloads: bytes) -> bytes:
+    payload = b"".join(payloads)
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type: bytes, fmt: str, *values, version: int = 0) -> bytes:
+    return box(box_type, struct.pack(">B3x" + fmt, version, *values))
+
+
+def table(box_type: bytes, entries, fmt: str = "I") -> bytes:
+    """条目数 + 条目形式的 full box (entries 为元组列表)"""
+    values = [value for entry in entries for value in entry]
+    return full_box(box_type, f"I{len(values)}{fmt}", len(entries), *values)
+
+
+def track(handler: bytes, mdhd: bytes, *tables: bytes) -> bytes:
+    return box(
+        b"trak",
+        box(
+            b"mdia",
+            mdhd,
+            full_box(b"hdlr", "I4s12x", 0, handler),
+            box(b"minf", box(b"stbl", *tables)),
+        ),
+    )
+
+
+# 视频: 10 个 1 秒的采样，每个 chunk 2 个采样，采样 1、5、9 是关键帧 (0、4、8 秒)
+VIDEO_SIZES = [100, 110, 120, 130, 140, 150, 160, 170, 180, 190]
+VIDEO_TRAK = track(
+    b"vide",
+    full_box(b"mdhd", "IIIIHH", 0, 0, 1000, 10000, 0, 0),
+    table(b"stts", [(10, 1000)]),
+    table(b"stsc", [(1, 2, 1)]),
+    full_box(b"stsz", "II10I", 0, 10, *VIDEO_SIZES),
+    table(b"stco", [(1000,), (2000,), (3000,), (4000,), (5000,)]),
+    table(b"stss", [(1,), (5,), (9,)]),
+)
+
+# 音频: mdhd 版本 1 (64 位时间字段)，10 个 1 秒、50 字节的采样，
+# 前两个 chunk 各 4 个采样，最后一个 chunk 2 个采样，偏移为 co64
+AUDIO_TRAK = track(
+    b"soun",
+    full_box(b"mdhd", "QQIQHH", 0, 0, 1000, 10000, 0, 0, version=1),
+    table(b"stts", [(10, 1000)]),
+    table(b"stsc", [(1, 4, 1), (3, 2, 1)]),
+    full_box(b"stsz", "II", 50, 10),
+    table(b"co64", [(1500,), (2500,), (3500,)], "Q"),
+)
+
+MOOV = box(b"moov", full_box(b"mvhd", "II", 0, 0), VIDEO_TRAK, AUDIO_TRAK)
+
+VIDEO_CHUNKS = [
+    (0.0, 2.0, 1000, 210),
+    (2.0, 4.0, 2000, 250),
+    (4.0, 6.0, 3000, 290),
+    (6.0, 8.0, 4000, 330),
+    (8.0, 10.0, 5000, 370),
+]
+AUDIO_CHUNKS = [
+    (0.0, 4.0, 1500, 200),
+    (4.0, 8.0, 2500, 200),
+    (8.0, 10.0, 3500, 100),
+]
+
+
+class ClipTimeTest(unittest.TestCase):
+
+    def test_parse(self):
+        for value, seconds in [
+            ("90", 90.0), ("1:30", 90.0), ("10:00", 600.0), ("1:02:03.5", 3723.5),
+            (" 0:05 ", 5.0), ("0", 0.0),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(_parse_clip_time(value), seconds)
+    
+    def test_parse_invalid(self):
+        for value in ["", "abc", "-5", "1:60", "1::30", "1:2:3:4", "1:-30"]:
+            with self.subTest(value=value):
+                with self.assertRaises(argparse.ArgumentTypeError):
+                    _parse_clip_time(value)
+    
+    def test_format(self):
+        for seconds, text in [
+            (0, "00m00s"), (90, "01m30s"), (330.5, "05m30.5s"), (3723, "1h02m03s"),
+            (3723.5, "1h02m03.5s"),
+            # 先舍入到 0.1 秒，不会出现 60 秒或 60 分钟
+            (59.96, "01m00s"), (3599.97, "1h00m00s"),
+        ]:
+            with self.subTest(seconds=seconds):
+                self.assertEqual(_format_clip_time(seconds), text)
+    
+    def test_label(self):
+        self.assertEqual(ClipRange(600, 900).label, "10m00s-15m00s")
+        self.assertEqual(ClipRange(_parse_clip_time("1:02:03.5")).label, "1h02m03.5s-end")
+    
+    def test_ffmpeg_args(self):
+        clip = ClipRange(12.5, 20.0)
+        self.assertEqual(clip.seek_args(0.5), ["-ss", "0.500"])
+        self.assertEqual(clip.seek_args(0.0), [])
+        self.assertEqual(clip.length_args(), ["-t", "7.500"])
+        self.assertEqual(ClipRange(12.5).length_args(), [])
+    
+    def test_duration(self):
+        self.assertEqual(ClipRange(10, 30).duration(100), 20.0)
+        self.assertEqual(ClipRange(10, 300).duration(100), 90.0)
+        self.assertEqual(ClipRange(10).duration(100), 90.0)
+        self.assertEqual(ClipRange(10).duration(0), 0.0)
+        self.assertEqual(ClipRange(200).duration(100), 0.0)
+
+
+class CoveringSegmentsTest(unittest.TestCase):
+
+    DURATIONS = [4.0, 4.0, 4.0, 4.0, 2.5]
+    
+    def test_whole_playlist(self):
+        self.assertEqual(_covering_segments(self.DURATIONS, 0.0, None), (0, 5, 0.0))
+    
+    def test_inside_segments(self):
+        self.assertEqual(_covering_segments(self.DURATIONS, 5.0, 9.0), (1, 3, 1.0))
+    
+    def test_on_segment_boundaries(self):
+        # 结束时间正好是分片开始时不需要这个分片
+        self.assertEqual(_covering_segments(self.DURATIONS, 8.0, 12.0), (2, 3, 0.0))
+    
+    def test_end_after_last_segment(self):
+        self.assertEqual(_covering_segments(self.DURATIONS, 15.0, 100.0), (3, 5, 3.0))
+    
+    def test_start_after_last_segment(self):
+        self.assertEqual(_covering_segments(self.DURATIONS, 18.5, None), (5, 5, 0.0))
+
+
+class Mp4ClipRangesTest(unittest.TestCase):
+
+    def test_parse_tracks(self):
+        video, audio = _parse_mp4_tracks(MOOV)
+        self.assertTrue(video.is_video)
+        self.assertEqual(video.chunks, VIDEO_CHUNKS)
+        self.assertEqual(video.sync_times, [0.0, 4.0, 8.0])
+        self.assertFalse(audio.is_video)
+        self.assertEqual(audio.chunks, AUDIO_CHUNKS)
+        self.assertIsNone(audio.sync_times)
+    
+    def test_invalid_moov(self):
+        with self.assertRaises(ValueError):
+            _parse_mp4_tracks(box(b"free", MOOV[8:]))
+        with self.assertRaises(ValueError):
+            _parse_mp4_tracks(MOOV[:len(MOOV) // 2])
+        # 没有采样表 (分段 MP4)
+        with self.assertRaises(ValueError):
+            _parse_mp4_tracks(box(b"moov", full_box(b"mvhd", "II", 0, 0)))
+    
+    def test_ranges_from_previous_keyframe(self):
+        tracks = _parse_mp4_tracks(MOOV)
+        # 5 秒之前的关键帧在 4 秒；每个轨道的第一个 chunk 总是包含在内
+        self.assertEqual(sorted(_mp4_clip_ranges(tracks, 5.0, 6.5, 0.0)), [
+            (1000, 1209), (1500, 1699), (2500, 2699), (3000, 3289), (4000, 4329),
+        ])
+    
+    def test_ranges_with_margin(self):
+        tracks = _parse_mp4_tracks(MOOV)
+        self.assertEqual(sorted(_mp4_clip_ranges(tracks, 4.0, 6.0, 1.0)), [
+            (1000, 1209), (1500, 1699), (2000, 2249), (2500, 2699), (3000, 3289), (4000, 4329),
+        ])
+    
+    def test_ranges_to_end(self):
+        tracks = _parse_mp4_tracks(MOOV)
+        self.assertEqual(sorted(_mp4_clip_ranges(tracks, 9.0, None, 0.0)), [
+            (1000, 1209), (1500, 1699), (3500, 3599), (5000, 5369),
+        ])
+    
+    def test_all_samples_are_keyframes(self):
+        # 没有 stss 时从片段开始时间算起
+        tracks = [Mp4Track(True, VIDEO_CHUNKS)]
+        self.assertEqual(sorted(_mp4_clip_ranges(tracks, 5.0, 5.5, 0.0)), [
+            (1000, 1209), (3000, 3289),
+        ])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+API 端点优先顺序 (EndpointPreference) 的测试
+
+使用方法:
+    python -m pytest tests/test_endpoint_preference.py
+    python tests/test_endpoint_preference.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zhihu_downloader import EndpointPreference, MetadataCache  # noqa: E402
+
+
+LENS = [
+    "https://lens.zhihu.com/api/v4/videos/{video_id}",
+    "https://lens.zhihu.com/api/videos/{video_id}",
+]
+SECTION = [
+    "https://www.zhihu.com/api/infinity/training/section/{section_id}",
+    "https://www.zhihu.com/api/v4/market/training/section/{section_id}",
+    "https://api.zhihu.com/infinity/training/section/{section_id}",
+]
+CATALOG = [
+    "https://www.zhihu.com/api/infinity/training/{product_id}/catalog",
+    "https://api.zhihu.com/infinity/training/{product_id}/catalog",
+]
+
+
+class EndpointPreferenceTest(unittest.TestCase):
+
+    def test_original_order_without_history(self):
+        self.assertEqual(EndpointPreference().order(SECTION), SECTION)
+    
+    def test_winner_on_same_host_first(self):
+        preference = EndpointPreference()
+        preference.record(LENS[1])
+        self.assertEqual(preference.order(LENS), [LENS[1], LENS[0]])
+    
+    def test_most_recent_winner_on_host(self):
+        preference = EndpointPreference()
+        preference.record(LENS[1])
+        preference.record(LENS[0])
+        self.assertEqual(preference.order(LENS), LENS)
+    
+    def test_groups_on_same_host_keep_their_winner(self):
+        preference = EndpointPreference()
+        preference.record(SECTION[1])
+        # 目录 API 也在 www.zhihu.com，不能覆盖小节 API 的记录
+        preference.record(CATALOG[0])
+        self.assertEqual(preference.order(SECTION), [SECTION[1], SECTION[0], SECTION[2]])
+    
+    def test_recent_host_first_across_groups(self):
+        preference = EndpointPreference()
+        preference.record(CATALOG[1])
+        self.assertEqual(preference.order(SECTION), [SECTION[2], SECTION[0], SECTION[1]])
+    
+    def test_persisted_in_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = MetadataCache(cache_dir)
+            EndpointPreference(cache).record(LENS[1])
+            self.assertEqual(EndpointPreference(cache).order(LENS), [LENS[1], LENS[0]])
+    
+    def test_ignores_invalid_cache_entry(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = MetadataCache(cache_dir)
+            cache.set("endpoint_host:lens.zhihu.com", 123.0, MetadataCache.PAGE_TTL)
+            self.assertEqual(EndpointPreference(cache).order(LENS), LENS)
+
+
+if __name__ == "__main__":
+    unittest.main()
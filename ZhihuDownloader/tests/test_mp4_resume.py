@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+MP4 断点续传的测试
+
+使用 benchmarks/mock_zhihu_server.py 的本地模拟服务器 (不访问网络)：下载到一半时取消，
+再次运行同一下载，检查第二次只请求缺失的部分，且输出文件与服务器上的文件完全一致。
+同步下载器和异步下载器 (需要 aiohttp) 都会测试。
+
+使用方法:
+    python -m pytest tests/test_mp4_resume.py
+    python tests/test_mp4_resume.py
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+import threading
+import unittest
+import contextlib
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+sys.path.insert(0, os.path.join(PACKAGE_DIR, "benchmarks"))
+
+from zhihu_downloader import ZhihuVideoDownloader  # noqa: E402
+from mock_zhihu_server import MockZhihuServer, point_downloader_at  # noqa: E402
+
+try:
+    from zhihu_async_downloader import AsyncZhihuVideoDownloader
+except SystemExit:
+    # 没有安装 aiohttp
+    AsyncZhihuVideoDownloader = None
+
+
+# 模拟 MP4 视频的大小，以及每个连接的带宽上限 (取消时还远没有下载完)
+MP4_SIZE = 8 * 1024 * 1024
+BANDWIDTH = 4 * 1024 * 1024
+
+# 已下载这么多字节后取消第一次下载
+CANCEL_AFTER = 2 * 1024 * 1024
+
+
+class Mp4ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockZhihuServer(mp4_size=MP4_SIZE, bandwidth=BANDWIDTH).start()
+        self.addCleanup(self.server.stop)
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.output_dir = self._tmp.name
+        self.url = self.server.section_url(MockZhihuServer.SAMPLE_COURSE, "1")
+        data = self.server.mp4_files["mp4-main"]
+        self.expected = bytes(data[:len(data)])
+    
+    def _downloader(self, connections: int) -> ZhihuVideoDownloader:
+        downloader = ZhihuVideoDownloader(
+            use_chrome_cookies=False, resume=True, mp4_connections=connections
+        )
+        point_downloader_at(downloader, self.server.base_url)
+        return downloader
+    
+    def _download_async(self, connections: int, progress_callback=None, cancel_event=None):
+        """用异步下载器下载，返回 (输出文件路径, 接收的字节数)"""
+        received = 0
+        
+        async def download():
+            nonlocal received
+            async with AsyncZhihuVideoDownloader(
+                use_chrome_cookies=False, resume=True, mp4_connections=connections
+            ) as downloader:
+                point_downloader_at(downloader, self.server.base_url)
+                
+                # 统计接收的响应字节数
+                read_blocks = downloader._read_blocks
+                
+                async def counting_read_blocks(response):
+                    nonlocal received
+                    async for block in read_blocks(response):
+                        received += len(block)
+                        yield block
+                
+                downloader._read_blocks = counting_read_blocks
+                return await downloader.download_video(
+                    self.url, self.output_dir, progress_callback=progress_callback,
+                    cancel_event=cancel_event
+                )
+        
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            path = asyncio.run(download())
+        return path, received
+    
+    def _cancel_then_resume(self, connections: int):
+        cancel_event = threading.Event()
+        
+        def on_progress(event):
+            if event.bytes_done >= CANCEL_AFTER:
+                cancel_event.set()
+        
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            first = self._downloader(connections).download_video(
+                self.url, self.output_dir, progress_callback=on_progress,
+                cancel_event=cancel_event
+            )
+        self.assertIsNone(first)
+        self.assertTrue(any(name.endswith(".manifest.json") for name in os.listdir(self.output_dir)))
+        
+        downloader = self._downloader(connections)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            path = downloader.download_video(self.url, self.output_dir)
+        self.assertIsNotNone(path)
+        
+        # 第二次只下载缺失的部分 (另外只有 API 响应和 1 字节的探测请求)
+        hosts = downloader.metrics.snapshot()["hosts"].values()
+        received = sum(host["bytes"] for host in hosts)
+        self.assertLess(received, MP4_SIZE - CANCEL_AFTER // 2)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.expected)
+        self.assertEqual(sorted(os.listdir(self.output_dir)), [os.path.basename(path)])
+    
+    def test_resume_single_connection(self):
+        self._cancel_then_resume(1)
+    
+    def test_resume_multiple_connections(self):
+        self._cancel_then_resume(4)
+    
+    @unittest.skipIf(AsyncZhihuVideoDownloader is None, "需要 aiohttp")
+    def test_async_resume_single_connection(self):
+        cancel_event = threading.Event()
+        
+        def on_progress(event):
+            if event.bytes_done >= CANCEL_AFTER:
+                cancel_event.set()
+        
+        first, _ = self._download_async(1, on_progress, cancel_event)
+        self.assertIsNone(first)
+        
+        path, received = self._download_async(1)
+        self.assertIsNotNone(path)
+        self.assertLess(received, MP4_SIZE - CANCEL_AFTER // 2)
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), self.expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+AES-128 加密分片的 IV 计算 (_segment_key_ivs) 和流式解密 (SegmentDecryptor) 的测试
+
+密文是固定的测试向量 (NIST SP 800-38A 的 CBC-AES128 向量，以及用 PKCS7 填充加密的分片)，
+解密结果必须与 ffmpeg 解密后读取的数据逐字节相同。
+
+使用方法:
+    python -m pytest tests/test_segment_decryption.py
+    python tests/test_segment_decryption.py
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zhihu_downloader import SegmentDecryptor, _load_aes_cbc, _segment_key_ivs  # noqa: E402
+
+try:
+    import m3u8
+except ImportError:
+    m3u8 = None
+
+try:
+    new_decryptor = _load_aes_cbc()
+except ValueError:
+    # 没有安装 AES 解密库
+    new_decryptor = None
+
+
+PLAYLIST_URL = "https://vdn.example.com/video/index.m3u8"
+
+# NIST SP 800-38A F.2.1 (CBC-AES128.Decrypt)
+NIST_KEY = bytes.fromhex("2b7e151628aed2a6abf7158809cf4f3c")
+NIST_IV = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+NIST_CIPHERTEXT = bytes.fromhex(
+    "7649abac8119b246cee98e9b12e9197d"
+    "5086cb9b507219ee95db113a917678b2"
+    "73bed6b8e3c1743b7116e69e22229516"
+    "3ff1caa1681fac09120eca307586e1a7"
+)
+NIST_PLAINTEXT = bytes.fromhex(
+    "6bc1bee22e409f96e93d7e117393172a"
+    "ae2d8a571e03ac9c9eb76fac45af8e51"
+    "30c81c46a35ce411e5fbc1191a0a52ef"
+    "f69f2445df4f9b17ad2b417be66c3710"
+)
+
+# 媒体序号为 7 的分片 (没有指定 IV)，明文 40 字节，PKCS7 填充 8 字节
+SEGMENT_IV = (7).to_bytes(16, "big")
+SEGMENT_PLAINTEXT = bytes.fromhex(
+    "474000107a68696875207365676d656e74207061796c6f6164000102030405060708090a0b0c0d0e"
+)
+SEGMENT_CIPHERTEXT = bytes.fromhex(
+    "937bf33d6fb0432b018e856416595d4f"
+    "64b081ccdc713c3a168cec81eefbd206"
+    "3734c06651b03209354743f6c460e0ae"
+)
+
+
+def playlist(*lines: str) -> "m3u8.M3U8":
+    """由 #EXTM3U 之后的各行构造播放列表"""
+    return m3u8.loads("\n".join(("#EXTM3U",) + lines) + "\n", uri=PLAYLIST_URL)
+
+
+@unittest.skipIf(m3u8 is None, "需要 m3u8")
+class SegmentKeyIvsTest(unittest.TestCase):
+
+    def test_explicit_iv(self):
+        key_ivs = _segment_key_ivs(playlist(
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x000102030405060708090A0B0C0D0E0F',
+            "#EXTINF:4,", "0.ts",
+            "#EXTINF:4,", "1.ts",
+        ))
+        key_uri = "https://vdn.example.com/video/key.bin"
+        # 指定了 IV 时所有分片都使用它，不随媒体序号变化
+        self.assertEqual(key_ivs, [(key_uri, NIST_IV), (key_uri, NIST_IV)])
+    
+    def test_short_explicit_iv_is_zero_padded(self):
+        key_ivs = _segment_key_ivs(playlist(
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x7',
+            "#EXTINF:4,", "0.ts",
+        ))
+        self.assertEqual(key_ivs[0][1], SEGMENT_IV)
+    
+    def test_invalid_iv(self):
+        with self.assertRaises(ValueError):
+            _segment_key_ivs(playlist(
+                '#EXT-X-KEY:METHOD=AES-128,URI="key.bin",IV=0x' + "00" * 17,
+                "#EXTINF:4,", "0.ts",
+            ))
+    
+    def test_media_sequence_fallback(self):
+        key_ivs = _segment_key_ivs(playlist(
+            "#EXT-X-MEDIA-SEQUENCE:7",
+            '#EXT-X-KEY:METHOD=AES-128,URI="key1.bin"',
+            "#EXTINF:4,", "7.ts",
+            "#EXTINF:4,", "8.ts",
+            '#EXT-X-KEY:METHOD=AES-128,URI="key2.bin"',
+            "#EXTINF:4,", "9.ts",
+        ))
+        base = "https://vdn.example.com/video/"
+        self.assertEqual(key_ivs, [
+            (base + "key1.bin", (7).to_bytes(16, "big")),
+            (base + "key1.bin", (8).to_bytes(16, "big")),
+            (base + "key2.bin", (9).to_bytes(16, "big")),
+        ])
+    
+    def test_media_sequence_defaults_to_zero(self):
+        key_ivs = _segment_key_ivs(playlist(
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"',
+            "#EXTINF:4,", "0.ts",
+            "#EXTINF:4,", "1.ts",
+        ))
+        self.assertEqual([iv for _, iv in key_ivs], [bytes(16), (1).to_bytes(16, "big")])
+    
+    def test_selected_segments_keep_their_sequence_number(self):
+        key_ivs = _segment_key_ivs(playlist(
+            "#EXT-X-MEDIA-SEQUENCE:100",
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"',
+            "#EXTINF:4,", "100.ts",
+            "#EXTINF:4,", "101.ts",
+            "#EXTINF:4,", "102.ts",
+        ), selected=range(1, 2))
+        self.assertIsNone(key_ivs[0])
+        self.assertEqual(key_ivs[1][1], (101).to_bytes(16, "big"))
+        self.assertIsNone(key_ivs[2])
+    
+    def test_unencrypted_segments(self):
+        key_ivs = _segment_key_ivs(playlist(
+            "#EXTINF:4,", "0.ts",
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"',
+            "#EXTINF:4,", "1.ts",
+            "#EXT-X-KEY:METHOD=NONE",
+            "#EXTINF:4,", "2.ts",
+        ))
+        self.assertIsNone(key_ivs[0])
+        self.assertEqual(key_ivs[1][1], (1).to_bytes(16, "big"))
+        self.assertIsNone(key_ivs[2])
+    
+    def test_sample_aes_not_supported(self):
+        with self.assertRaises(ValueError):
+            _segment_key_ivs(playlist(
+                '#EXT-X-KEY:METHOD=SAMPLE-AES,URI="key.bin"',
+                "#EXTINF:4,", "0.ts",
+            ))
+
+
+@unittest.skipIf(new_decryptor is None, "需要 cryptography 或 pycryptodome")
+class SegmentDecryptorTest(unittest.TestCase):
+
+    def _decrypt_in_chunks(self, decryptor: SegmentDecryptor, data: bytes, chunk_size: int) -> bytes:
+        output = b""
+        for start in range(0, len(data), chunk_size):
+            output += decryptor.update(data[start:start + chunk_size])
+        return output
+    
+    def test_nist_vector_in_chunks(self):
+        for chunk_size in (1, 5, 16, 17, 31, 64):
+            with self.subTest(chunk_size=chunk_size):
+                decryptor = SegmentDecryptor(new_decryptor, NIST_KEY, NIST_IV)
+                output = self._decrypt_in_chunks(decryptor, NIST_CIPHERTEXT, chunk_size)
+                # 最后一个块留到 finalize (可能包含填充)
+                self.assertEqual(output, NIST_PLAINTEXT[:-16])
+    
+    def test_padded_segment_in_chunks(self):
+        for chunk_size in (1, 3, 15, 16, 33, 48, 1024):
+            with self.subTest(chunk_size=chunk_size):
+                decryptor = SegmentDecryptor(new_decryptor, NIST_KEY, SEGMENT_IV)
+                output = self._decrypt_in_chunks(decryptor, SEGMENT_CIPHERTEXT, chunk_size)
+                output += decryptor.finalize()
+                self.assertEqual(output, SEGMENT_PLAINTEXT)
+    
+    def test_decrypt_whole_segment(self):
+        decryptor = SegmentDecryptor(new_decryptor, NIST_KEY, SEGMENT_IV)
+        self.assertEqual(decryptor.decrypt(SEGMENT_CIPHERTEXT), SEGMENT_PLAINTEXT)
+    
+    @unittest.skipIf(m3u8 is None, "需要 m3u8")
+    def test_iv_from_media_sequence(self):
+        key_ivs = _segment_key_ivs(playlist(
+            "#EXT-X-MEDIA-SEQUENCE:5",
+            '#EXT-X-KEY:METHOD=AES-128,URI="key.bin"',
+            "#EXTINF:4,", "5.ts",
+            "#EXTINF:4,", "6.ts",
+            "#EXTINF:4,", "7.ts",
+        ))
+        _, iv = key_ivs[2]
+        decryptor = SegmentDecryptor(new_decryptor, NIST_KEY, iv)
+        self.assertEqual(decryptor.decrypt(SEGMENT_CIPHERTEXT), SEGMENT_PLAINTEXT)
+    
+    def test_empty_update(self):
+        decryptor = SegmentDecryptor(new_decryptor, NIST_KEY, SEGMENT_IV)
+        self.assertEqual(decryptor.update(b""), b"")
+        output = decryptor.update(SEGMENT_CIPHERTEXT) + decryptor.update(b"")
+        self.assertEqual(output + decryptor.finalize(), SEGMENT_PLAINTEXT)
+    
+    def test_truncated_ciphertext(self):
+        decryptor = SegmentDecryptor(new_decryptor, NIST_KEY, SEGMENT_IV)
+        decryptor.update(SEGMENT_CIPHERTEXT[:-1])
+        with self.assertRaises(ValueError):
+            decryptor.finalize()
+    
+    def test_wrong_key_fails_padding_check(self):
+        # IV 错误只影响第一个块，密钥错误时最后一个块的填充无效
+        decryptor = SegmentDecryptor(new_decryptor, bytes(16), SEGMENT_IV)
+        with self.assertRaises(ValueError):
+            decryptor.decrypt(SEGMENT_CIPHERTEXT)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+共享任务队列 (zhihu_worker.py) 的多进程测试
+
+每个 worker 运行在独立的进程中，通过临时目录中的同一个 SQLite 文件分配任务，用不访问网络的
+StubDownloader 代替 ZhihuVideoDownloader。覆盖: 任务只被领取一次、租约过期后重新排队、
+最大尝试次数、以及租约失去后取消本地下载。
+
+使用方法:
+    python -m pytest tests/test_worker_queue.py
+    python tests/test_worker_queue.py
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import sqlite3
+import tempfile
+import unittest
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from zhihu_worker import QueueWorker, SharedJobQueue  # noqa: E402
+
+
+# 等待子进程和日志内容的超时 (秒)
+TIMEOUT = 60
+
+
+class StubDownloader:
+    """
+    模拟下载器，每次调用在日志文件中追加一行 (多个进程追加同一个文件)
+    
+    URL 决定行为: 包含 fail 的下载抛出异常，包含 block 的下载一直等到被取消，其余的
+    写出一个小文件并返回路径。
+    """
+    
+    def __init__(self, log_path: str):
+        self.log_path = log_path
+    
+    def _log(self, event: str, url: str):
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(f"{event} {os.getpid()} {url}\n")
+    
+    def download_video(self, url, output_dir=".", quality="hd", progress_callback=None,
+                       deadline=None, cancel_event=None, **kwargs):
+        self._log("start", url)
+        if "fail" in url:
+            raise RuntimeError("模拟下载失败")
+        if "block" in url:
+            if cancel_event.wait(TIMEOUT):
+                self._log("cancelled", url)
+            return None
+        
+        time.sleep(0.02)
+        path = os.path.join(output_dir, url.rsplit("/", 1)[-1] + ".mp4")
+        with open(path, "wb") as f:
+            f.write(url.encode("utf-8"))
+        self._log("done", url)
+        return path
+
+
+def _run_worker(db_path: str, log_path: str, output_dir: str, result_path: str,
+                lease_seconds: float, max_attempts: int, jobs: int):
+    """子进程: 运行一个 worker 直到队列中的任务全部结束，把结果计数写入 result_path"""
+    queue = SharedJobQueue(db_path, max_attempts)
+    worker = QueueWorker(
+        queue, StubDownloader(log_path), jobs=jobs, output_dir=output_dir,
+        lease_seconds=lease_seconds, poll_interval=0.05
+    )
+    counts = worker.run(exit_when_empty=True)
+    queue.close()
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump(counts, f)
+
+
+def _lease_and_crash(db_path: str, lease_seconds: float):
+    """子进程: 领取一个任务后直接退出，不续约也不归还租约 (模拟节点崩溃)"""
+    queue = SharedJobQueue(db_path)
+    queue.lease("crashed", lease_seconds)
+    os._exit(0)
+
+
+class SharedJobQueueProcessTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = self._tmp.name
+        self.db_path = os.path.join(self.tmp, "queue.sqlite3")
+        self.log_path = os.path.join(self.tmp, "downloads.log")
+        self.output_dir = os.path.join(self.tmp, "output")
+        os.makedirs(self.output_dir)
+        # spawn: 子进程不继承父进程的 SQLite 连接
+        self.context = multiprocessing.get_context("spawn")
+        self.processes = []
+    
+    def tearDown(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.kill()
+            process.join()
+        self._tmp.cleanup()
+    
+    def _queue(self, max_attempts: int = SharedJobQueue.DEFAULT_MAX_ATTEMPTS) -> SharedJobQueue:
+        queue = SharedJobQueue(self.db_path, max_attempts)
+        self.addCleanup(queue.close)
+        return queue
+    
+    def _start(self, target, *args):
+        process = self.context.Process(target=target, args=args)
+        process.start()
+        self.processes.append(process)
+        return process
+    
+    def _start_worker(self, name: str, lease_seconds: float = 5.0,
+                      max_attempts: int = SharedJobQueue.DEFAULT_MAX_ATTEMPTS, jobs: int = 1):
+        result_path = os.path.join(self.tmp, f"{name}.json")
+        process = self._start(
+            _run_worker, self.db_path, self.log_path, self.output_dir, result_path,
+            lease_seconds, max_attempts, jobs
+        )
+        return process, result_path
+    
+    def _join(self, process) -> None:
+        process.join(TIMEOUT)
+        self.assertFalse(process.is_alive(), "子进程没有在超时前结束")
+        self.assertEqual(process.exitcode, 0)
+    
+    def _log(self) -> list:
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path, encoding="utf-8") as f:
+            return [line.split() for line in f]
+    
+    def _wait_for_log(self, event: str, url: str):
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            if any(entry[0] == event and entry[2] == url for entry in self._log()):
+                return
+            time.sleep(0.05)
+        self.fail(f"日志中没有出现 {event} {url}")
+    
+    def _jobs(self) -> dict:
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute("SELECT url, status, attempts, worker, error FROM jobs").fetchall()
+        return {url: (status, attempts, worker, error) for url, status, attempts, worker, error in rows}
+    
+    @staticmethod
+    def _counts(result_path: str) -> dict:
+        with open(result_path, encoding="utf-8") as f:
+            return json.load(f)
+    
+    def test_each_job_leased_once(self):
+        urls = [f"https://example.com/ok/{i}" for i in range(24)]
+        self._queue().enqueue(urls)
+        
+        workers = [self._start_worker(f"worker{i}", jobs=2) for i in range(3)]
+        for process, _ in workers:
+            self._join(process)
+        
+        downloads = [entry[2] for entry in self._log() if entry[0] == "start"]
+        self.assertEqual(sorted(downloads), sorted(urls))
+        jobs = self._jobs()
+        self.assertTrue(all(job[:2] == ("done", 1) for job in jobs.values()), jobs)
+        self.assertEqual(sum(self._counts(path)["done"] for _, path in workers), len(urls))
+    
+    def test_expired_lease_requeued(self):
+        url = "https://example.com/ok/crashed"
+        self._queue().enqueue([url])
+        self._join(self._start(_lease_and_crash, self.db_path, 0.5))
+        self.assertEqual(self._jobs()[url][:3], ("leased", 1, "crashed"))
+        
+        process, result_path = self._start_worker("worker")
+        self._join(process)
+        
+        status, attempts, worker, _ = self._jobs()[url]
+        self.assertEqual((status, attempts), ("done", 2))
+        self.assertNotEqual(worker, "crashed")
+        self.assertEqual(self._counts(result_path)["done"], 1)
+    
+    def test_max_attempts(self):
+        failing = "https://example.com/fail/1"
+        crashed = "https://example.com/ok/crashed"
+        queue = self._queue(max_attempts=2)
+        queue.enqueue([crashed])
+        # 第一次领取后崩溃，第二次领取后再崩溃，租约过期时已达到最大尝试次数
+        for _ in range(2):
+            self._join(self._start(_lease_and_crash, self.db_path, 0.3))
+            time.sleep(0.4)
+        queue.enqueue([failing])
+        
+        process, result_path = self._start_worker("worker", max_attempts=2)
+        self._join(process)
+        
+        jobs = self._jobs()
+        self.assertEqual(jobs[failing][:2], ("failed", 2))
+        self.assertIn("模拟下载失败", jobs[failing][3])
+        self.assertEqual(jobs[crashed][:2], ("failed", 2))
+        self.assertIn("租约过期", jobs[crashed][3])
+        downloads = [entry[2] for entry in self._log() if entry[0] == "start"]
+        self.assertEqual(downloads, [failing, failing])
+        self.assertEqual(self._counts(result_path)["failed"], 2)
+    
+    @unittest.skipUnless(hasattr(signal, "SIGSTOP"), "需要 SIGSTOP 暂停 worker 进程")
+    def test_lost_lease_cancels_download(self):
+        url = "https://example.com/block/1"
+        queue = self._queue()
+        queue.enqueue([url])
+        
+        process, result_path = self._start_worker("worker", lease_seconds=0.6)
+        self._wait_for_log("start", url)
+        
+        # 暂停 worker (模拟网络中断)，租约过期后由另一个 worker 接手
+        os.kill(process.pid, signal.SIGSTOP)
+        try:
+            time.sleep(0.8)
+            lease = queue.lease("thief", 30)
+        finally:
+            os.kill(process.pid, signal.SIGCONT)
+        self.assertIsNotNone(lease)
+        self.assertEqual(lease.attempts, 2)
+        
+        # 恢复后的心跳发现租约已失去，取消本地下载，且不能覆盖新 worker 的结果
+        self._wait_for_log("cancelled", url)
+        self.assertTrue(queue.complete(lease, "thief.mp4"))
+        self._join(process)
+        
+        status, attempts, worker, _ = self._jobs()[url]
+        self.assertEqual((status, attempts, worker), ("done", 2, "thief"))
+        self.assertEqual(self._counts(result_path), {"done": 0, "failed": 0, "lost": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,1180 @@
+#!/usr/bin/env python3
+"""
+知乎视频异步下载器
+
+ZhihuVideoDownloader 的 asyncio 版本，提供相同的 get_video_info /
+get_download_options / download_video 接口。所有请求共用一个 aiohttp 连接池
+(限制总连接数和每个主机的连接数)，文件写入在线程池中进行，不阻塞事件循环，
+一个进程即可同时处理大量解析请求和分片下载。
+
+与同步版本共用的部分: cookies 加载 (CookieLoader)、元数据缓存、按主机自适应并发
+(ConcurrencyGovernor)、失败重试 (_is_retryable / _backoff_delay)、断点续传清单
+(DownloadManifest) 和 AES-128 分片解密 (SegmentDecryptor)。
+
+依赖:
+    - aiohttp
+    - zhihu_downloader.py 的依赖 (用于加载 cookies 和解析 M3U8)
+    - ffmpeg (系统命令行工具)
+
+使用方法:
+    python zhihu_async_downloader.py <视频页面URL> [<视频页面URL> ...] [--output <输出目录>]
+
+    或在代码中:
+        async with AsyncZhihuVideoDownloader() as downloader:
+            await downloader.download_video(url)
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import contextlib
+import hashlib
+import shutil
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import Morsel
+from typing import Optional, Dict, Any, List, Tuple, Callable
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    print("请安装 aiohttp: pip install aiohttp")
+    exit(1)
+
+from zhihu_downloader import (
+    ZhihuVideoDownloader,
+    VideoInfo,
+    MetadataCache,
+    CookieLoader,
+    EndpointPreference,
+    ConcurrencyGovernor,
+    HostWindow,
+    DownloadManifest,
+    DownloadCancelled,
+    ProgressTracker,
+    SegmentDecryptor,
+    DEFAULT_CACHE_DIR,
+    extract_video_from_page,
+    _load_m3u8_module,
+    _load_aes_cbc,
+    _segment_key_ivs,
+    _split_ranges,
+    _parse_content_range_total,
+    _parse_retry_after,
+    _is_retryable,
+    _backoff_delay,
+)
+
+
+class AsyncZhihuVideoDownloader:
+    """知乎视频异步下载器"""
+
+    HEADERS = ZhihuVideoDownloader.HEADERS
+    LENS_VIDEO_APIS = ZhihuVideoDownloader.LENS_VIDEO_APIS
+    TRAINING_SECTION_APIS = ZhihuVideoDownloader.TRAINING_SECTION_APIS
+    HEDGE_DELAY = ZhihuVideoDownloader.HEDGE_DELAY
+    DEFAULT_SEGMENT_WORKERS = ZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS
+    DEFAULT_MP4_CONNECTIONS = ZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS
+    MIN_RANGE_SIZE = ZhihuVideoDownloader.MIN_RANGE_SIZE
+    RESUME_CHECKPOINT_SIZE = ZhihuVideoDownloader.RESUME_CHECKPOINT_SIZE
+    PIECE_RETRIES = ZhihuVideoDownloader.PIECE_RETRIES
+    RETRY_BASE_DELAY = ZhihuVideoDownloader.RETRY_BASE_DELAY
+    RETRY_MAX_DELAY = ZhihuVideoDownloader.RETRY_MAX_DELAY
+    SEGMENT_RETRY_ROUNDS = ZhihuVideoDownloader.SEGMENT_RETRY_ROUNDS
+
+    # 连接池的总连接数上限
+    DEFAULT_CONNECTION_LIMIT = 256
+
+    # 连接池中每个主机的连接数上限
+    DEFAULT_PER_HOST_LIMIT = 32
+
+    # 写文件线程数
+    FILE_WRITERS = 4
+
+    # 每次写入文件的数据块大小 (响应数据在内存中最多缓存这么多字节)
+    WRITE_CHUNK_SIZE = 1024 * 1024
+
+    # 从连接上每次读取的数据块大小
+    READ_CHUNK_SIZE = 65536
+
+    # 主机的并发窗口已满时，再次尝试占用位置的间隔 (秒)
+    WINDOW_POLL_INTERVAL = 0.02
+
+    def __init__(self, use_chrome_cookies: bool = True, cookie_file: str = None,
+                 segment_workers: int = DEFAULT_SEGMENT_WORKERS,
+                 mp4_connections: int = DEFAULT_MP4_CONNECTIONS,
+                 connection_limit: int = DEFAULT_CONNECTION_LIMIT,
+                 per_host_limit: int = DEFAULT_PER_HOST_LIMIT,
+                 cache_dir: Optional[str] = None,
+                 refresh_cache: bool = False,
+                 resume: bool = False,
+                 adaptive_concurrency: bool = True):
+        """
+        初始化下载器 (需要在 async with 中使用，或手动调用 open/close)
+
+        Args:
+            use_chrome_cookies: 是否使用 Chrome 的 cookies 进行鉴权
+            cookie_file: 手动提供的 cookies 文件路径 (JSON 格式)
+            segment_workers: 每个 M3U8 视频同时下载的分片数，0 表示只使用 ffmpeg 下载
+            mp4_connections: 每个 MP4 视频并发下载的连接数
+            connection_limit: 连接池的总连接数上限
+            per_host_limit: 连接池中每个主机的连接数上限
+            cache_dir: 元数据缓存目录 (同时缓存从 Chrome 读取的 cookies)，None 表示不使用缓存
+            refresh_cache: 忽略已有的元数据缓存，重新解析 (仍会更新缓存)
+            resume: 是否启用断点续传 (在输出文件旁边保存下载清单)
+            adaptive_concurrency: 按主机自适应调整并发数，被限流 (429/503) 时自动退避
+        """
+        self.cache = MetadataCache(cache_dir, refresh_cache) if cache_dir else None
+
+        # cookies 先加载到 requests session (CookieLoader 用它检查缓存的 cookies)，open 时复制到 aiohttp
+        cookie_session = requests.Session()
+        cookie_session.headers.update(self.HEADERS)
+        self.cookies = CookieLoader(cookie_session, self.cache, cache_dir)
+        self.cookies.load(use_chrome_cookies, cookie_file)
+
+        self.segment_workers = max(0, segment_workers)
+        self.mp4_connections = max(1, mp4_connections)
+        self.connection_limit = connection_limit
+        self.per_host_limit = per_host_limit
+        self.resume = resume
+
+        # 与同步下载器相同的初始窗口: 第一个视频就能用满分片线程数 / 连接数
+        self.governor = ConcurrencyGovernor(
+            max(ConcurrencyGovernor.INITIAL_WINDOW, self.segment_workers, self.mp4_connections)
+        ) if adaptive_concurrency else None
+
+        self.session: Optional[aiohttp.ClientSession] = None
+        self._file_executor: Optional[ThreadPoolExecutor] = None
+        # 每个主机上最近返回有效结果的 API 端点 (见 _probe_endpoints)
+        self.endpoints = EndpointPreference(self.cache)
+
+    async def __aenter__(self) -> "AsyncZhihuVideoDownloader":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def open(self):
+        """创建共享的连接池和 HTTP 会话"""
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.per_host_limit
+        )
+
+        cookie_jar = aiohttp.CookieJar()
+        for cookie in self.cookies.session.cookies:
+            morsel = Morsel()
+            morsel.set(cookie.name, cookie.value, cookie.value)
+            morsel["domain"] = cookie.domain or ".zhihu.com"
+            morsel["path"] = cookie.path or "/"
+            cookie_jar.update_cookies({cookie.name: morsel})
+
+        self.session = aiohttp.ClientSession(
+            headers=self.HEADERS,
+            cookie_jar=cookie_jar,
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        )
+        self._file_executor = ThreadPoolExecutor(max_workers=self.FILE_WRITERS)
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+        if self._file_executor:
+            self._file_executor.shutdown(wait=True)
+            self._file_executor = None
+
+    async def _write_file(self, func, *args):
+        """在写文件线程池中执行阻塞的文件操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._file_executor, func, *args)
+
+    def _cache_get(self, key: str) -> Optional[Any]:
+        return self.cache.get(key) if self.cache else None
+
+    def _cache_set(self, key: str, value: Any, ttl: float):
+        if self.cache and ttl > 0:
+            self.cache.set(key, value, ttl)
+
+    @contextlib.asynccontextmanager
+    async def _get(self, url: str, **kwargs):
+        """
+        GET 请求，在 ConcurrencyGovernor 中占用目标主机的一个窗口位置
+
+        与同步版本的 GovernedAdapter 相同，位置在响应体读完 (离开 async with) 后才释放，
+        并按状态码、响应延迟和 Retry-After 调整窗口。
+        """
+        window = self.governor.window(urlparse(url).netloc) if self.governor else None
+        if not window:
+            async with self.session.get(url, **kwargs) as response:
+                yield response
+            return
+
+        started = await self._acquire_window(window)
+        latency = None
+        status = None
+        retry_after = None
+        try:
+            async with self.session.get(url, **kwargs) as response:
+                latency = time.time() - started
+                status = response.status
+                retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+                yield response
+        finally:
+            if latency is None:
+                latency = time.time() - started
+            window.release(started, latency, status, retry_after)
+
+    async def _acquire_window(self, window: HostWindow) -> float:
+        """等待主机窗口中的空位 (以及 Retry-After 到期)，不阻塞事件循环"""
+        while True:
+            started = window.try_acquire()
+            if started is not None:
+                return started
+            await asyncio.sleep(self.WINDOW_POLL_INTERVAL)
+
+    async def _with_retries(self, description: str, url: str, func):
+        """
+        调用 await func()，失败可能是暂时性的 (见 _is_retryable) 时按指数退避加随机抖动重试
+        (见 ZhihuVideoDownloader._with_retries)
+
+        func 每次调用只应请求尚未完成的部分；响应带有 Retry-After 时至少等待指定的时间。
+        """
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.PIECE_RETRIES or not _is_retryable(e):
+                    raise
+
+                delay = _backoff_delay(attempt, self.RETRY_BASE_DELAY, self.RETRY_MAX_DELAY)
+                headers = getattr(e, "headers", None)
+                if headers:
+                    delay = max(delay, _parse_retry_after(headers.get("Retry-After")) or 0)
+                attempt += 1
+
+                print(f"⚠ {description}失败: {_error_text(e)}，{delay:.1f} 秒后重试 "
+                      f"({attempt}/{self.PIECE_RETRIES})")
+                await asyncio.sleep(delay)
+
+    async def _read_blocks(self, response: aiohttp.ClientResponse):
+        """逐块读取响应内容，合并成不超过 WRITE_CHUNK_SIZE 左右的数据块 (减少写文件线程的调度次数)"""
+        buffer = bytearray()
+        async for chunk in response.content.iter_chunked(self.READ_CHUNK_SIZE):
+            buffer += chunk
+            if len(buffer) >= self.WRITE_CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+        if buffer:
+            yield bytes(buffer)
+
+    # ---- 解析 ----
+
+    async def _probe_endpoints(self, templates: List[str], params: Dict[str, str],
+                               parse) -> Optional[Any]:
+        """
+        对冲请求多个等价的 API 端点，返回第一个有效结果 (见 ZhihuVideoDownloader._probe_endpoints)
+
+        先请求最近成功过的端点 (见 EndpointPreference)；其余仍在进行的请求被取消。
+        """
+        ordered = self.endpoints.order(templates)
+
+        pending: Dict[asyncio.Task, str] = {}
+        launched = 0
+
+        def launch():
+            nonlocal launched
+            template = ordered[launched]
+            launched += 1
+            task = asyncio.ensure_future(self._probe_endpoint(template.format(**params), parse))
+            pending[task] = template
+
+        try:
+            launch()
+            while pending:
+                hedge = launched < len(ordered)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=self.HEDGE_DELAY if hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    # 当前端点响应太慢，启动下一个端点
+                    launch()
+                    continue
+
+                for task in done:
+                    template = pending.pop(task)
+                    result = task.result()
+                    if result is not None:
+                        self.endpoints.record(template)
+                        return result
+
+                # 请求失败，立即尝试下一个端点
+                if launched < len(ordered):
+                    launch()
+
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _probe_endpoint(self, api_url: str, parse) -> Optional[Any]:
+        """请求单个 API 端点并解析结果，失败返回 None"""
+        print(f"尝试 API: {api_url}")
+        try:
+            async with self._get(api_url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                if response.status != 200:
+                    print(f"  返回状态码: {response.status}")
+                    return None
+                return parse(await response.json(content_type=None))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"  请求失败: {_error_text(e)}")
+        except ValueError as e:
+            print(f"  JSON 解析失败: {e}")
+        return None
+
+    async def _get_training_section_info(self, section_id: str) -> Optional[Dict[str, Any]]:
+        """通过训练营 API 获取小节对应的视频 ID"""
+        cache_key = f"section:{section_id}"
+        cached = self._cache_get(cache_key)
+        if cached:
+            return cached
+
+        def parse(api_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            resource = api_data.get("resource", {})
+            if resource.get("type") != "video":
+                return None
+
+            video_data = resource.get("data", {})
+            if not video_data.get("id"):
+                return None
+
+            return {
+                "video_id": video_data["id"],
+                "title": api_data.get("title", ""),
+                "duration": video_data.get("duration", 0),
+                "source": "training_api"
+            }
+
+        section_info = await self._probe_endpoints(
+            self.TRAINING_SECTION_APIS,
+            {"section_id": section_id},
+            parse
+        )
+        if section_info:
+            self._cache_set(cache_key, section_info, MetadataCache.PAGE_TTL)
+
+        return section_info
+
+    async def _get_video_info_from_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """从知乎页面获取视频信息 (见 ZhihuVideoDownloader._get_video_info_from_page)"""
+        training_ids = ZhihuVideoDownloader.parse_training_url(url)
+        if training_ids and training_ids[1]:
+            section_info = await self._get_training_section_info(training_ids[1])
+            if section_info:
+                return section_info
+
+        try:
+            async with self._get(url, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                response.raise_for_status()
+                html_content = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"⚠ 获取页面失败: {_error_text(e)}")
+            return None
+
+        page_info = extract_video_from_page(html_content)
+        if not page_info:
+            print(f"⚠ 无法从页面中提取视频 ID: {url}")
+        return page_info
+
+    async def resolve_video_id(self, url_or_id: str) -> Tuple[Optional[str], str]:
+        """
+        解析知乎视频页面 URL 或视频 ID
+
+        Returns:
+            (视频 ID, 视频标题)，无法获取时视频 ID 为 None
+        """
+        if ZhihuVideoDownloader.is_direct_video_id(url_or_id):
+            return url_or_id, ""
+
+        video_id = ZhihuVideoDownloader.extract_video_id_from_url(url_or_id)
+        if video_id:
+            return video_id, ""
+
+        cache_key = f"page:{url_or_id}"
+        page_info = self._cache_get(cache_key)
+        if not page_info:
+            page_info = await self._get_video_info_from_page(url_or_id)
+            if page_info and page_info.get("video_id"):
+                self._cache_set(cache_key, page_info, MetadataCache.PAGE_TTL)
+
+        if not page_info:
+            return None, ""
+        return page_info.get("video_id"), page_info.get("title", "")
+
+    async def get_video_info(self, video_id: str, title: str = "",
+                             use_cache: bool = True) -> Optional[VideoInfo]:
+        """
+        获取视频信息，包括不同清晰度的播放地址
+
+        Args:
+            video_id: 知乎 Lens 视频 ID (可能是数字 ID 或加密 ID)
+            title: 视频标题（可选，用于保存文件名）
+            use_cache: 是否使用缓存的播放列表
+        """
+        cache_key = f"video:{video_id}"
+        cached = self._cache_get(cache_key) if use_cache else None
+        if cached:
+            return VideoInfo(
+                video_id=video_id,
+                title=title or cached["title"],
+                duration=cached["duration"],
+                playlist=cached["playlist"]
+            )
+
+        def parse(data: Dict[str, Any]) -> Optional[VideoInfo]:
+            playlist = data.get("playlist") or data.get("playlist_v2") or {}
+            if not playlist:
+                print(f"  API 返回成功但没有播放列表")
+                return None
+
+            api_title = data.get("title", f"zhihu_video_{video_id[:20]}")
+            if self.cache:
+                self._cache_set(cache_key, {
+                    "title": api_title,
+                    "duration": data.get("duration", 0),
+                    "playlist": playlist,
+                }, self.cache.playlist_ttl(playlist))
+
+            return VideoInfo(
+                video_id=video_id,
+                title=title or api_title,
+                duration=data.get("duration", 0),
+                playlist=playlist
+            )
+
+        video_info = await self._probe_endpoints(
+            self.LENS_VIDEO_APIS,
+            {"video_id": video_id},
+            parse
+        )
+        if not video_info:
+            print(f"⚠ 无法获取视频播放信息: {video_id[:50]}")
+        return video_info
+
+    get_download_options = staticmethod(ZhihuVideoDownloader.get_download_options)
+
+    # ---- 下载 ----
+
+    async def download_video(self, url_or_id: str, output_dir: str = ".",
+                             quality: str = "hd",
+                             progress_callback=None,
+                             cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        下载知乎视频
+
+        Args:
+            url_or_id: 知乎视频页面 URL 或视频 ID
+            output_dir: 输出目录
+            quality: 期望的视频质量 (uhd/fhd/hd/sd/ld)
+            progress_callback: 进度回调函数，接收 ProgressEvent (心跳事件在后台线程中发出)
+            cancel_event: 取消下载的事件 (可选)，设置后下载在下一个数据块之后停止
+
+        Returns:
+            下载成功时返回输出文件路径，失败或被取消时返回 None
+        """
+        video_id, video_title = await self.resolve_video_id(url_or_id)
+        if not video_id:
+            print(f"⚠ 无法获取视频 ID: {url_or_id}")
+            return None
+
+        return await self.download_resolved_video(
+            video_id, video_title, output_dir, quality, progress_callback, cancel_event
+        )
+
+    async def download_resolved_video(self, video_id: str, video_title: str = "",
+                                      output_dir: str = ".", quality: str = "hd",
+                                      progress_callback=None,
+                                      cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        """下载已解析出视频 ID 的知乎视频"""
+        video_info = await self.get_video_info(video_id, video_title)
+        if not video_info:
+            return None
+
+        options = self.get_download_options(video_info)
+        if not options:
+            print(f"⚠ 没有可用的下载选项: {video_info.title}")
+            return None
+
+        selected_option = ZhihuVideoDownloader.select_download_option(options, quality)
+        output_path = str(ZhihuVideoDownloader.output_path_for(video_info.title, output_dir))
+        print(f"开始下载: {video_info.title} ({selected_option.quality})")
+
+        # 断点续传清单 (以视频 ID + 清晰度识别同一个下载)
+        manifest = None
+        if self.resume:
+            manifest = DownloadManifest(
+                output_path, f"{video_info.video_id}:{selected_option.quality}"
+            )
+
+        progress = None
+        if progress_callback or cancel_event:
+            progress = ProgressTracker(
+                progress_callback, video_info.video_id, video_info.title,
+                video_info.duration / 1000, cancel_event
+            )
+
+        success = False
+        started_at = time.time()
+        try:
+            if selected_option.format == "m3u8" or ".m3u8" in selected_option.play_url:
+                success = await self._download_m3u8_video(
+                    selected_option.play_url, output_path, progress, manifest
+                )
+            else:
+                success = await self._download_mp4_video(
+                    selected_option.play_url, output_path, progress, manifest
+                )
+        except DownloadCancelled:
+            # ffmpeg 已经开始写入的输出文件不完整 (断点续传清单保留，可以继续下载)
+            with contextlib.suppress(OSError):
+                if os.path.getmtime(output_path) >= started_at:
+                    os.remove(output_path)
+            print(f"✗ 下载已取消: {video_info.title}")
+            return None
+        finally:
+            if progress:
+                progress.finish(success)
+
+        if success:
+            if manifest:
+                manifest.discard()
+            print(f"✓ 下载完成: {output_path}")
+            return output_path
+
+        print(f"✗ 下载失败: {video_info.title}")
+        return None
+
+    async def download_many(self, urls: List[str], output_dir: str = ".",
+                            quality: str = "hd", jobs: int = 8) -> List[Optional[str]]:
+        """
+        同时下载多个视频 (最多 jobs 个同时进行)
+
+        Returns:
+            与 urls 一一对应的输出文件路径，失败的为 None
+        """
+        semaphore = asyncio.Semaphore(max(1, jobs))
+
+        async def download(url: str) -> Optional[str]:
+            async with semaphore:
+                try:
+                    return await self.download_video(url, output_dir, quality)
+                except Exception as e:
+                    print(f"✗ 下载失败: {url} ({_error_text(e)})")
+                    return None
+
+        return await asyncio.gather(*(download(url) for url in urls))
+
+    async def _download_m3u8_video(self, m3u8_url: str, output_path: str,
+                                   progress: Optional[ProgressTracker] = None,
+                                   manifest: Optional[DownloadManifest] = None) -> bool:
+        """并发下载 M3U8 分片后交给 ffmpeg 合并，不支持的播放列表交给 ffmpeg 直接下载"""
+        ffmpeg_path = shutil.which("ffmpeg")
+        if not ffmpeg_path:
+            print("⚠ 未找到 ffmpeg，请先安装: brew install ffmpeg")
+            return False
+
+        if self.segment_workers > 0:
+            result = await self._download_m3u8_segments(
+                m3u8_url, output_path, ffmpeg_path, progress, manifest
+            )
+            if result is not None:
+                return result
+
+        cmd = [
+            ffmpeg_path,
+            "-headers", f"User-Agent: {self.HEADERS['User-Agent']}\r\nReferer: https://www.zhihu.com/\r\n",
+            "-i", m3u8_url,
+            "-c", "copy",
+            "-bsf:a", "aac_adtstoasc",
+            "-y",
+            output_path
+        ]
+        return await self._run_ffmpeg(cmd)
+
+    async def _load_m3u8_playlist(self, m3u8_url: str) -> "m3u8.M3U8":
+        """获取并解析 M3U8 播放列表，主播放列表选择码率最高的子播放列表"""
+        m3u8 = _load_m3u8_module()
+
+        async def fetch() -> str:
+            async with self._get(m3u8_url) as response:
+                response.raise_for_status()
+                return await response.text()
+
+        text = await self._with_retries("获取播放列表", m3u8_url, fetch)
+        playlist = m3u8.loads(text, uri=m3u8_url)
+        if playlist.is_variant:
+            best = max(playlist.playlists, key=lambda p: p.stream_info.bandwidth or 0)
+            return await self._load_m3u8_playlist(best.absolute_uri)
+
+        return playlist
+
+    async def _load_segment_keys(self, playlist: "m3u8.M3U8") -> List[Optional[Tuple[bytes, bytes]]]:
+        """
+        获取加密分片的密钥和 IV (见 ZhihuVideoDownloader._load_segment_keys)
+
+        Returns:
+            每个分片的 (密钥, IV)，未加密的分片为 None
+
+        Raises:
+            ValueError: 不支持的加密方式，或密钥无效
+            aiohttp.ClientError: 获取密钥失败
+        """
+        keys: Dict[str, bytes] = {}
+        result: List[Optional[Tuple[bytes, bytes]]] = []
+        for uri_iv in _segment_key_ivs(playlist):
+            if uri_iv is None:
+                result.append(None)
+                continue
+
+            uri, iv = uri_iv
+            if uri not in keys:
+                async def fetch(uri: str = uri) -> bytes:
+                    async with self._get(uri, timeout=aiohttp.ClientTimeout(total=30)) as response:
+                        response.raise_for_status()
+                        return await response.read()
+
+                key = await self._with_retries("获取解密密钥", uri, fetch)
+                if len(key) != SegmentDecryptor.BLOCK_SIZE:
+                    raise ValueError(f"解密密钥长度应为 16 字节，实际为 {len(key)} 字节")
+                keys[uri] = key
+            result.append((keys[uri], iv))
+
+        return result
+
+    async def _download_m3u8_segments(self, m3u8_url: str, output_path: str,
+                                      ffmpeg_path: str,
+                                      progress: Optional[ProgressTracker] = None,
+                                      manifest: Optional[DownloadManifest] = None) -> Optional[bool]:
+        """
+        并发下载 M3U8 分片，按顺序交给 ffmpeg 合并 (见 ZhihuVideoDownloader._download_m3u8_segments)
+
+        分片边下载边写入文件 (加密的分片同时解密)，不会整个读入内存。提供断点续传清单时，
+        分片保存在输出文件旁边，已完成且校验一致的分片不再重新下载。
+        单个分片失败不影响其余分片，其余分片下载完后只重新下载失败的分片。
+
+        Returns:
+            True/False 表示下载和合并是否成功；None 表示需要回退到 ffmpeg 直接下载
+        """
+        try:
+            playlist = await self._load_m3u8_playlist(m3u8_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"⚠ 解析 M3U8 播放列表失败: {_error_text(e)}")
+            return None
+
+        segments = playlist.segments
+        if not segments:
+            return None
+        if playlist.segment_map or any(seg.byterange for seg in segments):
+            return None
+
+        decryptor_for = None
+        if any(key and key.method and key.method != "NONE" for key in playlist.keys):
+            try:
+                new_decryptor = _load_aes_cbc()
+                segment_keys_ivs = await self._load_segment_keys(playlist)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                print(f"⚠ 无法解密分片: {_error_text(e)}")
+                return None
+
+            def decryptor_for(index: int) -> Optional[SegmentDecryptor]:
+                key_iv = segment_keys_ivs[index]
+                return SegmentDecryptor(new_decryptor, *key_iv) if key_iv else None
+
+        total = len(segments)
+        segment_keys = [urlparse(segment.absolute_uri).path for segment in segments]
+
+        # 断点续传时分片保存在输出文件旁边，否则使用临时目录
+        if manifest:
+            os.makedirs(manifest.segments_dir, exist_ok=True)
+            work_context = contextlib.nullcontext(manifest.segments_dir)
+        else:
+            work_context = tempfile.TemporaryDirectory(prefix="zhihu_hls_")
+
+        with work_context as work_dir:
+            segment_paths = [
+                os.path.join(work_dir, f"{index:06d}.ts") for index in range(total)
+            ]
+
+            pending = list(range(total))
+            if manifest:
+                # 校验已有分片需要读文件，在写文件线程池中进行
+                pending = await self._write_file(lambda: [
+                    index for index in pending
+                    if not manifest.is_segment_done(
+                        index, segment_keys[index], segment_paths[index]
+                    )
+                ])
+                if len(pending) < total:
+                    print(f"断点续传: 已完成 {total - len(pending)}/{total} 个分片")
+
+            if progress:
+                progress.set_total(segments_total=total)
+                pending_set = set(pending)
+                done_bytes = sum(
+                    os.path.getsize(segment_paths[index])
+                    for index in range(total) if index not in pending_set
+                )
+                progress.advance(done_bytes, total - len(pending), transferred=False)
+
+            semaphore = asyncio.Semaphore(self.segment_workers)
+
+            def retryable(error: Optional[Exception]) -> bool:
+                return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError)) and _is_retryable(error)
+
+            async def fetch(index: int) -> Tuple[int, str]:
+                async with semaphore:
+                    return await self._fetch_segment(
+                        segments[index].absolute_uri, index, segment_paths[index],
+                        decryptor_for, progress
+                    )
+
+            async def download_round(indices: List[int]) -> Tuple[List[int], Optional[Exception]]:
+                """
+                下载一轮分片，返回 (没有下载完成的分片, 错误)
+
+                分片失败时其余分片继续下载；错误不可重试 (如 404、写入失败) 时取消其余分片。
+                """
+                done = set()
+                error: Optional[Exception] = None
+                tasks = {asyncio.ensure_future(fetch(index)): index for index in indices}
+                waiting = set(tasks)
+                try:
+                    while waiting:
+                        finished, waiting = await asyncio.wait(
+                            waiting, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        for task in finished:
+                            if task.cancelled():
+                                continue
+                            try:
+                                size, sha256 = task.result()
+                            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+                                if error is None or retryable(error):
+                                    error = e
+                                if not retryable(e):
+                                    for other in waiting:
+                                        other.cancel()
+                                continue
+
+                            index = tasks[task]
+                            done.add(index)
+                            if manifest:
+                                await self._write_file(
+                                    manifest.mark_segment, index, segment_keys[index], size, sha256
+                                )
+                            if progress:
+                                progress.advance(size, 1)
+                finally:
+                    # 出错或被取消时等待其余分片结束，临时文件都已关闭
+                    for task in waiting:
+                        task.cancel()
+                    await asyncio.gather(*waiting, return_exceptions=True)
+                return [index for index in indices if index not in done], error
+
+            try:
+                missing, error = await download_round(pending)
+                for _ in range(self.SEGMENT_RETRY_ROUNDS):
+                    if not missing or not retryable(error):
+                        break
+                    print(f"⚠ {len(missing)} 个分片下载失败 ({_error_text(error)})，重新下载这些分片...")
+                    missing, error = await download_round(missing)
+            finally:
+                if manifest:
+                    await self._write_file(manifest.save)
+
+            if missing:
+                print(f"⚠ {len(missing)} 个分片下载失败: {_error_text(error)}")
+                if manifest:
+                    # 保留已下载的分片，下次运行时继续
+                    print("  已保存下载进度，重新运行即可继续下载")
+                return False
+
+            list_path = os.path.join(work_dir, "segments.txt")
+            await self._write_file(
+                _write_bytes, list_path,
+                "".join(f"file '{path}'\n" for path in segment_paths).encode("utf-8")
+            )
+
+            cmd = [
+                ffmpeg_path,
+                "-f", "concat",
+                "-safe", "0",
+                "-i", list_path,
+                "-c", "copy",
+                "-bsf:a", "aac_adtstoasc",
+                "-y",
+                output_path
+            ]
+            if progress:
+                progress.set_phase("remux")
+            success = await self._run_ffmpeg(cmd)
+
+        if success and manifest:
+            shutil.rmtree(manifest.segments_dir, ignore_errors=True)
+        return success
+
+    async def _fetch_segment(self, url: str, index: int, path: str,
+                             decryptor_for: Optional[Callable[[int], Optional[SegmentDecryptor]]] = None,
+                             progress: Optional[ProgressTracker] = None) -> Tuple[int, str]:
+        """
+        下载单个分片到文件，失败时重试 (见 _with_retries)
+
+        数据逐块写入临时文件 (加密的分片逐块解密)，完整下载后再改名，避免留下不完整的分片。
+
+        Returns:
+            (分片字节数, SHA-256 校验值)，均按解密后的内容计算
+        """
+        async def fetch() -> Tuple[int, str]:
+            decryptor = decryptor_for(index) if decryptor_for else None
+            size = 0
+            digest = hashlib.sha256()
+            tmp_path = path + ".part"
+            f = await self._write_file(open, tmp_path, 'wb')
+            try:
+                async def write(data: bytes):
+                    nonlocal size
+                    if data:
+                        await self._write_file(f.write, data)
+                        digest.update(data)
+                        size += len(data)
+
+                async with self._get(url) as response:
+                    response.raise_for_status()
+                    async for block in self._read_blocks(response):
+                        if progress:
+                            progress.check_cancelled()
+                        await write(decryptor.update(block) if decryptor else block)
+                if decryptor:
+                    await write(decryptor.finalize())
+            finally:
+                await self._write_file(f.close)
+            await self._write_file(os.replace, tmp_path, path)
+            return size, digest.hexdigest()
+
+        return await self._with_retries(f"分片 {index + 1} 下载", url, fetch)
+
+    async def _run_ffmpeg(self, cmd: List[str]) -> bool:
+        """运行 ffmpeg，失败时显示最后几行错误信息"""
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        # 只保留最后几行，长视频不会占用大量内存
+        tail = deque(maxlen=5)
+        async for line in process.stderr:
+            line = line.decode("utf-8", errors="replace").strip()
+            if line:
+                tail.append(line)
+
+        returncode = await process.wait()
+        if returncode != 0:
+            print(f"⚠ ffmpeg 失败 (exit code: {returncode})")
+            for line in tail:
+                print(f"  {line}")
+            return False
+        return True
+
+    async def _download_mp4_video(self, url: str, output_path: str,
+                                  progress: Optional[ProgressTracker] = None,
+                                  manifest: Optional[DownloadManifest] = None) -> bool:
+        """
+        下载 MP4 视频: 支持 Range 时多连接并发写入预分配文件的对应位置，否则单连接下载
+
+        提供断点续传清单时，每下载一个检查点大小就记录一个字节范围；
+        重新运行时校验已记录的范围，只下载缺失的部分 (见 ZhihuVideoDownloader._download_mp4_video)。
+        """
+        part_path = manifest.part_path if manifest else output_path + ".part"
+        if manifest and manifest.has_progress():
+            await self._write_file(manifest.verify_ranges, part_path)
+            done = manifest.completed_bytes()
+            if done:
+                print(f"断点续传: 已完成 {done / 1024 / 1024:.1f} MB")
+
+        try:
+            total_size, supports_range = await self._with_retries(
+                "探测文件大小", url, lambda: self._probe_mp4(url)
+            )
+            # 断点续传时即使只有一个连接也按字节范围下载，只请求清单中缺失的部分
+            if supports_range and total_size and (self.mp4_connections > 1 or manifest):
+                await self._download_mp4_ranges(url, part_path, total_size, manifest, progress)
+            else:
+                if manifest and manifest.has_progress() and not supports_range:
+                    print("⚠ 服务器不支持断点续传，从头开始下载")
+                await self._download_mp4_stream(url, part_path, manifest, progress)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, DownloadCancelled) as e:
+            if manifest:
+                await self._write_file(manifest.save)
+            else:
+                with contextlib.suppress(OSError):
+                    os.remove(part_path)
+            if isinstance(e, DownloadCancelled):
+                raise
+            print(f"⚠ 下载失败: {_error_text(e)}")
+            if manifest:
+                print("  已保存下载进度，重新运行即可继续下载")
+            return False
+
+        if manifest:
+            await self._write_file(manifest.save)
+            if manifest.total_size and manifest.missing_ranges():
+                print("⚠ 下载不完整，重新运行即可继续下载")
+                return False
+
+        os.replace(part_path, output_path)
+        return True
+
+    async def _probe_mp4(self, url: str) -> Tuple[Optional[int], bool]:
+        """
+        用 ``Range: bytes=0-0`` 请求探测文件大小以及服务器是否支持 Range
+
+        Returns:
+            (文件大小, 是否支持 Range 请求)
+        """
+        async with self._get(url, headers={"Range": "bytes=0-0"}) as response:
+            response.raise_for_status()
+            if response.status == 206:
+                return _parse_content_range_total(response.headers.get("Content-Range")), True
+            return response.content_length, False
+
+    async def _download_mp4_stream(self, url: str, part_path: str,
+                                   manifest: Optional[DownloadManifest] = None,
+                                   progress: Optional[ProgressTracker] = None):
+        """单连接从头下载整个文件 (服务器不支持 Range 请求，失败时只能从头重新下载)"""
+        written = 0
+
+        async def fetch():
+            nonlocal written
+            if written and progress:
+                # 重新下载前撤销上次计入的进度
+                progress.advance(-written, transferred=False)
+            written = 0
+
+            async with self._get(url) as response:
+                response.raise_for_status()
+                total_size = response.content_length
+                if manifest:
+                    manifest.clear_ranges()
+                    manifest.total_size = total_size
+                if progress:
+                    progress.set_total(bytes_total=total_size)
+
+                f = await self._write_file(open, part_path, 'wb')
+                try:
+                    await self._write_body(response, f, 0, manifest, progress)
+                finally:
+                    written = await self._write_file(f.tell)
+                    await self._write_file(f.close)
+
+        await self._with_retries("下载", url, fetch)
+
+    async def _download_mp4_ranges(self, url: str, part_path: str, total_size: int,
+                                   manifest: Optional[DownloadManifest] = None,
+                                   progress: Optional[ProgressTracker] = None):
+        """多连接并发下载尚未完成的字节范围"""
+        if manifest:
+            manifest.total_size = total_size
+            missing = manifest.missing_ranges()
+        else:
+            missing = [(0, total_size - 1)]
+
+        # 预先分配文件大小，各连接直接写入自己负责的位置
+        await self._write_file(_preallocate, part_path, total_size)
+
+        parts = _split_ranges(missing, self.mp4_connections, self.MIN_RANGE_SIZE)
+        if not parts:
+            return
+
+        remaining = sum(end - start + 1 for start, end in missing)
+        if progress:
+            progress.set_total(bytes_total=total_size)
+            progress.advance(total_size - remaining, transferred=False)
+
+        tasks = [
+            asyncio.ensure_future(
+                self._fetch_mp4_range(url, part_path, start, end, manifest, progress)
+            )
+            for start, end in parts
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 一个范围失败时取消其它连接，等它们记录完已写入的范围
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _fetch_mp4_range(self, url: str, part_path: str, start: int, end: int,
+                               manifest: Optional[DownloadManifest] = None,
+                               progress: Optional[ProgressTracker] = None):
+        """
+        下载一个字节范围并写入未完成文件的对应位置
+
+        连接中断或收到的数据不完整时，只从中断的位置重新请求剩余的部分 (见 _with_retries)
+        """
+        position = start
+
+        async def fetch():
+            nonlocal position
+            async with self._get(url, headers={"Range": f"bytes={position}-{end}"}) as response:
+                response.raise_for_status()
+                if response.status != 206:
+                    raise aiohttp.ClientPayloadError(
+                        f"服务器没有按 Range 返回数据 (状态码: {response.status})"
+                    )
+                f = await self._write_file(open, part_path, 'r+b')
+                try:
+                    await self._write_file(f.seek, position)
+                    await self._write_body(response, f, position, manifest, progress)
+                finally:
+                    position = await self._write_file(f.tell)
+                    await self._write_file(f.close)
+
+            if position <= end:
+                raise aiohttp.ClientPayloadError(
+                    f"字节范围 {start}-{end} 不完整: 收到 {position - start} 字节"
+                )
+
+        await self._with_retries(f"字节范围 {start}-{end} 下载", url, fetch)
+
+    async def _write_body(self, response: aiohttp.ClientResponse, f, start: int,
+                          manifest: Optional[DownloadManifest] = None,
+                          progress: Optional[ProgressTracker] = None):
+        """
+        把响应内容分块写入文件当前位置 (写入在线程池中进行)，并按检查点大小在清单中
+        记录已完成的字节范围；连接中途断开时已写入的数据也会记录，重试时从断开的位置继续
+        """
+        position = piece_start = start
+        digest = hashlib.sha256()
+        try:
+            async for block in self._read_blocks(response):
+                await self._write_file(f.write, block)
+                digest.update(block)
+                position += len(block)
+
+                if manifest and position - piece_start >= self.RESUME_CHECKPOINT_SIZE:
+                    await self._write_file(f.flush)
+                    manifest.mark_range(piece_start, position - piece_start, digest.hexdigest())
+                    piece_start = position
+                    digest = hashlib.sha256()
+
+                if progress:
+                    progress.advance(len(block))
+        finally:
+            if manifest and position > piece_start:
+                await self._write_file(f.flush)
+                manifest.mark_range(piece_start, position - piece_start, digest.hexdigest())
+
+
+def _error_text(error: BaseException) -> str:
+    """简短的错误描述 (ClientResponseError 的 repr 包含完整的请求信息)"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return f"{error.status} {error.message}"
+    return str(error) or repr(error)
+
+
+def _write_bytes(path: str, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _preallocate(path: str, size: int):
+    """把未完成文件扩展 (或截断) 到 size 字节，保留已下载的内容"""
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.truncate(size)
+
+
+async def _main_async(args) -> int:
+    async with AsyncZhihuVideoDownloader(
+        use_chrome_cookies=not (args.no_cookies or args.cookies),
+        cookie_file=None if args.no_cookies else args.cookies,
+        segment_workers=args.segment_workers,
+        mp4_connections=args.connections,
+        per_host_limit=args.per_host_limit,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        refresh_cache=args.refresh,
+        resume=args.resume,
+        adaptive_concurrency=not args.fixed_concurrency
+    ) as downloader:
+        results = await downloader.download_many(
+            args.urls, output_dir=args.output, quality=args.quality, jobs=args.jobs
+        )
+
+    succeeded = sum(1 for result in results if result)
+    print(f"\n完成: 成功 {succeeded}，失败 {len(results) - succeeded}")
+    return 0 if succeeded == len(results) else 1
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="知乎视频异步下载器 - 在一个进程中同时下载多个视频"
+    )
+    parser.add_argument("urls", nargs="+", help="知乎视频页面 URL 或视频 ID")
+    parser.add_argument("-o", "--output", default=".", help="输出目录 (默认为当前目录)")
+    parser.add_argument(
+        "-q", "--quality",
+        default="hd",
+        choices=["uhd", "fhd", "hd", "sd", "ld"],
+        help="视频清晰度 (默认: hd)"
+    )
+    parser.add_argument("-c", "--cookies", help="cookies 文件路径 (JSON 格式)，如果指定则优先使用")
+    parser.add_argument("--no-cookies", action="store_true", help="不使用任何 cookies")
+    parser.add_argument("-j", "--jobs", type=int, default=8, metavar="N",
+                        help="同时下载的视频数 (默认: 8)")
+    parser.add_argument(
+        "--segment-workers", type=int,
+        default=AsyncZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS, metavar="N",
+        help=f"每个 M3U8 视频同时下载的分片数 (默认: {AsyncZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS})"
+    )
+    parser.add_argument(
+        "--connections", type=int,
+        default=AsyncZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS, metavar="N",
+        help=f"每个 MP4 视频并发下载的连接数 (默认: {AsyncZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS})"
+    )
+    parser.add_argument(
+        "--per-host-limit", type=int,
+        default=AsyncZhihuVideoDownloader.DEFAULT_PER_HOST_LIMIT, metavar="N",
+        help=f"每个主机的连接数上限 (默认: {AsyncZhihuVideoDownloader.DEFAULT_PER_HOST_LIMIT})"
+    )
+    parser.add_argument("--resume", action="store_true",
+                        help="断点续传: 在输出文件旁边保存下载清单，中断后重新运行同一命令只下载缺失部分")
+    parser.add_argument("--fixed-concurrency", action="store_true",
+                        help="关闭自适应并发控制，始终使用指定的连接数")
+    parser.add_argument("--refresh", action="store_true", help="忽略已缓存的视频 ID 和播放列表")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"元数据缓存目录 (默认: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="不使用元数据缓存")
+
+    args = parser.parse_args()
+    return asyncio.run(_main_async(args))
+
+
+if __name__ == "__main__":
+    exit(main())
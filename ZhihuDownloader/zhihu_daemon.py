@@ -0,0 +1,460 @@
+#!/usr/bin/env python3
+"""
+知乎视频下载服务
+
+常驻进程，只创建一个 ZhihuVideoDownloader: cookies、连接池 (TLS 连接)、元数据缓存和
+自适应并发状态在所有任务之间共享，每个任务不再重复加载 cookies 和建立连接。
+任务通过本地 HTTP 接口 (TCP 或 Unix socket) 提交，由 DownloadScheduler 分别在解析和传输
+线程池中执行；priority 为 interactive (默认) 的任务排在 bulk 任务之前。
+
+接口 (请求和响应均为 JSON):
+
+- POST   /api/jobs         提交任务: {"url", "quality", "output_dir", "deadline", "priority", "start", "end"}，
+                           返回任务 (start / end 为片段的秒数或 "1:30" 形式的时间，只下载这一段)；
+                           未完成的任务达到 --max-queue 个时返回 503 (带 Retry-After)
+- GET    /api/jobs         列出任务 (可用 ?status=running 过滤)
+- GET    /api/jobs/{id}    任务状态和最新进度 (ProgressEvent)
+- DELETE /api/jobs/{id}    取消任务: 排队中的任务直接取消，下载中的任务在下一个数据块之后停止
+- GET    /api/metrics      性能统计 (DownloadMetrics.snapshot，cdn_hosts 为各 CDN 主机的延迟和吞吐量)
+- GET    /api/health       服务状态
+
+使用方法:
+    python zhihu_daemon.py [--port 8765] [--unix-socket PATH] [-j 3] [-o 输出目录]
+
+    curl -X POST localhost:8765/api/jobs -d '{"url": "视频URL", "quality": "fhd"}'
+    curl localhost:8765/api/jobs/<任务ID>
+    curl -X DELETE localhost:8765/api/jobs/<任务ID>
+"""
+
+import os
+import re
+import json
+import time
+import queue
+import argparse
+import threading
+import socketserver
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse, parse_qs
+
+from zhihu_downloader import (
+    DEFAULT_CACHE_DIR,
+    ClipRange,
+    DownloadScheduler,
+    DownloadTask,
+    ZhihuVideoDownloader,
+    _parse_clip_time,
+)
+
+
+# 默认监听端口
+DEFAULT_PORT = 8765
+
+# 任务状态 (见 DownloadTask)
+JOB_STATUSES = ("queued", "resolving", "resolved", "running", "done", "failed", "cancelled")
+
+# 接口中可以使用的优先级名称
+PRIORITY_NAMES = {
+    "interactive": DownloadScheduler.PRIORITY_INTERACTIVE,
+    "bulk": DownloadScheduler.PRIORITY_BULK,
+}
+
+
+class DownloadService:
+    """
+    任务队列: 用 DownloadScheduler 执行任务 (所有任务共享同一个下载器)，保存任务状态供接口查询
+    
+    接口提交的任务默认为交互式优先级，会插到排队的批量任务之前。
+    已结束的任务最多保留 FINISHED_JOBS_LIMIT 个 (最早结束的先删除)，未完成的任务最多 max_queued 个，
+    长时间运行时内存占用不变。
+    """
+    
+    FINISHED_JOBS_LIMIT = 1000
+    
+    # 未完成 (排队、解析和下载中) 的任务数上限，达到后拒绝新任务
+    DEFAULT_MAX_QUEUED = 1000
+    
+    def __init__(self, downloader: ZhihuVideoDownloader, jobs: int = 3,
+                 output_dir: str = ".",
+                 resolve_workers: int = DownloadScheduler.DEFAULT_RESOLVE_WORKERS,
+                 max_queued: int = DEFAULT_MAX_QUEUED):
+        """
+        Args:
+            downloader: 所有任务共享的下载器
+            jobs: 同时下载的视频数
+            output_dir: 任务没有指定输出目录时使用的目录
+            resolve_workers: 同时解析的视频数
+            max_queued: 未完成的任务数上限
+        """
+        self.downloader = downloader
+        self.output_dir = output_dir
+        self.started_at = time.time()
+        self._jobs: "OrderedDict[str, DownloadTask]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.scheduler = DownloadScheduler(
+            downloader, jobs, resolve_workers, max_pending=max(1, max_queued),
+            on_finish=self._on_finish
+        )
+        self.jobs = self.scheduler.transfer_workers
+    
+    def submit(self, url: str, quality: str = "hd", output_dir: Optional[str] = None,
+               deadline: Optional[float] = None,
+               priority: int = DownloadScheduler.PRIORITY_INTERACTIVE,
+               clip: Optional[ClipRange] = None) -> DownloadTask:
+        """
+        提交任务，立即返回 (任务在调度器中排队)
+        
+        Raises:
+            queue.Full: 未完成的任务已达到 max_queued 个
+        """
+        task = DownloadTask(
+            url=url,
+            output_dir=output_dir or self.output_dir,
+            quality=quality,
+            priority=priority,
+            deadline=deadline,
+            clip=clip,
+        )
+        with self._lock:
+            self._jobs[task.id] = task
+        try:
+            return self.scheduler.submit(task)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[task.id]
+            raise
+    
+    def get(self, job_id: str) -> Optional[DownloadTask]:
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def list(self, status: Optional[str] = None) -> List[DownloadTask]:
+        with self._lock:
+            return [task for task in self._jobs.values() if not status or task.status == status]
+    
+    def cancel(self, job_id: str) -> Optional[DownloadTask]:
+        """取消任务，任务不存在时返回 None"""
+        task = self.get(job_id)
+        if task:
+            self.scheduler.cancel(task)
+        return task
+    
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                status: sum(1 for task in self._jobs.values() if task.status == status)
+                for status in JOB_STATUSES
+            }
+    
+    def shutdown(self):
+        """取消所有任务，等待正在下载的任务停止"""
+        for task in self.list():
+            self.scheduler.cancel(task)
+        self.scheduler.close()
+    
+    def _on_finish(self, task: DownloadTask):
+        with self._lock:
+            finished = [job_id for job_id, item in self._jobs.items() if item.finished]
+            for job_id in finished[:max(0, len(finished) - self.FINISHED_JOBS_LIMIT)]:
+                del self._jobs[job_id]
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    """HTTP 接口: 按路径分发到任务操作"""
+    
+    protocol_version = "HTTP/1.1"
+    service: DownloadService = None
+    
+    # 请求体大小上限
+    MAX_BODY_SIZE = 64 * 1024
+    
+    # 队列已满时建议客户端等待的秒数 (Retry-After)
+    QUEUE_FULL_RETRY_AFTER = 30
+    
+    ROUTES = [
+        ("GET", re.compile(r"^/api/health$"), "_handle_health"),
+        ("GET", re.compile(r"^/api/metrics$"), "_handle_metrics"),
+        ("GET", re.compile(r"^/api/jobs$"), "_handle_list"),
+        ("POST", re.compile(r"^/api/jobs$"), "_handle_submit"),
+        ("GET", re.compile(r"^/api/jobs/([0-9a-f]+)$"), "_handle_get"),
+        ("DELETE", re.compile(r"^/api/jobs/([0-9a-f]+)$"), "_handle_cancel"),
+    ]
+    
+    def do_GET(self):
+        self._dispatch("GET")
+    
+    def do_POST(self):
+        self._dispatch("POST")
+    
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+    
+    def log_message(self, *args):
+        pass
+    
+    def _dispatch(self, method: str):
+        parsed = urlparse(self.path)
+        self.query = parse_qs(parsed.query)
+        
+        path_matched = False
+        for route_method, pattern, name in self.ROUTES:
+            match = pattern.match(parsed.path)
+            if not match:
+                continue
+            path_matched = True
+            if route_method == method:
+                try:
+                    getattr(self, name)(*match.groups())
+                except ValueError as e:
+                    self._send_json({"error": str(e)}, 400)
+                except queue.Full as e:
+                    self._send_json(
+                        {"error": str(e)}, 503,
+                        {"Retry-After": str(self.QUEUE_FULL_RETRY_AFTER)}
+                    )
+                return
+        
+        if path_matched:
+            self._send_json({"error": "method not allowed"}, 405)
+        else:
+            self._send_json({"error": "not found"}, 404)
+    
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > self.MAX_BODY_SIZE:
+            raise ValueError("请求体过大")
+        body = self.rfile.read(length) if length else b"{}"
+        try:
+            data = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise ValueError("请求体不是有效的 JSON")
+        if not isinstance(data, dict):
+            raise ValueError("请求体应为 JSON 对象")
+        return data
+    
+    def _send_json(self, data: Any, status: int = 200,
+                   headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    # ---- 接口 ----
+    
+    def _handle_health(self):
+        service = self.service
+        self._send_json({
+            "status": "ok",
+            "uptime": round(time.time() - service.started_at, 1),
+            "jobs": service.counts(),
+        })
+    
+    def _handle_metrics(self):
+        downloader = self.service.downloader
+        metrics = downloader.metrics.snapshot()
+        metrics["cdn_hosts"] = downloader.cdn_hosts.snapshot()
+        self._send_json(metrics)
+    
+    def _handle_list(self):
+        status = self.query.get("status", [None])[0]
+        if status and status not in JOB_STATUSES:
+            raise ValueError(f"未知的任务状态: {status}")
+        self._send_json([job.to_dict() for job in self.service.list(status)])
+    
+    def _handle_submit(self):
+        data = self._read_json()
+        url = str(data.get("url") or "").strip()
+        if not url:
+            raise ValueError("缺少 url")
+        quality = data.get("quality") or "hd"
+        if quality not in ZhihuVideoDownloader.QUALITY_ORDER + ["auto"]:
+            raise ValueError(f"未知的清晰度: {quality}")
+        deadline = data.get("deadline")
+        if deadline is not None and (not isinstance(deadline, (int, float)) or deadline <= 0):
+            raise ValueError("deadline 应为正数 (秒)")
+        priority = data.get("priority", "interactive")
+        if isinstance(priority, str):
+            if priority not in PRIORITY_NAMES:
+                raise ValueError(f"未知的优先级: {priority}")
+            priority = PRIORITY_NAMES[priority]
+        elif not isinstance(priority, int):
+            raise ValueError("priority 应为 interactive、bulk 或整数 (数值小的先执行)")
+        start, end = self._clip_time(data, "start"), self._clip_time(data, "end")
+        clip = None
+        if start is not None or end is not None:
+            if start is not None and end is not None and end <= start:
+                raise ValueError("end 必须晚于 start")
+            clip = ClipRange(start or 0.0, end)
+        
+        job = self.service.submit(
+            url, quality, data.get("output_dir"), deadline, priority, clip
+        )
+        self._send_json(job.to_dict(), 201)
+    
+    @staticmethod
+    def _clip_time(data: Dict[str, Any], name: str) -> Optional[float]:
+        """片段时间: 秒数或 "1:30" 形式的字符串"""
+        value = data.get(name)
+        if value is None:
+            return None
+        if isinstance(value, str):
+            try:
+                return _parse_clip_time(value)
+            except argparse.ArgumentTypeError as e:
+                raise ValueError(str(e))
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+            raise ValueError(f"{name} 应为非负秒数或 \"分:秒\" 形式的时间")
+        return float(value)
+    
+    def _handle_get(self, job_id: str):
+        job = self.service.get(job_id)
+        if not job:
+            self._send_json({"error": "job not found"}, 404)
+            return
+        self._send_json(job.to_dict())
+    
+    def _handle_cancel(self, job_id: str):
+        job = self.service.cancel(job_id)
+        if not job:
+            self._send_json({"error": "job not found"}, 404)
+            return
+        self._send_json(job.to_dict())
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """监听 Unix socket 的 HTTP 服务器"""
+    
+    daemon_threads = True
+    
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler 需要 (host, port) 形式的客户端地址
+        return request, ("local", 0)
+
+
+def create_server(service: DownloadService, host: str = "127.0.0.1",
+                  port: int = DEFAULT_PORT,
+                  unix_socket: Optional[str] = None) -> socketserver.BaseServer:
+    """
+    创建 HTTP 服务器 (调用 serve_forever 开始处理请求)
+    
+    Args:
+        service: 任务队列
+        host: 监听地址
+        port: 监听端口，0 表示随机端口
+        unix_socket: Unix socket 路径，指定时不监听 TCP 端口
+    """
+    handler = type("Handler", (_ApiHandler,), {"service": service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        server = _UnixHTTPServer(unix_socket, handler)
+        # 只允许当前用户访问
+        os.chmod(unix_socket, 0o600)
+        return server
+    
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="知乎视频下载服务 - 保持一个已登录的下载器，通过本地 HTTP 接口接收下载任务"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址 (默认: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"监听端口 (默认: {DEFAULT_PORT})")
+    parser.add_argument("--unix-socket", metavar="PATH",
+                        help="监听 Unix socket 而不是 TCP 端口")
+    parser.add_argument("-o", "--output", default=".", help="默认输出目录 (默认为当前目录)")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_COURSE_JOBS,
+        metavar="N",
+        help=f"同时下载的视频数 (默认: {ZhihuVideoDownloader.DEFAULT_COURSE_JOBS})"
+    )
+    parser.add_argument(
+        "--resolve-workers",
+        type=int,
+        default=DownloadScheduler.DEFAULT_RESOLVE_WORKERS,
+        metavar="N",
+        help=f"同时解析的视频数 (默认: {DownloadScheduler.DEFAULT_RESOLVE_WORKERS})"
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=DownloadService.DEFAULT_MAX_QUEUED,
+        metavar="N",
+        help=f"未完成的任务数上限，达到后新提交的任务返回 503 (默认: {DownloadService.DEFAULT_MAX_QUEUED})"
+    )
+    parser.add_argument("-c", "--cookies", help="cookies 文件路径 (JSON 格式)，如果指定则优先使用")
+    parser.add_argument("--no-cookies", action="store_true",
+                        help="不使用任何 cookies (仅能下载免费公开视频)")
+    parser.add_argument(
+        "--segment-workers",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS,
+        metavar="N",
+        help=f"M3U8 分片并发下载线程数 (默认: {ZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS})"
+    )
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS,
+        metavar="N",
+        help=f"MP4 视频并发下载的连接数 (默认: {ZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS})"
+    )
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help=f"元数据缓存目录 (默认: {DEFAULT_CACHE_DIR})")
+    parser.add_argument("--no-cache", action="store_true", help="不使用元数据缓存")
+    parser.add_argument("--resume", action="store_true",
+                        help="断点续传: 取消或失败的任务重新提交时只下载缺失部分")
+    parser.add_argument("--pipe-remux", action="store_true",
+                        help="M3U8 分片下载后直接写入 ffmpeg，不占用临时磁盘空间")
+    
+    args = parser.parse_args()
+    
+    downloader = ZhihuVideoDownloader(
+        use_chrome_cookies=not (args.no_cookies or args.cookies),
+        cookie_file=None if args.no_cookies else args.cookies,
+        segment_workers=args.segment_workers,
+        resume=args.resume,
+        mp4_connections=args.connections,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        pipe_remux=args.pipe_remux,
+        parallel_videos=args.jobs,
+    )
+    service = DownloadService(
+        downloader, args.jobs, args.output, args.resolve_workers, args.max_queue
+    )
+    try:
+        server = create_server(service, args.host, args.port, args.unix_socket)
+    except OSError as e:
+        print(f"⚠ 无法启动服务: {e}")
+        return 1
+    
+    address = args.unix_socket or f"http://{args.host}:{server.server_address[1]}"
+    print(f"✓ 下载服务已启动: {address} (同时下载 {service.jobs} 个视频)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n正在停止下载服务...")
+    finally:
+        server.server_close()
+        service.shutdown()
+        if args.unix_socket and os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -6,8 +6,9 @@
 
 依赖:
     - requests
-    - browser_cookie3  (用于从 Chrome 读取 cookies，需要 macOS Keychain 授权)
-    - m3u8
+    - browser_cookie3  (仅从 Chrome 读取 cookies 时需要，需要 macOS Keychain 授权)
+    - m3u8 (仅下载 M3U8 视频时需要)
+    - cryptography 或 pycryptodome (仅下载加密的 M3U8 视频时需要，未安装时交给 ffmpeg 解密)
     - ffmpeg (系统命令行工具)
 
 使用方法:
@@ -19,34 +20,49 @@
 
 import os
 import re
+import sys
 import json
+import time
+import math
+import uuid
+import queue
+import random
+import hashlib
 import argparse
+import threading
 import subprocess
 import tempfile
 import shutil
+import sqlite3
+import contextlib
+import weakref
+import itertools
+import struct
+import bisect
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed, wait, FIRST_COMPLETED
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-from urllib.parse import urlparse, urljoin
-from dataclasses import dataclass
+from typing import Optional, Dict, Any, List, Tuple, Callable
+from urllib.parse import urlparse, urljoin, parse_qs
+from dataclasses import dataclass, field, asdict
+from email.utils import parsedate_to_datetime
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
 except ImportError:
     print("请安装 requests: pip install requests")
     exit(1)
 
-try:
-    import browser_cookie3
-except ImportError:
-    print("请安装 browser_cookie3: pip install browser-cookie3")
-    print("注意: 首次运行时需要授权访问 macOS Keychain")
-    exit(1)
+# browser_cookie3 (及其加密库依赖)、m3u8 和 AES 解密库导入较慢，只在用到时才导入:
+# 见 CookieLoader.load_chrome、_load_m3u8_module 和 _load_aes_cbc
 
-try:
-    import m3u8
-except ImportError:
-    print("请安装 m3u8: pip install m3u8")
-    exit(1)
+
+# 默认缓存目录 (元数据缓存等)
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+    "zhihu_downloader"
+)
 
 
 @dataclass
@@ -69,357 +85,4189 @@ class DownloadOption:
     size: Optional[int] = None
 
 
-class ZhihuVideoDownloader:
-    """知乎视频下载器"""
+@dataclass
+class ClipRange:
+    """只下载视频中的一段 (--start / --end)"""
+    start: float = 0.0  # 秒
+    end: Optional[float] = None  # 秒，None 表示到视频结尾
     
-    # 知乎视频 API
-    LENS_API_BASE = "https://lens.zhihu.com/api/v4/videos"
+    @property
+    def label(self) -> str:
+        """用于文件名和断点续传清单的片段描述，如 10m00s-15m00s"""
+        end = _format_clip_time(self.end) if self.end is not None else "end"
+        return f"{_format_clip_time(self.start)}-{end}"
     
-    # 请求头
-    HEADERS = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "application/json, text/plain, */*",
-        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-        "Referer": "https://www.zhihu.com/",
-        "Origin": "https://www.zhihu.com",
-    }
+    def duration(self, total: float) -> float:
+        """
+        片段时长 (秒)
+        
+        Args:
+            total: 视频时长 (秒)，0 表示未知 (此时没有结束时间的片段时长为 0)
+        """
+        end = self.end if self.end is not None else total
+        if total > 0:
+            end = min(end, total)
+        return max(0.0, end - self.start)
+    
+    @staticmethod
+    def seek_args(offset: float) -> List[str]:
+        """ffmpeg 定位参数 (放在 -i 之前时为输入端定位，从之前最近的关键帧开始)"""
+        return ["-ss", f"{offset:.3f}"] if offset > 0 else []
+    
+    def length_args(self) -> List[str]:
+        """ffmpeg 输出时长参数"""
+        return ["-t", f"{self.end - self.start:.3f}"] if self.end is not None else []
+
+
+@dataclass
+class ResolvedDownload:
+    """解析完成、等待传输的下载 (见 ZhihuVideoDownloader.resolve_download)"""
+    video_info: VideoInfo
+    option: Optional[DownloadOption]  # None 表示复用已下载的文件，不需要传输
+    output_path: str
+    clip: Optional[ClipRange] = None  # 只下载其中一段
+
+
+@dataclass
+class DownloadTask:
+    """DownloadScheduler 中的一个下载任务"""
+    url: str
+    output_dir: str = "."
+    quality: str = "hd"
+    priority: int = 10  # 数值小的先执行 (见 DownloadScheduler.PRIORITY_*)
+    deadline: Optional[float] = None  # 自动清晰度的时间预算 (秒)
+    clip: Optional[ClipRange] = None  # 只下载其中一段
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"  # queued / resolving / resolved / running / done / failed / cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    path: Optional[str] = None
+    error: Optional[str] = None
+    progress: Optional[Dict[str, Any]] = None  # 最新的 ProgressEvent
     
-    def __init__(self, use_chrome_cookies: bool = True, cookie_file: str = None):
+    def __post_init__(self):
+        self.cancel_event = threading.Event()
+        self.resolved: Optional[ResolvedDownload] = None
+        self.holds_slot = False
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class ProgressEvent:
+    """下载进度事件 (传给 progress_callback，或以 JSON Lines 写入 --progress-fd)"""
+    video_id: str
+    title: str
+    phase: str  # download / remux / verify / done / failed / cancelled
+    timestamp: float
+    elapsed: float  # 秒
+    bytes_done: int
+    bytes_total: Optional[int] = None
+    segments_done: int = 0
+    segments_total: Optional[int] = None
+    media_time: Optional[float] = None  # ffmpeg 已处理的媒体时长 (秒)
+    duration: Optional[float] = None  # 视频时长 (秒)
+    instant_bps: float = 0.0  # 最近 RATE_WINDOW 秒的下载速度 (字节/秒)
+    average_bps: float = 0.0  # 本次运行的平均下载速度 (字节/秒)
+    eta: Optional[float] = None  # 预计剩余时间 (秒)
+    percent: Optional[float] = None
+
+
+class DownloadCancelled(Exception):
+    """下载被取消 (ProgressTracker 的 cancel_event 被设置)"""
+
+
+class ProgressTracker:
+    """
+    统计一个视频的下载进度并发出 ProgressEvent
+    
+    - 已下载字节数、分片数、瞬时/平均速度和预计剩余时间
+    - 瞬时速度只保留最近 RATE_WINDOW 秒内最多 MAX_SAMPLES 个采样点，长视频占用的内存不变
+    - 事件最多每 EMIT_INTERVAL 秒发出一次；阶段变化和结束时立即发出
+    - 下载停滞时每 HEARTBEAT_INTERVAL 秒仍会发出事件 (瞬时速度逐渐降为 0)，
+      调度程序可以据此发现卡住的任务
+    - cancel_event 被设置后，下载线程下一次报告进度时抛出 DownloadCancelled
+    
+    可以在多个下载线程中同时调用。
+    """
+    
+    EMIT_INTERVAL = 0.5
+    HEARTBEAT_INTERVAL = 2.0
+    RATE_WINDOW = 5.0
+    MAX_SAMPLES = 64
+    
+    def __init__(self, callback, video_id: str = "", title: str = "",
+                 duration: Optional[float] = None,
+                 cancel_event: Optional[threading.Event] = None):
         """
-        初始化下载器
+        Args:
+            callback: 接收 ProgressEvent 的回调函数 (可以为 None)
+            video_id: 视频 ID
+            title: 视频标题
+            duration: 视频时长 (秒)，用于在只知道 ffmpeg 处理进度时估算剩余时间
+            cancel_event: 取消下载的事件 (可选)
+        """
+        self.callback = callback
+        self.cancel_event = cancel_event
+        self.video_id = video_id
+        self.title = title
+        self.duration = duration or None
+        self.phase = "download"
+        self.bytes_done = 0
+        self.bytes_total: Optional[int] = None
+        self.segments_done = 0
+        self.segments_total: Optional[int] = None
+        self.media_time: Optional[float] = None
+        
+        self._started = time.monotonic()
+        self._transferred = 0
+        self._samples = deque(maxlen=self.MAX_SAMPLES)
+        self._last_emit = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._heartbeat = threading.Thread(target=self._run_heartbeat, daemon=True)
+        self._heartbeat.start()
+    
+    def set_total(self, bytes_total: Optional[int] = None,
+                  segments_total: Optional[int] = None):
+        with self._lock:
+            if bytes_total is not None:
+                self.bytes_total = bytes_total
+            if segments_total is not None:
+                self.segments_total = segments_total
+    
+    def advance(self, size: int, segments: int = 0, transferred: bool = True):
+        """
+        记录新完成的数据
         
         Args:
-            use_chrome_cookies: 是否使用 Chrome 的 cookies 进行鉴权
-            cookie_file: 手动提供的 cookies 文件路径 (JSON 格式)
+            size: 字节数
+            segments: 完成的分片数
+            transferred: 为 False 表示断点续传时已有的数据，不计入下载速度
         """
-        self.session = requests.Session()
-        self.session.headers.update(self.HEADERS)
+        self.check_cancelled()
+        with self._lock:
+            self.bytes_done += size
+            self.segments_done += segments
+            if transferred:
+                self._transferred += size
+                now = time.monotonic()
+                # 同一时刻的采样合并，采样点数量与下载速度无关
+                if self._samples and now - self._samples[-1][0] < self.RATE_WINDOW / self.MAX_SAMPLES:
+                    self._samples[-1] = (self._samples[-1][0], self._transferred)
+                else:
+                    self._samples.append((now, self._transferred))
+        self._emit()
+    
+    def set_transferred(self, bytes_done: int):
+        """记录累计下载的字节数 (ffmpeg 直接下载时从其统计信息中获得)"""
+        with self._lock:
+            delta = bytes_done - self.bytes_done
+        if delta > 0:
+            self.advance(delta)
+    
+    def set_media_time(self, seconds: float):
+        """记录 ffmpeg 已处理的媒体时长"""
+        self.check_cancelled()
+        with self._lock:
+            self.media_time = seconds
+        self._emit()
+    
+    def set_phase(self, phase: str):
+        self.check_cancelled()
+        with self._lock:
+            self.phase = phase
+            self.media_time = None
+        self._emit(force=True)
+    
+    def finish(self, success: bool):
+        """发出最后一个事件并停止心跳线程"""
+        self._stopped.set()
+        with self._lock:
+            if success:
+                self.phase = "done"
+            elif self.cancelled:
+                self.phase = "cancelled"
+            else:
+                self.phase = "failed"
+        self._emit(force=True)
+    
+    @property
+    def cancelled(self) -> bool:
+        return bool(self.cancel_event and self.cancel_event.is_set())
+    
+    def check_cancelled(self):
+        """下载已被取消时抛出 DownloadCancelled"""
+        if self.cancelled:
+            raise DownloadCancelled("下载已取消")
+    
+    def snapshot(self) -> ProgressEvent:
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._started
+            
+            # 丢弃时间窗口之外的采样，停滞时瞬时速度随之下降
+            while self._samples and now - self._samples[0][0] > self.RATE_WINDOW:
+                self._samples.popleft()
+            if self._samples:
+                oldest_time, oldest_bytes = self._samples[0]
+                window = max(now - oldest_time, self.RATE_WINDOW / self.MAX_SAMPLES)
+                instant_bps = (self._transferred - oldest_bytes) / window
+            else:
+                instant_bps = 0.0
+            average_bps = self._transferred / elapsed if elapsed > 0 else 0.0
+            
+            percent, eta = self._estimate(elapsed, instant_bps or average_bps)
+            return ProgressEvent(
+                video_id=self.video_id,
+                title=self.title,
+                phase=self.phase,
+                timestamp=time.time(),
+                elapsed=round(elapsed, 3),
+                bytes_done=self.bytes_done,
+                bytes_total=self.bytes_total,
+                segments_done=self.segments_done,
+                segments_total=self.segments_total,
+                media_time=self.media_time,
+                duration=self.duration,
+                instant_bps=round(instant_bps, 1),
+                average_bps=round(average_bps, 1),
+                eta=round(eta, 1) if eta is not None else None,
+                percent=round(percent, 2) if percent is not None else None,
+            )
+    
+    def _estimate(self, elapsed: float, rate: float) -> Tuple[Optional[float], Optional[float]]:
+        """估算完成百分比和剩余时间"""
+        if self.phase == "done":
+            return 100.0, 0.0
         
-        if cookie_file:
-            self._load_cookies_from_file(cookie_file)
-        elif use_chrome_cookies:
-            self._load_chrome_cookies()
+        # 按分片下载时总大小未知，用已完成分片的平均大小估算
+        bytes_total = self.bytes_total
+        if not bytes_total and self.segments_total and self.segments_done:
+            bytes_total = self.bytes_done / self.segments_done * self.segments_total
+        
+        if self.phase == "download" and bytes_total:
+            percent = min(100.0, self.bytes_done / bytes_total * 100)
+            eta = (bytes_total - self.bytes_done) / rate if rate > 0 else None
+            return percent, eta
+        
+        # 只知道 ffmpeg 的处理进度 (直接下载或合并阶段)
+        if self.duration and self.media_time:
+            percent = min(100.0, self.media_time / self.duration * 100)
+            eta = (self.duration - self.media_time) * elapsed / self.media_time
+            return percent, max(0.0, eta)
+        
+        return None, None
     
-    def _load_cookies_from_file(self, cookie_file: str):
-        """从文件加载 cookies"""
-        print(f"正在从文件加载 cookies: {cookie_file}")
+    def _emit(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_emit < self.EMIT_INTERVAL:
+            return
+        self._last_emit = now
+        if self.callback:
+            self.callback(self.snapshot())
+    
+    def _run_heartbeat(self):
+        while not self._stopped.wait(self.HEARTBEAT_INTERVAL):
+            if time.monotonic() - self._last_emit >= self.HEARTBEAT_INTERVAL:
+                self._emit(force=True)
+
+
+class JsonLinesProgressWriter:
+    """把 ProgressEvent 以 JSON Lines 格式写入文件描述符，供外部调度程序读取"""
+    
+    def __init__(self, fd: int):
+        self.fd = fd
+        self._lock = threading.Lock()
+        self._broken = False
+    
+    def __call__(self, event: ProgressEvent):
+        if self._broken:
+            return
+        line = json.dumps(asdict(event), ensure_ascii=False) + "\n"
+        with self._lock:
+            try:
+                os.write(self.fd, line.encode("utf-8"))
+            except OSError as e:
+                # 读取端已关闭时不再写入，不影响下载
+                self._broken = True
+                print(f"\n⚠ 写入进度事件失败: {e}")
+
+
+class DownloadMetrics:
+    """
+    下载过程的性能统计
+    
+    - 各阶段 (页面、API 探测、播放列表、分片/MP4 传输、ffmpeg) 的次数和耗时
+    - 每个主机的请求数、状态码、错误数、重试次数、下载字节数和响应延迟直方图
+    
+    可以导出为 JSON 或 Prometheus 文本格式。可以在多个线程中同时使用。
+    """
+    
+    # 响应延迟 (收到响应头的耗时) 直方图的桶上限，秒
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+    
+    def __init__(self):
+        self.started_at = time.time()
+        self._phases: Dict[str, Dict[str, float]] = {}
+        self._hosts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """统计一个阶段的耗时 (with 语句)"""
+        start = time.monotonic()
         try:
-            with open(cookie_file, 'r') as f:
-                cookies_data = json.load(f)
-            
-            for cookie in cookies_data:
-                self.session.cookies.set(
-                    cookie.get('name'),
-                    cookie.get('value'),
-                    domain=cookie.get('domain', '.zhihu.com')
+            yield
+        finally:
+            self.record_phase(name, time.monotonic() - start)
+    
+    def record_phase(self, name: str, seconds: float):
+        with self._lock:
+            phase = self._phases.setdefault(name, {"count": 0, "seconds": 0.0, "max": 0.0})
+            phase["count"] += 1
+            phase["seconds"] += seconds
+            phase["max"] = max(phase["max"], seconds)
+    
+    def _host(self, host: str) -> Dict[str, Any]:
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "bytes": 0,
+                "statuses": {},
+                "latency_buckets": [0] * (len(self.LATENCY_BUCKETS) + 1),
+                "latency_sum": 0.0,
+            }
+            self._hosts[host] = stats
+        return stats
+    
+    def record_request(self, host: str, status: Optional[int], latency: float):
+        """记录一次请求，请求异常 (没有响应) 时 status 为 None"""
+        with self._lock:
+            stats = self._host(host)
+            stats["requests"] += 1
+            if status is None:
+                stats["errors"] += 1
+                return
+            key = str(status)
+            stats["statuses"][key] = stats["statuses"].get(key, 0) + 1
+            bucket = next(
+                (i for i, bound in enumerate(self.LATENCY_BUCKETS) if latency <= bound),
+                len(self.LATENCY_BUCKETS)
+            )
+            stats["latency_buckets"][bucket] += 1
+            stats["latency_sum"] += latency
+    
+    def record_bytes(self, host: str, size: int):
+        with self._lock:
+            self._host(host)["bytes"] += size
+    
+    def record_retry(self, host: str):
+        with self._lock:
+            self._host(host)["retries"] += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """当前统计数据 (可以直接序列化为 JSON)"""
+        with self._lock:
+            return {
+                "started_at": self.started_at,
+                "elapsed": round(time.time() - self.started_at, 3),
+                "phases": {
+                    name: {
+                        "count": phase["count"],
+                        "seconds": round(phase["seconds"], 3),
+                        "max": round(phase["max"], 3),
+                    }
+                    for name, phase in self._phases.items()
+                },
+                "hosts": {
+                    host: {
+                        **{key: value for key, value in stats.items()
+                           if key not in ("statuses", "latency_buckets", "latency_sum")},
+                        "statuses": dict(stats["statuses"]),
+                        "latency": {
+                            "buckets": dict(zip(
+                                [str(bound) for bound in self.LATENCY_BUCKETS] + ["+Inf"],
+                                stats["latency_buckets"]
+                            )),
+                            "sum": round(stats["latency_sum"], 3),
+                            "p50": self._latency_quantile(stats, 0.5),
+                            "p95": self._latency_quantile(stats, 0.95),
+                        },
+                    }
+                    for host, stats in self._hosts.items()
+                },
+            }
+    
+    def _latency_quantile(self, stats: Dict[str, Any], q: float) -> Optional[float]:
+        """从直方图估算分位数 (返回所在桶的上限，超出最大的桶时返回 None)"""
+        buckets = stats["latency_buckets"]
+        total = sum(buckets)
+        if not total:
+            return None
+        seen = 0
+        for bound, count in zip(self.LATENCY_BUCKETS, buckets):
+            seen += count
+            if seen >= total * q:
+                return bound
+        return None
+    
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus 文本格式"""
+        def label(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP zhihu_phase_seconds_total 各阶段累计耗时",
+            "# TYPE zhihu_phase_seconds_total counter",
+        ]
+        for name, phase in snapshot["phases"].items():
+            lines.append(f'zhihu_phase_seconds_total{{phase="{label(name)}"}} {phase["seconds"]}')
+        lines += [
+            "# HELP zhihu_phase_runs_total 各阶段执行次数",
+            "# TYPE zhihu_phase_runs_total counter",
+        ]
+        for name, phase in snapshot["phases"].items():
+            lines.append(f'zhihu_phase_runs_total{{phase="{label(name)}"}} {phase["count"]}')
+        
+        counters = (
+            ("zhihu_http_errors_total", "errors", "没有收到响应的请求数"),
+            ("zhihu_http_retries_total", "retries", "重试次数"),
+            ("zhihu_http_received_bytes_total", "bytes", "下载的字节数"),
+        )
+        for metric, key, description in counters:
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter"]
+            for host, stats in snapshot["hosts"].items():
+                lines.append(f'{metric}{{host="{label(host)}"}} {stats[key]}')
+        
+        lines += [
+            "# HELP zhihu_http_responses_total 按状态码统计的响应数",
+            "# TYPE zhihu_http_responses_total counter",
+        ]
+        for host, stats in snapshot["hosts"].items():
+            for status, count in stats["statuses"].items():
+                lines.append(
+                    f'zhihu_http_responses_total{{host="{label(host)}",status="{status}"}} {count}'
                 )
-            
-            print(f"✓ 成功加载 {len(cookies_data)} 个 cookies")
-        except Exception as e:
-            print(f"⚠ 加载 cookies 文件失败: {e}")
+        
+        lines += [
+            "# HELP zhihu_http_response_seconds 收到响应头的耗时",
+            "# TYPE zhihu_http_response_seconds histogram",
+        ]
+        for host, stats in snapshot["hosts"].items():
+            cumulative = 0
+            for bound, count in stats["latency"]["buckets"].items():
+                cumulative += count
+                lines.append(
+                    f'zhihu_http_response_seconds_bucket{{host="{label(host)}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'zhihu_http_response_seconds_sum{{host="{label(host)}"}} {stats["latency"]["sum"]}')
+            lines.append(f'zhihu_http_response_seconds_count{{host="{label(host)}"}} {cumulative}')
+        
+        return "\n".join(lines) + "\n"
     
-    def _load_chrome_cookies(self):
-        """从 Chrome 加载 cookies"""
-        print("正在从 Chrome 读取 cookies...")
-        print("注意: 可能需要授权访问 macOS Keychain，请在弹出的对话框中点击「允许」")
+    def print_summary(self):
+        """打印各阶段耗时和每个主机的请求统计"""
+        snapshot = self.snapshot()
+        print(f"\n性能统计 (总耗时 {snapshot['elapsed']:.1f} 秒):")
+        
+        if snapshot["phases"]:
+            print(f"  {'阶段':<20}{'次数':>6}{'总耗时(秒)':>12}{'最长(秒)':>10}")
+            for name, phase in sorted(snapshot["phases"].items(), key=lambda item: -item[1]["seconds"]):
+                print(f"  {name:<20}{phase['count']:>6}{phase['seconds']:>12.2f}{phase['max']:>10.2f}")
         
+        if snapshot["hosts"]:
+            print(f"\n  {'主机':<32}{'请求':>6}{'错误':>6}{'重试':>6}{'下载(MB)':>10}  延迟 p50/p95  状态码")
+            for host, stats in snapshot["hosts"].items():
+                latency = stats["latency"]
+                quantiles = "/".join(
+                    f"≤{value:g}s" if value is not None else "-"
+                    for value in (latency["p50"], latency["p95"])
+                )
+                statuses = " ".join(f"{status}×{count}" for status, count in sorted(stats["statuses"].items()))
+                print(
+                    f"  {host[:31]:<32}{stats['requests']:>6}{stats['errors']:>6}{stats['retries']:>6}"
+                    f"{stats['bytes'] / 1024 / 1024:>10.1f}  {quantiles:<12}  {statuses}"
+                )
+
+
+class DownloadManifest:
+    """
+    断点续传清单
+    
+    以 JSON 格式保存在输出文件旁边 (``<输出文件>.manifest.json``)，
+    记录已完成的 M3U8 分片或 MP4 字节范围及其大小和 SHA-256 校验值，
+    重新运行时只下载缺失的部分。
+    """
+    
+    VERSION = 1
+    
+    # 两次写盘之间的最短间隔 (秒)，避免分片很多时频繁重写清单
+    SAVE_INTERVAL = 1.0
+    
+    def __init__(self, output_path: str, source: str):
+        """
+        Args:
+            output_path: 最终输出文件路径
+            source: 下载来源标识 (视频 ID + 清晰度)，来源变化时清单作废
+        """
+        self.output_path = output_path
+        self.path = output_path + ".manifest.json"
+        self.source = source
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._data = self._load()
+    
+    @property
+    def segments_dir(self) -> str:
+        """M3U8 分片的保存目录"""
+        return self.output_path + ".segments"
+    
+    @property
+    def part_path(self) -> str:
+        """MP4 未完成文件路径"""
+        return self.output_path + ".part"
+    
+    @property
+    def total_size(self) -> Optional[int]:
+        return self._data.get("total_size")
+    
+    @total_size.setter
+    def total_size(self, value: Optional[int]):
+        with self._lock:
+            if value != self._data.get("total_size"):
+                # 文件大小变化说明来源已不同，之前的字节范围作废
+                self._data["total_size"] = value
+                self._data["ranges"] = []
+    
+    def _empty(self) -> Dict[str, Any]:
+        return {
+            "version": self.VERSION,
+            "source": self.source,
+            "total_size": None,
+            "segments": {},
+            "ranges": [],
+        }
+    
+    def _load(self) -> Dict[str, Any]:
         try:
-            # 获取知乎相关的 cookies
-            cookies = browser_cookie3.chrome(domain_name=".zhihu.com")
-            self.session.cookies.update(cookies)
-            
-            # 验证是否获取到关键的认证 cookies
-            cookie_names = [c.name for c in self.session.cookies]
-            required_cookies = ["z_c0"]  # 知乎的关键认证 cookie
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self._empty()
+        
+        if data.get("version") != self.VERSION or data.get("source") != self.source:
+            print("⚠ 断点续传清单与当前视频不匹配，重新开始下载")
+            return self._empty()
+        
+        return data
+    
+    def save(self, force: bool = True):
+        """写入清单 (先写临时文件再替换，避免中断时损坏)"""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._last_save < self.SAVE_INTERVAL:
+                return
+            self._last_save = now
             
-            has_auth = any(name in cookie_names for name in required_cookies)
-            if has_auth:
-                print("✓ 成功获取认证 cookies")
-            else:
-                print("⚠ 未找到认证 cookies，可能需要先在 Chrome 中登录知乎")
-                
-        except Exception as e:
-            print(f"⚠ 读取 Chrome cookies 失败: {e}")
-            print("请确保已安装 browser-cookie3 并授权访问 Keychain")
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f)
+            os.replace(tmp_path, self.path)
     
-    def _extract_video_id_from_url(self, url: str) -> Optional[str]:
+    def clear_ranges(self):
+        with self._lock:
+            self._data["ranges"] = []
+    
+    def discard(self):
+        """下载完成后删除清单"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+    
+    def has_progress(self) -> bool:
+        return bool(self._data["segments"] or self._data["ranges"])
+    
+    # ---- M3U8 分片 ----
+    
+    def is_segment_done(self, index: int, uri: str, path: str) -> bool:
+        """检查分片是否已完整下载 (大小和校验值都要一致)"""
+        entry = self._data["segments"].get(str(index))
+        if not entry or entry.get("uri") != uri:
+            return False
+        
+        try:
+            if os.path.getsize(path) != entry["size"]:
+                return False
+            with open(path, 'rb') as f:
+                return _sha256_of_stream(f, entry["size"]) == entry["sha256"]
+        except OSError:
+            return False
+    
+    def mark_segment(self, index: int, uri: str, size: int, sha256: str):
+        with self._lock:
+            self._data["segments"][str(index)] = {
+                "uri": uri,
+                "size": size,
+                "sha256": sha256,
+            }
+        self.save(force=False)
+    
+    # ---- MP4 字节范围 ----
+    
+    def verify_ranges(self, path: str):
+        """丢弃与未完成文件内容不一致的字节范围"""
+        valid = []
+        try:
+            with open(path, 'rb') as f:
+                for entry in self._data["ranges"]:
+                    f.seek(entry["start"])
+                    if _sha256_of_stream(f, entry["size"]) == entry["sha256"]:
+                        valid.append(entry)
+        except OSError:
+            pass
+        
+        with self._lock:
+            self._data["ranges"] = valid
+    
+    def mark_range(self, start: int, size: int, sha256: str):
+        with self._lock:
+            self._data["ranges"].append({
+                "start": start,
+                "end": start + size - 1,
+                "size": size,
+                "sha256": sha256,
+            })
+        self.save(force=False)
+    
+    def completed_bytes(self) -> int:
+        return sum(entry["size"] for entry in self._data["ranges"])
+    
+    def missing_ranges(self) -> List[Tuple[int, int]]:
         """
-        从知乎页面 URL 中提取视频 ID
+        计算尚未下载的字节范围
         
-        支持的 URL 格式:
-        - 直接的 lens video ID (数字或加密格式，不包含 http)
-        - https://www.zhihu.com/zvideo/{video_id} - 普通知乎视频
+        Returns:
+            (起始, 结束) 列表，结束位置包含在内
+        """
+        total = self.total_size
+        if not total:
+            return []
         
-        注意: 训练营视频 URL 需要通过 _get_video_info_from_page 获取真正的视频 ID
+        missing = []
+        position = 0
+        for entry in sorted(self._data["ranges"], key=lambda r: r["start"]):
+            if entry["start"] > position:
+                missing.append((position, entry["start"] - 1))
+            position = max(position, entry["end"] + 1)
+        if position < total:
+            missing.append((position, total - 1))
+        
+        return missing
+
+
+def _parse_content_range_total(content_range: Optional[str]) -> Optional[int]:
+    """从 ``Content-Range: bytes 0-99/1000`` 中解析文件总大小"""
+    if not content_range or "/" not in content_range:
+        return None
+    total = content_range.rsplit("/", 1)[1].strip()
+    return int(total) if total.isdigit() else None
+
+
+class MetadataCache:
+    """
+    视频元数据缓存
+    
+    使用 SQLite 保存解析结果，每条记录带有过期时间:
+    - ``page:<URL>`` / ``section:<小节ID>`` -> 视频 ID、标题、时长
+    - ``video:<视频ID>`` -> 播放列表 (按签名 play_url 的过期时间提前失效)
+    
+    同一个数据库可以被多个线程和进程同时使用。
+    """
+    
+    # 页面/小节到视频 ID 的映射基本不变，缓存 7 天
+    PAGE_TTL = 7 * 24 * 3600
+    
+    # 无法从 play_url 中解析过期时间时，播放列表的缓存时间
+    PLAYLIST_TTL = 30 * 60
+    
+    # 签名 play_url 在过期前这么多秒就不再使用，留出下载时间
+    PLAY_URL_MARGIN = 10 * 60
+    
+    def __init__(self, cache_dir: str, refresh: bool = False):
         """
-        # 如果是 URL，解析它
-        if url.startswith("http"):
-            parsed = urlparse(url)
-            
-            # 普通知乎视频页面: /zvideo/{video_id}
-            if "/zvideo/" in parsed.path:
-                path_parts = parsed.path.rstrip("/").split("/")
-                for i, part in enumerate(path_parts):
-                    if part == "zvideo" and i + 1 < len(path_parts):
-                        return path_parts[i + 1]
-            
-            # 训练营视频 URL 需要通过页面获取，返回 None
+        Args:
+            cache_dir: 缓存目录
+            refresh: 为 True 时忽略已有缓存 (仍会写入新的结果)
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "metadata.sqlite3")
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (time.time(),))
+    
+    def get(self, key: str) -> Optional[Any]:
+        """读取未过期的缓存，不存在、已过期或 refresh 模式下返回 None"""
+        if self.refresh:
             return None
         
-        # 如果不是 URL，检查是否是直接的视频 ID
-        # 数字 ID 或加密的视频 ID（不含 / 和 :）
-        if url.isdigit():
-            return url
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM entries WHERE key = ? AND expires_at >= ?",
+                (key, time.time())
+            ).fetchone()
         
-        # 加密的视频 ID 格式：字母数字和下划线，长度较长，不含特殊 URL 字符
-        if len(url) > 30 and "/" not in url and ":" not in url:
-            return url
+        return json.loads(row[0]) if row else None
+    
+    def set(self, key: str, value: Any, ttl: float):
+        """写入缓存，ttl 秒后过期"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time() + ttl)
+            )
+    
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+    
+    def playlist_ttl(self, playlist: Dict[str, Any]) -> float:
+        """根据播放列表中签名 play_url 的最早过期时间计算缓存时间"""
+        expiries = [
+            _play_url_expiry(item.get("play_url", ""))
+            for item in playlist.values() if isinstance(item, dict)
+        ]
+        expiries = [expiry for expiry in expiries if expiry]
+        if not expiries:
+            return self.PLAYLIST_TTL
         
-        return None
+        return max(0.0, min(expiries) - self.PLAY_URL_MARGIN - time.time())
+
+
+class DownloadStore:
+    """
+    已下载视频索引
     
-    def _get_video_info_from_page(self, url: str) -> Optional[Dict[str, Any]]:
+    按 (视频 ID, 清晰度) 记录下载完成的文件路径、大小和 SHA-256。同一个视频再次下载时
+    (例如从不同课程的 URL 进入) 直接复用已有文件，输出目录不同时创建硬链接 (跨文件系统时
+    复制)，不经过网络。
+    
+    与 MetadataCache 保存在同一个缓存目录，可以被多个线程和进程同时使用。
+    """
+    
+    def __init__(self, cache_dir: str):
         """
-        从知乎页面获取视频信息
+        Args:
+            cache_dir: 缓存目录
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "downloads.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, video_id TEXT NOT NULL, quality TEXT NOT NULL, "
+                "size INTEGER NOT NULL, sha256 TEXT NOT NULL, mtime_ns INTEGER NOT NULL, "
+                "added_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS files_video ON files (video_id, quality)"
+            )
+    
+    def add(self, video_id: str, quality: str, path: str, sha256: Optional[str] = None):
+        """
+        记录下载完成的文件
         
-        对于训练营视频，需要先获取页面内容，提取 lens video ID
+        Args:
+            sha256: 已知的校验值 (复用已有文件时)，None 表示读取文件计算
         """
-        print(f"正在获取页面信息...")
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        if sha256 is None:
+            with open(path, 'rb') as f:
+                sha256 = _sha256_of_stream(f, stat.st_size)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files "
+                "(path, video_id, quality, size, sha256, mtime_ns, added_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, video_id, quality, stat.st_size, sha256, stat.st_mtime_ns, time.time())
+            )
+    
+    def remove(self, path: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (os.path.abspath(path),))
+    
+    def owner(self, path: str) -> Optional[Tuple[str, str]]:
+        """返回记录中该文件对应的 (视频 ID, 清晰度)，未记录时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT video_id, quality FROM files WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+    
+    def find(self, video_id: str,
+             qualities: List[str]) -> Optional[Tuple[str, str, str]]:
+        """
+        查找已下载且未被修改的文件
+        
+        Args:
+            video_id: 视频 ID
+            qualities: 可以接受的清晰度，按优先级排列
         
+        Returns:
+            (文件路径, 清晰度, SHA-256)，没有可用文件时返回 None
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, quality, size, sha256, mtime_ns FROM files WHERE video_id = ?",
+                (video_id,)
+            ).fetchall()
+        
+        for quality in qualities:
+            for path, row_quality, size, sha256, mtime_ns in rows:
+                if row_quality != quality:
+                    continue
+                if self._is_intact(path, size, sha256, mtime_ns):
+                    return path, quality, sha256
+                # 文件已被删除或修改
+                self.remove(path)
+        return None
+    
+    def _is_intact(self, path: str, size: int, sha256: str, mtime_ns: int) -> bool:
+        """大小一致且修改时间未变时认为文件完好，修改时间变化时重新计算校验值"""
         try:
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            html_content = response.text
-            
+            stat = os.stat(path)
+            if stat.st_size != size:
+                return False
+            if stat.st_mtime_ns == mtime_ns:
+                return True
+            with open(path, 'rb') as f:
+                if _sha256_of_stream(f, size) != sha256:
+                    return False
+        except OSError:
+            return False
+        
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET mtime_ns = ? WHERE path = ?", (stat.st_mtime_ns, path)
+            )
+        return True
+
+# 被认为是限流的响应状态码
+_THROTTLE_STATUSES = (429, 503)
+
+# Retry-After 的最长等待时间 (秒)
+_MAX_RETRY_AFTER = 120.0
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头 (秒数或 HTTP 日期)，返回需要等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return min(float(value), _MAX_RETRY_AFTER)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if retry_at is None:
+        return None
+    return min(max(0.0, retry_at.timestamp() - time.time()), _MAX_RETRY_AFTER)
+
+
+def _is_throttled(status: Optional[int], retry_after: Optional[float]) -> bool:
+    """
+    响应是否为限流: 429/503，或带有 Retry-After 的 403
+    
+    不带 Retry-After 的 403 通常是播放地址签名过期 (由 PlayUrlSource 刷新地址)，与主机负载无关，
+    不计入限流。
+    """
+    return status in _THROTTLE_STATUSES or (status == 403 and retry_after is not None)
+
+
+class HostWindow:
+    """
+    单个主机的 AIMD 并发窗口
+    
+    - 慢启动: 第一次被限流之前，每个健康的响应使窗口加 1 (每轮翻倍)
+    - 加性增: 之后每个健康的响应使窗口加 1/窗口 (每轮加 1)
+    - 乘性减: 限流响应 (429/503，以及带 Retry-After 的 403) 使窗口减半，同一轮发出的请求只减一次
+    - Retry-After: 在指定时间之前不再向该主机发出新请求
+    
+    响应延迟明显高于基准延迟、近期错误率过高或窗口没有用满时，窗口保持不变。
+    不带 Retry-After 的 403 (签名过期) 只释放位置，不影响窗口和错误率。
+    """
+    
+    # 响应延迟不超过 基准延迟 * LATENCY_TOLERANCE + LATENCY_SLACK 时认为健康
+    LATENCY_TOLERANCE = 2.0
+    LATENCY_SLACK = 0.05
+    
+    # 基准延迟向较慢样本靠拢的速度，网络状况变化后基准可以慢慢恢复
+    BASE_LATENCY_DRIFT = 0.01
+    
+    # 近期错误率 (指数平均) 超过此值时不再扩大窗口
+    MAX_ERROR_RATE = 0.1
+    ERROR_RATE_WEIGHT = 0.1
+    
+    def __init__(self, host: str, initial: int, minimum: int, maximum: int):
+        self.host = host
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self.slow_start = True
+        self.blocked_until = 0.0
+        self.base_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+    
+    def acquire(self) -> float:
+        """等待窗口中的空位 (以及 Retry-After 到期)，返回请求开始时间"""
+        with self._cond:
+            while True:
+                delay = self.blocked_until - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                elif self.in_flight < int(self.limit):
+                    break
+                else:
+                    self._cond.wait()
+            self.in_flight += 1
+            return time.time()
+    
+    def try_acquire(self) -> Optional[float]:
+        """
+        不等待的 acquire (供 asyncio 下载器轮询): 有空位时占用并返回请求开始时间，否则返回 None
+        """
+        with self._cond:
+            if self.blocked_until > time.time() or self.in_flight >= int(self.limit):
+                return None
+            self.in_flight += 1
+            return time.time()
+    
+    def release(self, started: float, latency: float, status: Optional[int],
+                retry_after: Optional[float] = None):
+        """
+        释放窗口中的位置并根据响应调整窗口
+        
+        Args:
+            started: acquire 返回的请求开始时间
+            latency: 收到响应头的耗时 (秒)
+            status: 响应状态码，请求异常时为 None
+            retry_after: 响应头 Retry-After 要求等待的秒数
+        """
+        with self._cond:
+            was_full = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            
+            if _is_throttled(status, retry_after):
+                self._record_error(True)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, time.time() + retry_after)
+                # 窗口减半之前发出的请求收到的限流响应不再重复减半
+                if started >= self._last_decrease:
+                    self._decrease(status, retry_after)
+            elif status == 403:
+                # 签名过期，与主机负载无关
+                pass
+            elif status is None or status >= 500:
+                self._record_error(True)
+            else:
+                self._record_error(False)
+                healthy = self._observe_latency(latency)
+                if (healthy and was_full and started >= self._last_decrease
+                        and self.error_rate <= self.MAX_ERROR_RATE):
+                    self._increase()
+            
+            self._cond.notify_all()
+    
+    def _record_error(self, failed: bool):
+        self.error_rate += ((1.0 if failed else 0.0) - self.error_rate) * self.ERROR_RATE_WEIGHT
+    
+    def _observe_latency(self, latency: float) -> bool:
+        if self.base_latency is None or latency < self.base_latency:
+            self.base_latency = latency
+        else:
+            self.base_latency += (latency - self.base_latency) * self.BASE_LATENCY_DRIFT
+        return latency <= self.base_latency * self.LATENCY_TOLERANCE + self.LATENCY_SLACK
+    
+    def _increase(self):
+        if self.slow_start:
+            self.limit += 1
+        else:
+            self.limit += 1 / self.limit
+        self.limit = min(self.limit, float(self.maximum))
+    
+    def _decrease(self, status: int, retry_after: Optional[float]):
+        self.slow_start = False
+        self.limit = max(float(self.minimum), self.limit / 2)
+        self._last_decrease = time.time()
+        
+        message = f"⚠ {self.host} 返回 {status}，并发窗口降为 {int(self.limit)}"
+        if retry_after:
+            message += f"，{retry_after:.0f} 秒后继续"
+        print(message)
+
+
+class ConcurrencyGovernor:
+    """
+    按主机划分的自适应并发控制器
+    
+    下载器的所有 HTTP 请求都经过 GovernedAdapter，在发出前占用目标主机
+    HostWindow 中的一个位置，因此多个线程、多个视频同时下载时共享同一个窗口。
+    """
+    
+    # 每个主机的默认初始并发窗口 (下载器使用 max(此值, 分片线程数, 连接数))
+    INITIAL_WINDOW = 4
+    
+    # 并发窗口的范围
+    MIN_WINDOW = 1
+    MAX_WINDOW = 64
+    
+    def __init__(self, initial: int = INITIAL_WINDOW, maximum: int = MAX_WINDOW):
+        self.initial = min(max(self.MIN_WINDOW, initial), maximum)
+        self.maximum = maximum
+        self._windows: Dict[str, HostWindow] = {}
+        self._lock = threading.Lock()
+    
+    def window(self, host: str) -> HostWindow:
+        with self._lock:
+            window = self._windows.get(host)
+            if window is None:
+                window = HostWindow(host, self.initial, self.MIN_WINDOW, self.maximum)
+                self._windows[host] = window
+            return window
+    
+    def snapshot(self) -> Dict[str, int]:
+        """各主机当前的并发窗口大小"""
+        with self._lock:
+            return {host: int(window.limit) for host, window in self._windows.items()}
+
+
+class GovernedAdapter(HTTPAdapter):
+    """
+    经过 ConcurrencyGovernor 控制并发、并在 DownloadMetrics 中记录请求统计的 HTTPAdapter
+    
+    请求占用的窗口位置在响应体读完 (连接归还连接池) 或响应关闭时才释放，
+    流式下载的大文件在整个传输期间都计入并发数。governor 和 metrics 都可以为 None。
+    """
+    
+    # 幂等请求收到 429/503 时，等待窗口 (和 Retry-After) 后自动重试的次数
+    THROTTLE_RETRIES = 2
+    
+    def __init__(self, governor: Optional[ConcurrencyGovernor] = None,
+                 metrics: Optional[DownloadMetrics] = None, **kwargs):
+        self.governor = governor
+        self.metrics = metrics
+        super().__init__(**kwargs)
+    
+    def send(self, request, stream=False, **kwargs):
+        host = urlparse(request.url).netloc
+        window = self.governor.window(host) if self.governor else None
+        retries = self.THROTTLE_RETRIES if request.method in ("GET", "HEAD") else 0
+        
+        while True:
+            started = window.acquire() if window else time.time()
+            try:
+                response = super().send(request, stream=stream, **kwargs)
+            except Exception:
+                latency = time.time() - started
+                if window:
+                    window.release(started, latency, None)
+                if self.metrics:
+                    self.metrics.record_request(host, None, latency)
+                raise
+            latency = time.time() - started
+            
+            status = response.status_code
+            if self.metrics:
+                self.metrics.record_request(host, status, latency)
+                self._count_body_bytes(response, host)
+            if not window:
+                return response
+            
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            if not _is_throttled(status, retry_after):
+                self._release_with_body(response, window, started, latency)
+                return response
+            
+            window.release(started, latency, status, retry_after)
+            if status == 403 or retries <= 0:
+                return response
+            
+            retries -= 1
+            if self.metrics:
+                self.metrics.record_retry(host)
+            response.close()
+    
+    def _count_body_bytes(self, response, host: str):
+        """读取响应体时把字节数记入统计 (包括流式读取)"""
+        raw = response.raw
+        read = raw.read
+        metrics = self.metrics
+        
+        def counting_read(*args, **kwargs):
+            data = read(*args, **kwargs)
+            if data:
+                metrics.record_bytes(host, len(data))
+            return data
+        
+        raw.read = counting_read
+    
+    @staticmethod
+    def _release_with_body(response, window: HostWindow, started: float, latency: float):
+        """响应体读完或响应被关闭/回收时释放窗口位置 (只释放一次)"""
+        status = response.status_code
+        once = threading.Lock()
+        
+        def release():
+            if once.acquire(blocking=False):
+                window.release(started, latency, status)
+        
+        raw = response.raw
+        release_conn = raw.release_conn
+        
+        def release_conn_and_window():
+            release()
+            release_conn()
+        
+        raw.release_conn = release_conn_and_window
+        weakref.finalize(raw, release)
+
+
+class IncompleteResponseError(requests.RequestException):
+    """响应体比 Content-Length (或请求的字节范围) 短，通常是连接中途断开"""
+
+
+# 下载分片 / 字节范围时不重试的状态码 (请求无效、资源不存在)
+_PERMANENT_STATUSES = (400, 401, 404, 410)
+
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    下载失败是否可能是暂时性的 (网络错误、不完整的响应、服务器错误、限流)
+    
+    同时适用于 requests 的异常和带有 status 属性的 aiohttp.ClientResponseError
+    """
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return response.status_code not in _PERMANENT_STATUSES
+    status = getattr(error, "status", None)
+    if isinstance(status, int):
+        return status not in _PERMANENT_STATUSES
+    return True
+
+
+def _backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """第 attempt 次重试 (从 0 开始) 前的等待秒数: 指数退避，并在 [0, 上限] 内随机抖动"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _expected_length(response) -> Optional[int]:
+    """响应的 Content-Length，压缩传输 (解压后长度不同) 或没有该响应头时返回 None"""
+    if response.headers.get("Content-Encoding", "identity") != "identity":
+        return None
+    value = response.headers.get("Content-Length", "")
+    return int(value) if value.isdigit() else None
+
+
+def _check_length(response, received: int):
+    """收到的字节数少于 Content-Length 时抛出 IncompleteResponseError"""
+    expected = _expected_length(response)
+    if expected is not None and received != expected:
+        raise IncompleteResponseError(
+            f"响应不完整: 收到 {received} 字节，应为 {expected} 字节", response=response
+        )
+
+
+class StalledTransferError(requests.RequestException):
+    """传输速率在一个检测窗口内低于卡顿阈值 (见 HostTransfer)"""
+
+
+class HostFailoverError(requests.RequestException):
+    """CDN 主机请求失败，还有其他健康的主机，可以立即换一个主机重试"""
+
+
+def _host_group(hostname: str) -> str:
+    """
+    CDN 主机分组，同一组的主机提供相同的路径，可以互相替换
+    
+    域名按最后两级分组 (vdn.vzuu.com 和 vdn3.vzuu.com 为同一组)，IP 地址按 IP 分组
+    (同一 IP 的不同端口为同一组)
+    """
+    hostname = hostname.lower()
+    labels = hostname.split(".")
+    if ":" in hostname or hostname.replace(".", "").isdigit() or len(labels) <= 2:
+        return hostname
+    return ".".join(labels[-2:])
+
+
+class HostTransfer:
+    """
+    一次 CDN 请求: 记录首字节延迟和传输字节数，按字节速率检测卡顿
+    
+    由 CdnHostSelector.transfer 创建。请求使用 timeout (连接超时, 检测窗口)，一个检测窗口内
+    完全没有数据时由 requests 超时；有数据但每个窗口的平均速率低于 stall_bps 时抛出
+    StalledTransferError。只在收到数据块之间检查，不需要额外的线程。
+    """
+    
+    def __init__(self, url: str, original_url: str, probe: bool,
+                 stall_bps: float, stall_window: float, connect_timeout: float):
+        self.url = url
+        self.original_url = original_url
+        self.host = urlparse(url).netloc
+        self.probe = probe
+        self.stall_bps = stall_bps
+        self.stall_window = stall_window
+        self.timeout = (connect_timeout, stall_window)
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.first_byte: Optional[float] = None
+        self._window_start = self.started
+        self._window_bytes = 0
+    
+    @property
+    def rewritten(self) -> bool:
+        """请求是否发往了其他主机 (不是播放地址中的主机)"""
+        return self.url != self.original_url
+    
+    def start(self):
+        """收到响应头时调用"""
+        self.first_byte = self._window_start = time.monotonic()
+    
+    def add(self, size: int):
+        """
+        收到一个数据块时调用
+        
+        Raises:
+            StalledTransferError: 上一个检测窗口的平均速率低于卡顿阈值
+        """
+        self.bytes += size
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.stall_window:
+            return
+        rate = (self.bytes - self._window_bytes) / elapsed
+        if rate < self.stall_bps:
+            raise StalledTransferError(
+                f"{self.host} 传输卡顿: {rate / 1024:.0f} KB/s，"
+                f"低于 {self.stall_bps / 1024:.0f} KB/s"
+            )
+        self._window_start, self._window_bytes = now, self.bytes
+
+
+class CdnHostSelector:
+    """
+    CDN 主机选择和故障转移
+    
+    知乎的播放地址和分片地址指向具体的 CDN 节点，同一域名下的节点提供相同的路径。
+    从播放列表 (所有清晰度) 和 M3U8 分片地址中收集主机，按请求记录每个主机的首字节延迟
+    和单连接吞吐量 (指数移动平均)，新的请求发往预计耗时最短的健康主机:
+    
+    - 没有样本或样本已过期的主机会被探测 (每个主机同时只有一个探测请求)
+    - 连接失败、超时、5xx/429 和传输卡顿的主机暂停使用一段时间，连续失败时暂停时间加倍
+    - 请求发往其他主机后失败 (包括 403/404)，或原主机失败且有其他健康的主机时抛出
+      HostFailoverError，调用方立即换主机重试
+    
+    可以在多个线程中同时使用。
+    """
+    
+    # 指数移动平均中新样本的权重
+    EWMA_WEIGHT = 0.3
+    
+    # 估计请求耗时使用的响应大小 (典型的分片大小)
+    REFERENCE_BYTES = 1024 * 1024
+    
+    # 小于此大小的响应只计入延迟，不计入吞吐量
+    MIN_THROUGHPUT_BYTES = 64 * 1024
+    
+    # 样本超过这么多秒的主机重新探测
+    REPROBE_INTERVAL = 60
+    
+    # 请求失败后暂停使用该主机的秒数: 从 COOLDOWN_BASE 开始连续失败时加倍，最长 COOLDOWN_MAX
+    COOLDOWN_BASE = 5
+    COOLDOWN_MAX = 120
+    
+    # 卡顿检测: 每 STALL_WINDOW 秒的平均速率低于同组最快主机吞吐量的 STALL_FRACTION
+    # (至少 STALL_MIN_BPS) 时视为卡顿；STALL_WINDOW 秒完全没有数据时请求超时
+    STALL_WINDOW = 15
+    STALL_FRACTION = 0.1
+    STALL_MIN_BPS = 16 * 1024
+    
+    # 建立连接的超时 (秒)
+    CONNECT_TIMEOUT = 10
+    
+    def __init__(self):
+        self._hosts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def add_urls(self, urls):
+        """记录 URL 中的 CDN 主机"""
+        netlocs = {
+            parsed.netloc for parsed in map(urlparse, urls)
+            if parsed.scheme in ("http", "https") and parsed.hostname
+        }
+        with self._lock:
+            for netloc in netlocs:
+                self._host(netloc)
+    
+    def add_playlist(self, playlist: Any):
+        """记录播放列表 (所有清晰度，包括其中的备用地址) 中出现的 CDN 主机"""
+        urls = []
+        
+        def walk(node: Any):
+            if isinstance(node, dict):
+                for value in node.values():
+                    walk(value)
+            elif isinstance(node, list):
+                for value in node:
+                    walk(value)
+            elif isinstance(node, str) and node.startswith(("http://", "https://")):
+                urls.append(node)
+        
+        walk(playlist)
+        self.add_urls(urls)
+    
+    @contextlib.contextmanager
+    def transfer(self, url: str):
+        """
+        为 url 选择主机，返回 HostTransfer (使用其中的 url 和 timeout 发出请求)
+        
+        正常结束时记录延迟和吞吐量；抛出 requests.RequestException 时记录失败，
+        需要换主机时改为抛出 HostFailoverError
+        """
+        transfer = self._begin(url)
+        try:
+            yield transfer
+        except requests.RequestException as e:
+            if self._fail(transfer, e):
+                raise HostFailoverError(
+                    f"CDN 主机 {transfer.host} 请求失败 ({e})，切换到其他主机"
+                ) from e
+            raise
+        except BaseException:
+            self._end(transfer)
+            raise
+        self._succeed(transfer)
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """各主机的统计 (延迟、吞吐量、失败次数、是否可用)"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                netloc: {
+                    "group": stats["group"],
+                    "latency_ms": round(stats["latency"] * 1000, 1) if stats["latency"] is not None else None,
+                    "mb_per_s": round(stats["bps"] / 1024 / 1024, 2) if stats["bps"] else None,
+                    "requests": stats["requests"],
+                    "failures": stats["failures"],
+                    "healthy": stats["cooldown_until"] <= now,
+                }
+                for netloc, stats in self._hosts.items()
+            }
+    
+    def _host(self, netloc: str) -> Dict[str, Any]:
+        """主机的统计 (调用时需持有锁)"""
+        stats = self._hosts.get(netloc)
+        if stats is None:
+            stats = self._hosts[netloc] = {
+                "group": _host_group(urlparse("//" + netloc).hostname or netloc),
+                "latency": None, "bps": None, "updated": None,
+                "requests": 0, "failures": 0, "consecutive_failures": 0,
+                "cooldown_until": 0.0, "probing": False,
+            }
+        return stats
+    
+    def _score(self, stats: Dict[str, Any]) -> float:
+        """预计的请求耗时 (秒)，没有样本时为无穷大"""
+        if stats["latency"] is None:
+            return math.inf
+        return stats["latency"] + (self.REFERENCE_BYTES / stats["bps"] if stats["bps"] else 0)
+    
+    def _begin(self, url: str) -> HostTransfer:
+        parsed = urlparse(url)
+        now = time.monotonic()
+        with self._lock:
+            group = self._host(parsed.netloc)["group"]
+            candidates = [
+                (netloc, stats) for netloc, stats in self._hosts.items()
+                if stats["group"] == group and stats["cooldown_until"] <= now
+            ]
+            
+            chosen, probe = parsed.netloc, False
+            stale = [
+                netloc for netloc, stats in candidates
+                if not stats["probing"] and (
+                    stats["updated"] is None or now - stats["updated"] > self.REPROBE_INTERVAL
+                )
+            ]
+            if stale:
+                chosen, probe = stale[0], True
+                self._hosts[chosen]["probing"] = True
+            elif candidates:
+                # 预计耗时相同时使用原主机
+                chosen = min(
+                    candidates, key=lambda item: (self._score(item[1]), item[0] != parsed.netloc)
+                )[0]
+            
+            self._hosts[chosen]["requests"] += 1
+            best_bps = max((stats["bps"] or 0 for _, stats in candidates), default=0)
+        
+        return HostTransfer(
+            url if chosen == parsed.netloc else parsed._replace(netloc=chosen).geturl(),
+            url, probe,
+            max(self.STALL_MIN_BPS, best_bps * self.STALL_FRACTION),
+            self.STALL_WINDOW, self.CONNECT_TIMEOUT
+        )
+    
+    def _end(self, transfer: HostTransfer) -> Dict[str, Any]:
+        """请求结束 (调用时需持有锁)"""
+        stats = self._hosts[transfer.host]
+        if transfer.probe:
+            stats["probing"] = False
+        return stats
+    
+    def _succeed(self, transfer: HostTransfer):
+        now = time.monotonic()
+        with self._lock:
+            stats = self._end(transfer)
+            stats["consecutive_failures"] = 0
+            stats["updated"] = now
+            
+            latency = (transfer.first_byte or now) - transfer.started
+            stats["latency"] = self._average(stats["latency"], latency)
+            if transfer.first_byte and transfer.bytes >= self.MIN_THROUGHPUT_BYTES:
+                bps = transfer.bytes / max(now - transfer.first_byte, 1e-3)
+                stats["bps"] = self._average(stats["bps"], bps)
+    
+    def _fail(self, transfer: HostTransfer, error: requests.RequestException) -> bool:
+        """
+        记录失败
+        
+        Returns:
+            是否应该立即换主机重试
+        """
+        response = getattr(error, "response", None)
+        status = response.status_code if isinstance(error, requests.HTTPError) and response is not None else None
+        # 原主机的 4xx (签名过期、资源不存在) 与主机的状态无关，由调用方按状态码处理
+        host_error = status is None or status >= 500 or status == 429
+        if not (host_error or transfer.rewritten):
+            with self._lock:
+                self._end(transfer)
+            return False
+        
+        now = time.monotonic()
+        with self._lock:
+            stats = self._end(transfer)
+            stats["failures"] += 1
+            stats["consecutive_failures"] += 1
+            stats["updated"] = now
+            cooldown = min(
+                self.COOLDOWN_MAX,
+                self.COOLDOWN_BASE * 2 ** (stats["consecutive_failures"] - 1)
+            )
+            stats["cooldown_until"] = now + cooldown
+            if transfer.rewritten:
+                return True
+            return any(
+                other["group"] == stats["group"] and other["cooldown_until"] <= now
+                for other in self._hosts.values()
+            )
+    
+    def _average(self, current: Optional[float], sample: float) -> float:
+        if current is None:
+            return sample
+        return current + self.EWMA_WEIGHT * (sample - current)
+
+
+# play_url 中可能表示过期时间 (Unix 时间戳) 的查询参数
+_EXPIRY_PARAMS = ("expiration", "expires", "Expires", "x-expires", "deadline")
+
+
+def _play_url_expiry(play_url: str) -> Optional[float]:
+    """
+    从签名 play_url 中解析过期时间
+    
+    支持 ``expiration=``/``expires=`` 等参数，以及 CDN 鉴权参数
+    ``auth_key=<过期时间戳>-<随机数>-<uid>-<签名>``。
+    
+    Returns:
+        过期时间的 Unix 时间戳，无法解析时返回 None
+    """
+    query = parse_qs(urlparse(play_url).query)
+    
+    candidates = [query[name][0] for name in _EXPIRY_PARAMS if name in query]
+    if "auth_key" in query:
+        candidates.append(query["auth_key"][0].split("-", 1)[0])
+    
+    for value in candidates:
+        if value.isdigit():
+            timestamp = int(value)
+            # 毫秒时间戳
+            if timestamp > 10 ** 12:
+                timestamp //= 1000
+            return float(timestamp)
+    
+    return None
+
+
+class PlayUrlSource:
+    """
+    下载过程中可以刷新的签名播放地址
+    
+    知乎返回的 play_url (以及 M3U8 分片地址) 带有过期时间。下载时间较长或断点续传时，
+    地址可能在下载中途过期，之后的请求返回 403。收到 403 时调用 refresh_after_forbidden，
+    判断是否由签名过期导致，是则通过 resolve 重新获取播放地址 (M3U8 视频还会重新获取
+    播放列表并按分片序号找到对应的新分片地址)，下载线程用新地址从失败的位置继续。
+    
+    可以在多个线程中同时使用；多个线程同时收到 403 时只刷新一次。
+    """
+    
+    # 两次刷新之间的最短间隔 (秒)，刚刷新过的地址仍然返回 403 说明不是过期导致的
+    MIN_REFRESH_INTERVAL = 30
+    
+    # 签名过期时间在这么多秒之内时，把 403 视为过期导致的 (允许与服务器时钟有偏差)
+    EXPIRY_SKEW = 60
+    
+    def __init__(self, play_url: str, resolve: Optional[Callable[[], Optional[str]]] = None):
+        """
+        Args:
+            play_url: 当前的播放地址
+            resolve: 重新获取播放地址的函数，失败时返回 None；为 None 时不刷新
+        """
+        self.play_url = play_url
+        self.segment_urls: List[str] = []
+        self.generation = 0
+        self.refreshes = 0
+        self._resolve = resolve
+        self._match_segments: Optional[Callable[[str], Optional[List[str]]]] = None
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    def set_segments(self, segment_urls: List[str],
+                     match_segments: Optional[Callable[[str], Optional[List[str]]]] = None):
+        """
+        设置 M3U8 分片地址
+        
+        Args:
+            segment_urls: 按播放顺序排列的分片地址
+            match_segments: 接收新的播放列表地址，返回与 segment_urls 一一对应的新分片地址，
+                无法对应时返回 None
+        """
+        with self._lock:
+            self.segment_urls = list(segment_urls)
+            self._match_segments = match_segments
+    
+    def refresh_after_forbidden(self, url: str, generation: int) -> bool:
+        """
+        请求 url 收到 403 后调用，签名已经 (或即将) 过期时获取新的播放地址
+        
+        Args:
+            url: 返回 403 的地址
+            generation: 发出请求时的 generation
+        
+        Returns:
+            True 表示已有新的地址，可以立即重试；False 表示 403 不是签名过期导致的或刷新失败
+        """
+        if not self._resolve:
+            return False
+        
+        with self._lock:
+            # 其他线程已经刷新过
+            if generation != self.generation:
+                return True
+            
+            expiry = _play_url_expiry(url) or _play_url_expiry(self.play_url)
+            if expiry is not None and expiry > time.time() + self.EXPIRY_SKEW:
+                return False
+            now = time.monotonic()
+            if self._refreshed_at is not None and now - self._refreshed_at < self.MIN_REFRESH_INTERVAL:
+                return False
+            self._refreshed_at = now
+            
+            play_url = self._resolve()
+            if not play_url:
+                return False
+            segment_urls = self.segment_urls
+            if self._match_segments:
+                segment_urls = self._match_segments(play_url)
+                if segment_urls is None:
+                    return False
+            
+            self.play_url = play_url
+            self.segment_urls = segment_urls
+            self.generation += 1
+            self.refreshes += 1
+            return True
+
+
+# 页面中嵌入初始状态 JSON 的位置 (按顺序查找，找到后从 "{" 开始解析)
+_PAGE_STATE_MARKERS = (
+    '<script id="js-initialData" type="text/json">',
+    '<script id="__NEXT_DATA__" type="application/json">',
+    'window.__INITIAL_STATE__',
+)
+
+# 训练营页面中直接包含视频资源的键 (只解析这些键对应的 JSON 片段)
+_PAGE_VIDEO_KEYS = ('"trainingVideo"', '"videoInfo"')
+
+_JSON_DECODER = json.JSONDecoder()
+
+# 视频 ID 的字符集
+_VIDEO_ID_RE = re.compile(r'[a-zA-Z0-9_-]{11,}')
+
+# 找不到初始状态 JSON 时的正则回退 (预编译，且限制每段通配的长度，
+# 避免在几 MB 的页面上大量回溯)。每个正则前是页面中必须出现的字符串，
+# 不出现时直接跳过，省去一次全文扫描。
+_VIDEO_ID_PATTERNS = [
+    # 加密视频 ID (训练营)
+    ('"resource"', re.compile(r'"resource"\s*:\s*\{[^}]{0,2000}?"data"\s*:\s*\{[^}]{0,2000}?"id"\s*:\s*"([a-zA-Z0-9_-]{20,})"')),
+    # 在更大的 JSON 结构中查找
+    ('"video"', re.compile(r'"id"\s*:\s*"([a-zA-Z0-9_-]{40,})"[^}]{0,2000}?"type"\s*:\s*"video"')),
+    ('"video"', re.compile(r'"type"\s*:\s*"video"[^}]{0,2000}?"data"\s*:\s*\{[^}]{0,2000}?"id"\s*:\s*"([a-zA-Z0-9_-]{20,})"')),
+    # 普通数字视频 ID
+    ('"video_id"', re.compile(r'"video_id"\s*:\s*"(\d+)"')),
+    ('data-lens-id', re.compile(r'data-lens-id="(\d+)"')),
+]
+_TITLE_PATTERN = re.compile(r'"title"\s*:\s*"([^"]+)"')
+_TRAINING_VIDEO_PATTERN = re.compile(
+    r'"videoInfo"\s*:\s*\{[^}]{0,2000}?"resource"\s*:\s*\{[^}]{0,2000}?"data"\s*:\s*\{[^}]{0,2000}?"id"\s*:\s*"([^"]+)"'
+)
+
+# 在视频资源前后查找标题的字符数
+_TITLE_WINDOW = 1024
+
+# __connectedAutoFetch.trainingVideo 之后最多搜索的字符数
+_TRAINING_VIDEO_WINDOW = 256 * 1024
+
+
+def extract_video_from_page(html_content: str) -> Optional[Dict[str, Any]]:
+    """
+    从知乎页面 HTML 中提取视频 ID 和标题
+    
+    先定位页面中嵌入的初始状态 JSON，用 JSON 解析器解析后直接查找视频资源；
+    找不到时再使用预编译的正则表达式回退。
+    
+    Returns:
+        包含 video_id/title/source 的字典，找不到时返回 None
+    """
+    # 训练营页面的视频数据位于固定的键下，只解析这一小段 JSON
+    for key in _PAGE_VIDEO_KEYS:
+        fragment = _load_json_after(html_content, key)
+        if fragment is not None:
+            page_info = _find_video_in_state(fragment)
+            if page_info:
+                return page_info
+    
+    # 其它页面: 逐个解析 "resource" 对象，找到视频资源即可，不必解析整个初始状态
+    page_info = _find_video_resource(html_content)
+    if page_info:
+        return page_info
+    
+    state = _load_page_state(html_content)
+    if state is not None:
+        page_info = _find_video_in_state(state)
+        if page_info:
+            return page_info
+    
+    for literal, pattern in _VIDEO_ID_PATTERNS:
+        if literal not in html_content:
+            continue
+        match = pattern.search(html_content)
+        # 过滤掉太短的 ID
+        if match and len(match.group(1)) > 10:
+            title_match = _TITLE_PATTERN.search(html_content)
+            return {
+                "video_id": match.group(1),
+                "title": title_match.group(1) if title_match else "",
+                "source": "regex",
+            }
+    
+    # 查找 __connectedAutoFetch 中的 trainingVideo 数据
+    anchor = html_content.find('"trainingVideo"')
+    if anchor != -1:
+        match = _TRAINING_VIDEO_PATTERN.search(
+            html_content, anchor, anchor + _TRAINING_VIDEO_WINDOW
+        )
+        if match:
+            return {"video_id": match.group(1), "title": "", "source": "trainingVideo"}
+    
+    return None
+
+
+def _load_json_after(html_content: str, key: str) -> Optional[Any]:
+    """解析页面中 ``"key": {...}`` 的 JSON 对象，找不到或解析失败时返回 None"""
+    position = html_content.find(key)
+    while position != -1:
+        start = position + len(key)
+        # 跳过空白和冒号，值必须是对象
+        while start < len(html_content) and html_content[start] in " \t\r\n:":
+            start += 1
+        if html_content.startswith("{", start):
+            try:
+                value, _ = _JSON_DECODER.raw_decode(html_content, start)
+                return value
+            except ValueError:
+                pass
+        position = html_content.find(key, start)
+    
+    return None
+
+
+def _find_video_resource(html_content: str) -> Optional[Dict[str, Any]]:
+    """
+    查找页面中第一个 ``"resource": {"type": "video", "data": {"id": ...}}``
+    
+    标题取资源对象前后最近的 "title" 字段 (通常是同一小节的标题)
+    """
+    position = html_content.find('"resource"')
+    while position != -1:
+        start = position + len('"resource"')
+        while start < len(html_content) and html_content[start] in " \t\r\n:":
+            start += 1
+        
+        end = start
+        if html_content.startswith("{", start):
+            try:
+                resource, end = _JSON_DECODER.raw_decode(html_content, start)
+            except ValueError:
+                resource = None
+            
+            page_info = _find_video_in_state({"resource": resource})
+            if page_info:
+                title_match = None
+                for title_match in _TITLE_PATTERN.finditer(
+                        html_content, max(0, position - _TITLE_WINDOW), position):
+                    pass
+                if not title_match:
+                    title_match = _TITLE_PATTERN.search(html_content, end, end + _TITLE_WINDOW)
+                page_info["title"] = title_match.group(1) if title_match else ""
+                return page_info
+        
+        position = html_content.find('"resource"', max(end, start))
+    
+    return None
+
+
+def _load_page_state(html_content: str) -> Optional[Any]:
+    """定位并解析页面中嵌入的初始状态 JSON，找不到或解析失败时返回 None"""
+    for marker in _PAGE_STATE_MARKERS:
+        position = html_content.find(marker)
+        if position == -1:
+            continue
+        
+        start = html_content.find("{", position + len(marker))
+        if start == -1:
+            continue
+        
+        try:
+            # raw_decode 在 JSON 对象结束处停止，不需要再查找 </script>
+            state, _ = _JSON_DECODER.raw_decode(html_content, start)
+            return state
+        except ValueError:
+            continue
+    
+    return None
+
+
+def _find_video_in_state(state: Any) -> Optional[Dict[str, Any]]:
+    """
+    按文档顺序遍历初始状态，查找视频资源
+    
+    优先匹配 ``{"title": ..., "resource": {"type": "video", "data": {"id": ...}}}``，
+    其次是 ``{"type": "video", "id": ...}``，最后是数字 ``video_id``。
+    """
+    typed_match = None
+    numeric_match = None
+    
+    stack = [state]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend([item for item in reversed(node) if isinstance(item, (dict, list))])
+            continue
+        
+        resource = node.get("resource")
+        if isinstance(resource, dict) and resource.get("type") == "video":
+            data = resource.get("data")
+            if isinstance(data, dict) and _is_video_id(data.get("id"), 20):
+                return {
+                    "video_id": data["id"],
+                    "title": node.get("title") or "",
+                    "duration": data.get("duration", 0),
+                    "source": "initial_state",
+                }
+        
+        if typed_match is None and node.get("type") == "video" and _is_video_id(node.get("id"), 40):
+            typed_match = {
+                "video_id": node["id"],
+                "title": node.get("title") or "",
+                "source": "initial_state",
+            }
+        
+        video_id = node.get("video_id")
+        if numeric_match is None and isinstance(video_id, str) and video_id.isdigit() and len(video_id) > 10:
+            numeric_match = {
+                "video_id": video_id,
+                "title": node.get("title") or "",
+                "source": "initial_state",
+            }
+        
+        # 只有对象和数组需要继续展开
+        stack.extend([
+            value for value in reversed(list(node.values()))
+            if isinstance(value, (dict, list))
+        ])
+    
+    return typed_match or numeric_match
+
+
+def _is_video_id(value: Any, min_length: int) -> bool:
+    return (
+        isinstance(value, str)
+        and len(value) >= min_length
+        and _VIDEO_ID_RE.fullmatch(value) is not None
+    )
+
+
+# 训练营目录 API 中可能包含下级条目列表的键名
+_CATALOG_CHILD_KEYS = ("data", "catalog", "chapters", "sections", "children")
+
+
+def _collect_course_sections(data: Any) -> List[Dict[str, Any]]:
+    """
+    从训练营目录 API 的返回数据中按顺序收集小节
+    
+    目录可能按「章节 -> 小节」嵌套，键名也不固定：递归展开 _CATALOG_CHILD_KEYS
+    中的列表，没有下级列表的条目视为小节。
+    """
+    sections = []
+    
+    def walk(node: Any):
+        if isinstance(node, list):
+            for item in node:
+                walk(item)
+            return
+        if not isinstance(node, dict):
+            return
+        
+        children = [
+            node[key] for key in _CATALOG_CHILD_KEYS if isinstance(node.get(key), list)
+        ]
+        if children:
+            for child in children:
+                walk(child)
+            return
+        
+        section_id = node.get("section_id") or node.get("id")
+        if not section_id:
+            return
+        
+        # 目录中可能已经带有小节的视频资源
+        resource = node.get("resource") or {}
+        video_data = resource.get("data") or {} if resource.get("type") == "video" else {}
+        sections.append({
+            "section_id": str(section_id),
+            "title": node.get("title", ""),
+            "video_id": video_data.get("id"),
+        })
+    
+    walk(data)
+    return sections
+
+
+def _split_ranges(ranges: List[Tuple[int, int]], count: int,
+                  min_size: int) -> List[Tuple[int, int]]:
+    """
+    把字节范围切分成最多 count 段，每段不小于 min_size
+
+    每次把最大的一段对半切开，直到数量足够或无法再切。
+    """
+    parts = list(ranges)
+    while len(parts) < count:
+        largest = max(parts, key=lambda r: r[1] - r[0], default=None)
+        if largest is None:
+            break
+        start, end = largest
+        size = end - start + 1
+        if size < min_size * 2:
+            break
+        
+        middle = start + size // 2
+        index = parts.index(largest)
+        parts[index:index + 1] = [(start, middle - 1), (middle, end)]
+    
+    return parts
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]], gap: int = 0) -> List[Tuple[int, int]]:
+    """合并重叠或间隔不超过 gap 字节的字节范围 (结束位置包含在内)"""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1 + gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _intersect_ranges(a: List[Tuple[int, int]],
+                      b: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """两组有序、互不重叠的字节范围的交集"""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if start <= end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def _format_clip_time(seconds: float) -> str:
+    """片段时间的文件名形式，如 1h02m03s、05m30.5s"""
+    # 先舍入到 0.1 秒再拆分，避免 59.96 秒显示为 00m60.0s
+    tenths = int(round(seconds * 10))
+    minutes, tenths = divmod(tenths, 600)
+    hours, minutes = divmod(minutes, 60)
+    secs = f"{tenths // 10:02d}" if tenths % 10 == 0 else f"{tenths / 10:04.1f}"
+    text = f"{minutes:02d}m{secs}s"
+    return f"{hours}h{text}" if hours else text
+
+
+def _covering_segments(durations: List[float], start: float,
+                       end: Optional[float]) -> Tuple[int, int, float]:
+    """
+    按 #EXTINF 时长计算覆盖时间范围 [start, end) 的分片
+    
+    Returns:
+        (第一个分片, 最后一个分片 + 1, 片段开始时间相对第一个分片开始的偏移)，
+        start 超过所有分片的总时长时第一个分片等于分片数
+    """
+    first = last = len(durations)
+    first_start = position = 0.0
+    for index, duration in enumerate(durations):
+        if end is not None and position >= end:
+            last = index
+            break
+        if first == len(durations) and position + duration > start:
+            first, first_start = index, position
+        position += duration
+    
+    if first == len(durations):
+        return first, first, 0.0
+    return first, last, start - first_start
+
+
+@dataclass
+class Mp4Track:
+    """MP4 轨道的 chunk 索引 (见 _parse_mp4_tracks)"""
+    is_video: bool
+    # 每个 chunk 的 (开始时间, 结束时间, 文件偏移, 字节数)，时间单位为秒
+    chunks: List[Tuple[float, float, int, int]]
+    # 关键帧的时间 (秒，升序)，None 表示每个采样都是关键帧
+    sync_times: Optional[List[float]] = None
+
+
+def _mp4_box_header(data: bytes, position: int) -> Tuple[bytes, int, int]:
+    """
+    解析 MP4 box 头
+    
+    Returns:
+        (类型, 头部字节数, box 字节数)，box 字节数为 0 表示直到文件 (或父 box) 结尾
+    """
+    if position + 8 > len(data):
+        raise ValueError("MP4 box 头不完整")
+    size, box_type = struct.unpack_from(">I4s", data, position)
+    if size == 1:
+        if position + 16 > len(data):
+            raise ValueError("MP4 box 头不完整")
+        return box_type, 16, struct.unpack_from(">Q", data, position + 8)[0]
+    return box_type, 8, size
+
+
+def _mp4_boxes(data: bytes, start: int, end: int):
+    """遍历 data[start:end] 中的 box，产生 (类型, 内容起始位置, box 结束位置)"""
+    position = start
+    while position + 8 <= end:
+        box_type, header_size, size = _mp4_box_header(data, position)
+        if size == 0:
+            size = end - position
+        if size < header_size or position + size > end:
+            raise ValueError(f"MP4 box {box_type!r} 的大小无效")
+        yield box_type, position + header_size, position + size
+        position += size
+
+
+def _mp4_find(data: bytes, start: int, end: int, *path: bytes) -> Optional[Tuple[int, int]]:
+    """按路径查找嵌套的 box，返回其内容的 (起始, 结束) 位置"""
+    for name in path:
+        for box_type, content_start, box_end in _mp4_boxes(data, start, end):
+            if box_type == name:
+                start, end = content_start, box_end
+                break
+        else:
+            return None
+    return start, end
+
+
+def _mp4_table(data: bytes, bounds: Tuple[int, int], fields: int, fmt: str = "I",
+               header: int = 8) -> Tuple[int, ...]:
+    """读取 full box 中 "条目数 + 条目" 形式的表 (条目数位于 header 之前的 4 个字节)"""
+    start, end = bounds
+    count = struct.unpack_from(">I", data, start + header - 4)[0]
+    table_format = f">{count * fields}{fmt}"
+    if start + header + struct.calcsize(table_format) > end:
+        raise ValueError("MP4 采样表不完整")
+    return struct.unpack_from(table_format, data, start + header)
+
+
+def _parse_mp4_tracks(moov: bytes) -> List[Mp4Track]:
+    """
+    从 moov 的采样表 (stts/stss/stsc/stsz/stco/co64) 计算各轨道每个 chunk 的时间和字节范围
+    
+    Raises:
+        ValueError: 不是有效的 moov，或没有采样表 (如分段 MP4)
+    """
+    try:
+        box_type, header_size, size = _mp4_box_header(moov, 0)
+        if box_type != b"moov":
+            raise ValueError("没有找到 moov")
+        
+        tracks = []
+        for box_type, start, end in _mp4_boxes(moov, header_size, min(size or len(moov), len(moov))):
+            if box_type != b"trak":
+                continue
+            mdia = _mp4_find(moov, start, end, b"mdia")
+            mdhd = mdia and _mp4_find(moov, *mdia, b"mdhd")
+            hdlr = mdia and _mp4_find(moov, *mdia, b"hdlr")
+            stbl = mdia and _mp4_find(moov, *mdia, b"minf", b"stbl")
+            if not (mdhd and hdlr and stbl):
+                continue
+            tables = {name: (start, end) for name, start, end in _mp4_boxes(moov, *stbl)}
+            if not all(name in tables for name in (b"stts", b"stsc", b"stsz")):
+                continue
+            
+            # mdhd 版本 1 的时间字段为 64 位
+            timescale = struct.unpack_from(">I", moov, mdhd[0] + (20 if moov[mdhd[0]] == 1 else 12))[0]
+            if not timescale:
+                raise ValueError("MP4 轨道的 timescale 无效")
+            
+            # 每个采样的解码时间 (times[i] 为第 i 个采样的开始，times[-1] 为最后一个采样的结束)
+            stts = _mp4_table(moov, tables[b"stts"], 2)
+            times = [0]
+            for count, delta in zip(stts[0::2], stts[1::2]):
+                last = times[-1]
+                times.extend(range(last + delta, last + delta * count + 1, delta) if delta else [last] * count)
+            
+            # 采样大小的前缀和
+            stsz_start = tables[b"stsz"][0]
+            sample_size, sample_count = struct.unpack_from(">II", moov, stsz_start + 4)
+            sample_count = min(sample_count, len(times) - 1)
+            if sample_size:
+                prefix = range(0, (sample_count + 1) * sample_size, sample_size)
+            else:
+                sizes = _mp4_table(moov, tables[b"stsz"], 1, header=12)
+                prefix = [0, *itertools.accumulate(sizes[:sample_count])]
+                sample_count = len(prefix) - 1
+            
+            if b"co64" in tables:
+                offsets = _mp4_table(moov, tables[b"co64"], 1, "Q")
+            elif b"stco" in tables:
+                offsets = _mp4_table(moov, tables[b"stco"], 1)
+            else:
+                continue
+            
+            # stsc: 从 first_chunk 开始 (直到下一项) 的每个 chunk 包含 samples_per_chunk 个采样
+            stsc = _mp4_table(moov, tables[b"stsc"], 3)
+            entries = list(zip(stsc[0::3], stsc[1::3]))
+            chunks = []
+            sample = 0
+            for index, (first_chunk, per_chunk) in enumerate(entries):
+                next_chunk = entries[index + 1][0] if index + 1 < len(entries) else len(offsets) + 1
+                for chunk in range(first_chunk - 1, min(next_chunk - 1, len(offsets))):
+                    chunk_end = min(sample + per_chunk, sample_count)
+                    if chunk_end <= sample:
+                        break
+                    chunks.append((
+                        times[sample] / timescale, times[chunk_end] / timescale,
+                        offsets[chunk], prefix[chunk_end] - prefix[sample]
+                    ))
+                    sample = chunk_end
+            
+            sync_times = None
+            if b"stss" in tables:
+                sync_times = [
+                    times[number - 1] / timescale
+                    for number in _mp4_table(moov, tables[b"stss"], 1) if 0 < number <= sample_count
+                ]
+            
+            handler = moov[hdlr[0] + 8:hdlr[0] + 12]
+            tracks.append(Mp4Track(handler == b"vide", chunks, sync_times))
+    except struct.error:
+        raise ValueError("MP4 索引不完整")
+    
+    if not any(track.chunks for track in tracks):
+        raise ValueError("moov 中没有采样表 (可能是分段 MP4)")
+    return tracks
+
+
+def _mp4_clip_ranges(tracks: List[Mp4Track], start: float, end: Optional[float],
+                     margin: float) -> List[Tuple[int, int]]:
+    """
+    片段需要的采样数据所在的字节范围 (未合并，结束位置包含在内)
+    
+    从片段开始之前最近的视频关键帧再往前 margin 秒开始 (ffmpeg 输入端定位后从这个关键帧
+    开始复制，其它轨道会带上关键帧之前的少量数据包)，到片段结束后 margin 秒为止；
+    每个轨道的第一个 chunk 也包含在内，ffmpeg 打开文件读取流信息时会读取开头的数据包。
+    """
+    keyframe = start
+    for track in tracks:
+        if track.is_video and track.sync_times:
+            index = bisect.bisect_right(track.sync_times, start)
+            keyframe = min(keyframe, track.sync_times[index - 1] if index else 0.0)
+    
+    begin = keyframe - margin
+    stop = math.inf if end is None else end + margin
+    ranges = []
+    for track in tracks:
+        for index, (chunk_start, chunk_end, offset, size) in enumerate(track.chunks):
+            if size > 0 and (index == 0 or (chunk_end > begin and chunk_start < stop)):
+                ranges.append((offset, offset + size - 1))
+    return ranges
+
+
+# ffmpeg 统计信息中的处理进度 (time=00:01:02.50) 和输出大小 (size=    1024kB)
+_FFMPEG_TIME_PATTERN = re.compile(r'time=(\d{2}):(\d{2}):(\d{2})\.(\d{2})')
+_FFMPEG_SIZE_PATTERN = re.compile(r'size=\s*(\d+)\s*(?:kB|KiB)')
+
+
+def _load_m3u8_module():
+    """
+    按需导入 m3u8 (只有下载 M3U8 视频时才需要)
+    
+    Raises:
+        ValueError: 未安装 m3u8，调用方回退到 ffmpeg 直接下载
+    """
+    try:
+        import m3u8
+    except ImportError:
+        raise ValueError("未安装 m3u8，请运行: pip install m3u8")
+    return m3u8
+
+
+def _load_aes_cbc():
+    """
+    按需导入 AES 实现 (只有加密的 M3U8 播放列表才需要)，依次尝试 cryptography、pycryptodome
+    和 pycryptodomex
+    
+    Returns:
+        new_decryptor(key, iv): 返回 AES-128-CBC 解密函数，按顺序传入 16 字节整数倍的密文，
+        CBC 状态在多次调用之间保持
+    
+    Raises:
+        ValueError: 都未安装，调用方回退到 ffmpeg 直接下载
+    """
+    try:
+        from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    except ImportError:
+        pass
+    else:
+        return lambda key, iv: Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor().update
+    
+    for module in ("Crypto.Cipher.AES", "Cryptodome.Cipher.AES"):
+        try:
+            aes = __import__(module, fromlist=["AES"])
+        except ImportError:
+            continue
+        return lambda key, iv, aes=aes: aes.new(key, aes.MODE_CBC, iv).decrypt
+    
+    raise ValueError("未安装 AES 解密库，请运行: pip install cryptography")
+
+
+def _segment_key_ivs(playlist: "m3u8.M3U8",
+                     selected: Optional[range] = None) -> List[Optional[Tuple[str, bytes]]]:
+    """
+    每个加密分片的密钥 URI 和 IV (#EXT-X-KEY METHOD=AES-128)
+    
+    没有指定 IV 时使用分片的媒体序号 (128 位大端整数)。
+    
+    Args:
+        selected: 只处理这些分片 (片段下载)，默认为所有分片
+    
+    Returns:
+        每个分片的 (密钥 URI, IV)，未加密或未选中的分片为 None
+        
+    Raises:
+        ValueError: 不支持的加密方式 (如 SAMPLE-AES)，或 IV 无效
+    """
+    media_sequence = playlist.media_sequence or 0
+    result: List[Optional[Tuple[str, bytes]]] = []
+    for index, segment in enumerate(playlist.segments):
+        key = segment.key
+        if not key or not key.method or key.method == "NONE" or (
+            selected is not None and index not in selected
+        ):
+            result.append(None)
+            continue
+        if key.method != "AES-128" or (key.keyformat or "identity") != "identity":
+            raise ValueError(f"不支持的加密方式: {key.method}")
+        
+        if key.iv:
+            iv = bytes.fromhex(key.iv[2:].zfill(32) if key.iv[:2].lower() == "0x" else key.iv)
+            if len(iv) != SegmentDecryptor.BLOCK_SIZE:
+                raise ValueError(f"无效的 IV: {key.iv}")
+        else:
+            iv = (media_sequence + index).to_bytes(SegmentDecryptor.BLOCK_SIZE, "big")
+        result.append((key.absolute_uri, iv))
+    
+    return result
+
+
+class SegmentDecryptor:
+    """
+    HLS 分片的 AES-128-CBC 流式解密 (#EXT-X-KEY METHOD=AES-128)
+    
+    密文按收到的顺序分块传入 update，最后一个块留到 finalize 时解密并去掉 PKCS7 填充，
+    输出与 ffmpeg 解密后读取的数据完全相同。密码库在解密时释放 GIL，
+    多个下载线程可以同时解密。
+    """
+    
+    BLOCK_SIZE = 16
+    
+    def __init__(self, new_decryptor, key: bytes, iv: bytes):
+        """
+        Args:
+            new_decryptor: _load_aes_cbc 返回的函数
+            key: 16 字节密钥
+            iv: 16 字节初始向量
+        """
+        self._decrypt = new_decryptor(key, iv)
+        self._pending = b""
+    
+    def update(self, data: bytes) -> bytes:
+        """解密一段密文，返回可以写出的明文 (可能为空)"""
+        data = self._pending + data
+        # 保留最后一个完整的块 (可能包含填充) 和不完整的块
+        keep = len(data) % self.BLOCK_SIZE or self.BLOCK_SIZE
+        if len(data) <= keep:
+            self._pending = data
+            return b""
+        self._pending = data[-keep:]
+        return self._decrypt(data[:-keep])
+    
+    def finalize(self) -> bytes:
+        """
+        解密最后一个块并去掉 PKCS7 填充
+        
+        Raises:
+            ValueError: 密文长度不是 16 字节的整数倍，或填充无效 (通常是密钥或 IV 不对)
+        """
+        if len(self._pending) != self.BLOCK_SIZE:
+            raise ValueError("加密分片的长度不是 16 字节的整数倍")
+        block = self._decrypt(self._pending)
+        self._pending = b""
+        padding = block[-1]
+        if not 1 <= padding <= self.BLOCK_SIZE:
+            raise ValueError("加密分片的填充无效，密钥或 IV 可能不正确")
+        return block[:-padding]
+    
+    def decrypt(self, data: bytes) -> bytes:
+        """解密完整的分片"""
+        return self.update(data) + self.finalize()
+
+
+def _probe_duration(ffprobe_path: str, path: str) -> Optional[float]:
+    """用 ffprobe 读取媒体文件的时长 (秒)，无法读取时返回 None"""
+    try:
+        result = subprocess.run(
+            [ffprobe_path, "-v", "error", "-show_entries", "format=duration",
+             "-of", "default=noprint_wrappers=1:nokey=1", path],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, timeout=60
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return None
+
+
+def _sha256_of_stream(f, size: int) -> str:
+    """计算文件对象从当前位置开始 size 字节的 SHA-256"""
+    digest = hashlib.sha256()
+    remaining = size
+    while remaining > 0:
+        chunk = f.read(min(remaining, 1024 * 1024))
+        if not chunk:
+            break
+        digest.update(chunk)
+        remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+class EndpointPreference:
+    """
+    记住每个主机上最近返回有效结果的 API 端点 (见 ZhihuVideoDownloader._probe_endpoints)
+    
+    按主机记录每个端点模板最近一次成功的时间，保存在内存和元数据缓存中。排序时最近成功过的主机优先
+    (不同的端点组共享，例如小节和目录 API 都在 www.zhihu.com)，同一主机上最近成功的端点优先，
+    没有成功记录的端点保持原有顺序。可以在多个线程中同时使用。
+    """
+    
+    def __init__(self, cache: Optional[MetadataCache] = None):
+        self.cache = cache
+        # 主机 -> {端点模板: 最近一次返回有效结果的时间}
+        self._hosts: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+    
+    def order(self, templates: List[str]) -> List[str]:
+        """按最近成功的时间排列端点模板"""
+        hosts = {template: urlparse(template).netloc for template in templates}
+        with self._lock:
+            successes = {host: dict(self._successes(host)) for host in set(hosts.values())}
+        
+        def key(template: str) -> Tuple[float, float]:
+            host_successes = successes[hosts[template]]
+            return -max(host_successes.values(), default=0.0), -host_successes.get(template, 0.0)
+        
+        return sorted(templates, key=key)
+    
+    def record(self, template: str):
+        """记录端点返回了有效结果"""
+        host = urlparse(template).netloc
+        with self._lock:
+            successes = self._successes(host)
+            successes[template] = time.time()
+            if self.cache:
+                self.cache.set(f"endpoint_host:{host}", successes, MetadataCache.PAGE_TTL)
+    
+    def _successes(self, host: str) -> Dict[str, float]:
+        successes = self._hosts.get(host)
+        if successes is None:
+            cached = self.cache.get(f"endpoint_host:{host}") if self.cache else None
+            successes = dict(cached) if isinstance(cached, dict) else {}
+            self._hosts[host] = successes
+        return successes
+
+
+class CookieLoader:
+    """
+    加载知乎 cookies: cookies 文件，或从 Chrome 读取 (读取结果缓存在缓存目录中)
+    
+    cookies 加入给定的 requests session，检查缓存的 cookies 是否有效的鉴权请求也通过它发出。
+    ZhihuVideoDownloader 用它加载自己 session 的 cookies；AsyncZhihuVideoDownloader 用它加载后
+    把 session.cookies 复制到 aiohttp 的 cookie jar。
+    """
+    
+    # 用于检查 cookies 是否有效的轻量级鉴权请求 (未登录时返回 401)
+    COOKIE_CHECK_URL = "https://www.zhihu.com/api/v4/me"
+    
+    # 缓存的 z_c0 距离过期不足这么多秒时重新从 Chrome 读取
+    COOKIE_EXPIRY_MARGIN = 24 * 3600
+    
+    # 缓存的 cookies 通过检查后，这么多秒内不再重复检查
+    COOKIE_CHECK_TTL = 3600
+    
+    def __init__(self, session: requests.Session, cache: Optional[MetadataCache] = None,
+                 cache_dir: Optional[str] = None):
+        """
+        Args:
+            session: 加入 cookies 的 session
+            cache: 元数据缓存 (记录 cookies 的鉴权检查结果)，None 表示不使用
+            cache_dir: 缓存从 Chrome 读取的 cookies 的目录，None 表示不缓存
+        """
+        self.session = session
+        self.cache = cache
+        self.cache_path = os.path.join(cache_dir, "cookies.json") if cache_dir else None
+        
+        # 当前 cookies 来自缓存时，鉴权失败后允许重新从 Chrome 读取一次
+        self._from_cache = False
+        self._lock = threading.Lock()
+    
+    def load(self, use_chrome_cookies: bool = True, cookie_file: Optional[str] = None):
+        """
+        加载 cookies: 指定了 cookies 文件时使用该文件，否则使用缓存或从 Chrome 读取
+        
+        Args:
+            use_chrome_cookies: 没有 cookies 文件时是否使用 Chrome 的 cookies
+            cookie_file: cookies 文件路径 (JSON 格式)
+        """
+        if cookie_file:
+            self.load_file(cookie_file)
+        elif use_chrome_cookies:
+            if not self._load_cached():
+                self.load_chrome()
+    
+    def load_file(self, cookie_file: str):
+        """从文件加载 cookies"""
+        print(f"正在从文件加载 cookies: {cookie_file}")
+        try:
+            with open(cookie_file, 'r') as f:
+                cookies_data = json.load(f)
+            
+            self._set_cookies(cookies_data)
+            print(f"✓ 成功加载 {len(cookies_data)} 个 cookies")
+        except Exception as e:
+            print(f"⚠ 加载 cookies 文件失败: {e}")
+    
+    def _set_cookies(self, cookies_data: List[Dict[str, Any]]):
+        """把 export_cookies.py 格式的 cookies 加入 session"""
+        for cookie in cookies_data:
+            self.session.cookies.set(
+                cookie.get('name'),
+                cookie.get('value'),
+                domain=cookie.get('domain', '.zhihu.com'),
+                path=cookie.get('path') or '/',
+                expires=cookie.get('expires'),
+                secure=bool(cookie.get('secure'))
+            )
+    
+    def _load_cached(self) -> bool:
+        """
+        加载上次从 Chrome 读取并缓存的 cookies，避免每次运行都解密 Chrome 的 cookies 数据库
+        (可能弹出 Keychain 授权对话框)
+        
+        z_c0 即将过期，或鉴权检查返回 401/403 时返回 False，需要重新从 Chrome 读取
+        """
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+        
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cookies_data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠ 读取 cookies 缓存失败: {e}")
+            return False
+        
+        auth_cookie = next((c for c in cookies_data if c.get('name') == 'z_c0'), None)
+        if not auth_cookie:
+            return False
+        
+        expires = auth_cookie.get('expires')
+        if expires and expires - time.time() < self.COOKIE_EXPIRY_MARGIN:
+            print("缓存的认证 cookies 即将过期，重新从 Chrome 读取")
+            return False
+        
+        self._set_cookies(cookies_data)
+        
+        # 同一个 z_c0 在 COOKIE_CHECK_TTL 内只检查一次
+        check_key = "cookies:checked:" + hashlib.sha256(
+            auth_cookie.get('value', '').encode('utf-8')
+        ).hexdigest()[:16]
+        if not (self.cache and self.cache.get(check_key)):
+            try:
+                response = self.session.get(self.COOKIE_CHECK_URL, timeout=10)
+            except requests.RequestException as e:
+                # 网络问题无法判断 cookies 是否有效，先继续使用缓存
+                print(f"⚠ 检查 cookies 失败: {e}")
+            else:
+                if response.status_code in (401, 403):
+                    print(f"缓存的 cookies 已失效 (状态码: {response.status_code})，重新从 Chrome 读取")
+                    self.session.cookies.clear()
+                    return False
+                if response.status_code == 200:
+                    if self.cache:
+                        self.cache.set(check_key, True, self.COOKIE_CHECK_TTL)
+        
+        self._from_cache = True
+        print(f"✓ 使用缓存的 cookies: {self.cache_path}")
+        return True
+    
+    def _save_cache(self):
+        """把从 Chrome 读取的知乎 cookies 保存为 export_cookies.py 的 JSON 格式 (仅本用户可读)"""
+        if not self.cache_path:
+            return
+        
+        cookies_data = [
+            {
+                'name': c.name,
+                'value': c.value,
+                'domain': c.domain,
+                'path': c.path,
+                'expires': c.expires,
+                'secure': c.secure
+            }
+            for c in self.session.cookies
+            if c.domain.endswith("zhihu.com")
+        ]
+        
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(cookies_data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"⚠ 保存 cookies 缓存失败: {e}")
+    
+    def reload_after_auth_failure(self, status_code: int):
+        """缓存的 cookies 在请求中返回 401/403 时，重新从 Chrome 读取一次"""
+        with self._lock:
+            if not self._from_cache:
+                return
+            self._from_cache = False
+            print(f"⚠ 请求返回 {status_code}，缓存的 cookies 可能已失效，重新从 Chrome 读取")
+            self.session.cookies.clear()
+            self.load_chrome()
+    
+    def load_chrome(self):
+        """从 Chrome 加载 cookies"""
+        print("正在从 Chrome 读取 cookies...")
+        print("注意: 可能需要授权访问 macOS Keychain，请在弹出的对话框中点击「允许」")
+        
+        try:
+            import browser_cookie3
+        except ImportError:
+            print("⚠ 请安装 browser_cookie3: pip install browser-cookie3")
+            print("  或使用 -c 指定 cookies 文件")
+            return
+        
+        try:
+            # 获取知乎相关的 cookies
+            cookies = browser_cookie3.chrome(domain_name=".zhihu.com")
+            self.session.cookies.update(cookies)
+            
+            # 验证是否获取到关键的认证 cookies
+            cookie_names = [c.name for c in self.session.cookies]
+            required_cookies = ["z_c0"]  # 知乎的关键认证 cookie
+            
+            has_auth = any(name in cookie_names for name in required_cookies)
+            if has_auth:
+                print("✓ 成功获取认证 cookies")
+                self._save_cache()
+            else:
+                print("⚠ 未找到认证 cookies，可能需要先在 Chrome 中登录知乎")
+                
+        except Exception as e:
+            print(f"⚠ 读取 Chrome cookies 失败: {e}")
+            print("请确保已安装 browser-cookie3 并授权访问 Keychain")
+
+
+class ZhihuVideoDownloader:
+    """知乎视频下载器"""
+    
+    # 知乎视频 API
+    LENS_API_BASE = "https://lens.zhihu.com/api/v4/videos"
+    
+    # 视频播放信息 API (等价端点，按顺序尝试)
+    LENS_VIDEO_APIS = [
+        LENS_API_BASE + "/{video_id}",
+        "https://lens.zhihu.com/api/videos/{video_id}",
+    ]
+    
+    # 训练营小节 API
+    TRAINING_SECTION_APIS = [
+        "https://www.zhihu.com/api/infinity/training/section/{section_id}",
+        "https://www.zhihu.com/api/v4/market/training/section/{section_id}",
+        "https://api.zhihu.com/infinity/training/section/{section_id}",
+    ]
+    
+    # 训练营课程目录 API
+    TRAINING_CATALOG_APIS = [
+        "https://www.zhihu.com/api/infinity/training/{product_id}/catalog",
+        "https://www.zhihu.com/api/v4/market/training/{product_id}/sections",
+        "https://api.zhihu.com/infinity/training/{product_id}/catalog",
+    ]
+    
+    # 对冲请求: 一个端点超过这么多秒没有响应时，同时请求下一个端点
+    HEDGE_DELAY = 1.5
+    
+    # 对冲请求每次读取的响应字节数，被取消的请求最多再读一个数据块
+    API_READ_CHUNK_SIZE = 8192
+    
+    # 请求头
+    HEADERS = {
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+        "Accept": "application/json, text/plain, */*",
+        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+        "Referer": "https://www.zhihu.com/",
+        "Origin": "https://www.zhihu.com",
+    }
+    
+    # M3U8 分片并发下载的默认线程数 (0 表示直接交给 ffmpeg 下载)
+    DEFAULT_SEGMENT_WORKERS = 8
+    
+    # MP4 并发下载的默认连接数 (1 表示单连接下载)
+    DEFAULT_MP4_CONNECTIONS = 4
+    
+    # ffmpeg 失败时用于显示错误信息而保留的 stderr 行数
+    FFMPEG_STDERR_LINES = 50
+    
+    # 流式合并 (--pipe-remux) 时最多在内存中缓存的分片数 (至少为分片线程数的 2 倍)
+    PIPE_REORDER_SEGMENTS = 16
+    
+    # MP4 按字节范围切分时每段的最小大小
+    MIN_RANGE_SIZE = 1024 * 1024
+    
+    # MP4 断点续传时，每下载这么多字节在清单中记录一次检查点
+    RESUME_CHECKPOINT_SIZE = 8 * 1024 * 1024
+    
+    # MP4 片段下载: 读取文件结构时每次请求的字节数
+    MP4_BOX_READ_SIZE = 64 * 1024
+    
+    # MP4 片段下载: 间隔不超过这么多字节的采样数据合并为一个请求
+    CLIP_MERGE_GAP = 256 * 1024
+    
+    # MP4 片段下载: 在片段前后多下载这么多秒的数据，ffmpeg 裁剪时不会读到未下载的部分
+    CLIP_MARGIN = 1.0
+    
+    # 分片 / 字节范围下载失败后的重试次数，以及指数退避的初始和最长等待时间 (秒)
+    PIECE_RETRIES = 4
+    RETRY_BASE_DELAY = 0.5
+    RETRY_MAX_DELAY = 8.0
+    
+    # CDN 主机失败后立即换主机重试的最多次数 (不计入重试次数，见 CdnHostSelector)
+    MAX_FAILOVERS = 3
+    
+    # 其余分片下载完后，重新下载仍然失败的分片的轮数
+    SEGMENT_RETRY_ROUNDS = 1
+    
+    # 下载完成后用 ffprobe 校验时长: 比 API 返回的时长短超过这么多秒 (且超过这个比例) 时认为文件不完整
+    DURATION_TOLERANCE = 2.0
+    DURATION_TOLERANCE_RATIO = 0.02
+    
+    # 整课下载时并发解析小节视频 ID 的线程数
+    COURSE_RESOLVE_WORKERS = 8
+    
+    # 整课下载时默认同时下载的视频数
+    DEFAULT_COURSE_JOBS = 3
+    
+    # 清晰度优先级 (从高到低)
+    QUALITY_ORDER = ["uhd", "fhd", "hd", "sd", "ld"]
+    
+    # 自动清晰度 (-q auto) 测速: MP4 并发请求的字节范围数和每个范围的大小，M3U8 并发下载的分片数
+    AUTO_PROBE_RANGES = 4
+    AUTO_PROBE_RANGE_SIZE = 256 * 1024
+    AUTO_PROBE_SEGMENTS = 2
+    
+    # 同一主机的测速结果在这么多秒内复用 (整课下载时只测一次)
+    AUTO_PROBE_TTL = 300
+    
+    # 无法估计清晰度大小或带宽时，自动清晰度使用的清晰度
+    AUTO_FALLBACK_QUALITY = "hd"
+    
+    def __init__(self, use_chrome_cookies: bool = True, cookie_file: str = None,
+                 segment_workers: int = DEFAULT_SEGMENT_WORKERS,
+                 resume: bool = False,
+                 mp4_connections: int = DEFAULT_MP4_CONNECTIONS,
+                 cache_dir: Optional[str] = None,
+                 refresh_cache: bool = False,
+                 adaptive_concurrency: bool = True,
+                 pipe_remux: bool = False,
+                 max_rate: Optional[float] = None,
+                 reuse_downloads: bool = True,
+                 parallel_videos: int = 1):
+        """
+        初始化下载器
+        
+        Args:
+            use_chrome_cookies: 是否使用 Chrome 的 cookies 进行鉴权
+            cookie_file: 手动提供的 cookies 文件路径 (JSON 格式)
+            segment_workers: M3U8 分片并发下载线程数，0 表示只使用 ffmpeg 下载
+            resume: 是否启用断点续传 (在输出文件旁边保存下载清单)
+            mp4_connections: MP4 视频并发下载的连接数
+            cache_dir: 元数据缓存目录 (同时缓存从 Chrome 读取的 cookies)，None 表示不使用缓存
+            refresh_cache: 忽略已有的元数据缓存，重新解析 (仍会更新缓存)
+            adaptive_concurrency: 按主机自适应调整并发数，被限流 (429/503) 时自动退避
+            pipe_remux: M3U8 分片按顺序直接写入 ffmpeg 的标准输入，不保存临时文件
+            max_rate: 自动清晰度的带宽预算 (字节/秒)，测得的带宽超过预算时按预算选择清晰度
+            reuse_downloads: 在缓存目录中记录下载完成的文件，同一视频同一清晰度不再重复下载
+            parallel_videos: 同时下载的视频数 (课程、批量下载和调度器)，用于确定连接池大小
+        """
+        self.segment_workers = max(0, segment_workers)
+        self.resume = resume
+        self.pipe_remux = pipe_remux
+        self.mp4_connections = max(1, mp4_connections)
+        self.parallel_videos = max(1, parallel_videos)
+        self.max_rate = max_rate
+        self.cache = MetadataCache(cache_dir, refresh_cache) if cache_dir else None
+        self.store = DownloadStore(cache_dir) if cache_dir and reuse_downloads else None
+        self.governor = None
+        if adaptive_concurrency:
+            # 初始窗口不小于配置的分片线程数和连接数，否则一开始就被窗口限制
+            self.governor = ConcurrencyGovernor(
+                max(ConcurrencyGovernor.INITIAL_WINDOW, self.segment_workers, self.mp4_connections)
+            )
+        self.metrics = DownloadMetrics()
+        self.cdn_hosts = CdnHostSelector()
+        # 每个主机上最近返回有效结果的 API 端点 (见 _probe_endpoints)
+        self.endpoints = EndpointPreference(self.cache)
+        
+        # 自动清晰度的测速结果: 主机 -> (字节/秒, 测速时间)
+        self._throughput: Dict[str, Tuple[float, float]] = {}
+        # 正在测速的主机 -> 测速结果 (同一主机同时只测一次)
+        self._throughput_probes: Dict[str, Future] = {}
+        self._throughput_lock = threading.Lock()
+        
+        self.session = requests.Session()
+        self.session.headers.update(self.HEADERS)
+        self._mount_http_adapter()
+        
+        self.cookies = CookieLoader(self.session, self.cache, cache_dir)
+        self.cookies.load(use_chrome_cookies, cookie_file)
+    
+    def _mount_http_adapter(self):
+        """
+        扩大连接池，让分片下载线程复用同一个 session 的连接和 cookies
+        
+        连接池只在创建下载器时确定大小，之后不再替换 adapter (替换会丢弃连接池中已有的连接)。
+        每个视频内部也会并发下载，连接池需要容纳同时下载的所有视频的连接。
+        """
+        per_video = max(self.segment_workers, self.mp4_connections)
+        pool_size = max(10, self.parallel_videos * per_video)
+        adapter = GovernedAdapter(
+            self.governor, self.metrics, pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+    
+    def _cache_get(self, key: str) -> Optional[Any]:
+        return self.cache.get(key) if self.cache else None
+    
+    def _cache_set(self, key: str, value: Any, ttl: float):
+        if self.cache and ttl > 0:
+            self.cache.set(key, value, ttl)
+    
+    @staticmethod
+    def extract_video_id_from_url(url: str) -> Optional[str]:
+        """
+        从知乎页面 URL 中提取视频 ID
+        
+        支持的 URL 格式:
+        - 直接的 lens video ID (数字或加密格式，不包含 http)
+        - https://www.zhihu.com/zvideo/{video_id} - 普通知乎视频
+        
+        注意: 训练营视频 URL 需要通过 _get_video_info_from_page 获取真正的视频 ID
+        """
+        # 如果是 URL，解析它
+        if url.startswith("http"):
+            parsed = urlparse(url)
+            
+            # 普通知乎视频页面: /zvideo/{video_id}
+            if "/zvideo/" in parsed.path:
+                path_parts = parsed.path.rstrip("/").split("/")
+                for i, part in enumerate(path_parts):
+                    if part == "zvideo" and i + 1 < len(path_parts):
+                        return path_parts[i + 1]
+            
+            # 训练营视频 URL 需要通过页面获取，返回 None
+            return None
+        
+        # 如果不是 URL，检查是否是直接的视频 ID
+        # 数字 ID 或加密的视频 ID（不含 / 和 :）
+        if url.isdigit():
+            return url
+        
+        # 加密的视频 ID 格式：字母数字和下划线，长度较长，不含特殊 URL 字符
+        if len(url) > 30 and "/" not in url and ":" not in url:
+            return url
+        
+        return None
+    
+    @staticmethod
+    def parse_training_url(url: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        解析训练营 URL 中的课程 ID 和小节 ID
+        
+        支持的格式:
+        - /xen/market/training/training-video/{productId}/{sectionId}
+        - /xen/market/training/{productId} 等以课程 ID 结尾的 URL
+        - 直接的数字课程 ID
+        
+        Returns:
+            (product_id, section_id)，section_id 可能为 None；无法识别时返回 None
+        """
+        if url.isdigit():
+            return url, None
+        
+        parsed = urlparse(url)
+        path_parts = [part for part in parsed.path.split("/") if part]
+        
+        if "training-video" in path_parts:
+            ids = path_parts[path_parts.index("training-video") + 1:]
+            if len(ids) >= 2:
+                return ids[0], ids[1]
+            if ids:
+                return ids[0], None
+        
+        if "training" in parsed.path and path_parts and path_parts[-1].isdigit():
+            return path_parts[-1], None
+        
+        return None
+    
+    def _probe_endpoints(self, templates: List[str], params: Dict[str, str],
+                         parse) -> Optional[Any]:
+        """
+        对冲请求多个等价的 API 端点，返回第一个有效结果
+        
+        先请求最近成功过的端点 (见 EndpointPreference)；HEDGE_DELAY 秒内没有结果或请求失败时，再启动下一个端点，
+        直到某个端点返回有效结果。其余尚未开始的请求被取消，已发出的请求停止读取响应并关闭连接
+        (还没有收到响应头的请求在收到响应头后立即结束)，请求线程不会一直运行到响应读完。
+        
+        Args:
+            templates: 端点 URL 模板列表
+            params: 填入 URL 模板的参数
+            parse: 解析 JSON 响应的函数，返回 None 表示结果无效
+            
+        Returns:
+            第一个有效的解析结果，全部失败时返回 None
+        """
+        ordered = self.endpoints.order(templates)
+        
+        executor = ThreadPoolExecutor(max_workers=len(ordered))
+        abort = threading.Event()
+        pending = {}
+        launched = 0
+        
+        def launch():
+            nonlocal launched
+            template = ordered[launched]
+            launched += 1
+            future = executor.submit(
+                self._probe_endpoint, template.format(**params), parse, abort
+            )
+            pending[future] = template
+        
+        try:
+            launch()
+            while pending:
+                hedge = launched < len(ordered)
+                done, _ = wait(
+                    pending,
+                    timeout=self.HEDGE_DELAY if hedge else None,
+                    return_when=FIRST_COMPLETED
+                )
+                
+                if not done:
+                    # 当前端点响应太慢，启动下一个端点
+                    launch()
+                    continue
+                
+                for future in done:
+                    template = pending.pop(future)
+                    result = future.result()
+                    if result is not None:
+                        self.endpoints.record(template)
+                        return result
+                
+                # 请求失败，立即尝试下一个端点
+                if launched < len(ordered):
+                    launch()
+            
+            return None
+        finally:
+            # 取消还没开始的请求，已发出的请求在读取下一个数据块之前结束
+            abort.set()
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+    
+    def _probe_endpoint(self, api_url: str, parse,
+                        abort: Optional[threading.Event] = None) -> Optional[Any]:
+        """
+        请求单个 API 端点并解析结果，失败返回 None
+        
+        Args:
+            api_url: 端点地址
+            parse: 解析 JSON 响应的函数
+            abort: 设置后 (其他端点已返回结果) 停止读取响应，关闭连接并返回 None
+        """
+        print(f"尝试 API: {api_url}")
+        try:
+            # 流式读取，被取消时不用等到响应读完
+            with self.session.get(api_url, timeout=30, stream=True) as response:
+                if abort and abort.is_set():
+                    return None
+                if response.status_code != 200:
+                    print(f"  返回状态码: {response.status_code}")
+                    if response.status_code in (401, 403):
+                        self.cookies.reload_after_auth_failure(response.status_code)
+                    return None
+                chunks = []
+                for chunk in response.iter_content(chunk_size=self.API_READ_CHUNK_SIZE):
+                    if abort and abort.is_set():
+                        return None
+                    chunks.append(chunk)
+                return parse(json.loads(b"".join(chunks)))
+        except requests.RequestException as e:
+            print(f"  请求失败: {e}")
+        except ValueError as e:
+            print(f"  JSON 解析失败: {e}")
+        return None
+    
+    def _get_training_section_info(self, section_id: str) -> Optional[Dict[str, Any]]:
+        """
+        通过训练营 API 获取小节对应的视频 ID
+        
+        Returns:
+            包含 video_id/title/duration 的字典，失败返回 None
+        """
+        cache_key = f"section:{section_id}"
+        cached = self._cache_get(cache_key)
+        if cached:
+            return cached
+        
+        def parse(api_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            # 尝试提取视频 ID
+            resource = api_data.get("resource", {})
+            if resource.get("type") != "video":
+                return None
+            
+            video_data = resource.get("data", {})
+            video_id = video_data.get("id")
+            if not video_id:
+                return None
+            
+            print(f"✓ 获取到视频 ID: {video_id[:50]}...")
+            return {
+                "video_id": video_id,
+                "title": api_data.get("title", ""),
+                "duration": video_data.get("duration", 0),
+                "source": "training_api"
+            }
+        
+        # 同时尝试多个可能的 API 端点
+        with self.metrics.phase("training_section"):
+            section_info = self._probe_endpoints(
+                self.TRAINING_SECTION_APIS,
+                {"section_id": section_id},
+                parse
+            )
+        if section_info:
+            self._cache_set(cache_key, section_info, MetadataCache.PAGE_TTL)
+        
+        return section_info
+    
+    def _get_video_info_from_page(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        从知乎页面获取视频信息
+        
+        对于训练营视频，需要先获取页面内容，提取 lens video ID
+        """
+        print(f"正在获取页面信息...")
+        
+        try:
+            with self.metrics.phase("page"):
+                response = self.session.get(url, timeout=30)
+                response.raise_for_status()
+                html_content = response.text
+            
             # 知乎训练营视频的特殊格式
             # 从页面数据中，视频 ID 格式如: "4zbweJq7bVyP6FeOy6FMVyqjFQ4ooFeo46bRe46fFe4b6FV_yqbFW4oFFe4h6be24qGReyzFFeZZx_6EC"
             # 这是加密的视频 ID
             
-            parsed = urlparse(url)
+            # 方法1: 从训练营 API 获取视频信息
+            # URL 格式: /xen/market/training/training-video/{productId}/{sectionId}
+            training_ids = self.parse_training_url(url)
+            if training_ids and training_ids[1]:
+                section_info = self._get_training_section_info(training_ids[1])
+                if section_info:
+                    return section_info
+            
+            # 方法2: 从页面嵌入的 JSON 数据 (或正则回退) 中提取视频 ID
+            with self.metrics.phase("page_parse"):
+                page_info = extract_video_from_page(html_content)
+            if page_info:
+                print(f"从页面数据获取到视频 ID: {page_info['video_id'][:50]}...")
+                return page_info
+            
+            print("⚠ 无法从页面中提取视频 ID")
+            print("  提示: 请确保已在 Chrome 中登录知乎并购买了该课程")
+            return None
+            
+        except requests.RequestException as e:
+            print(f"⚠ 获取页面失败: {e}")
+            return None
+    
+    def get_video_info(self, video_id: str, title: str = "",
+                       use_cache: bool = True) -> Optional[VideoInfo]:
+        """
+        获取视频信息，包括不同清晰度的播放地址
+        
+        Args:
+            video_id: 知乎 Lens 视频 ID (可能是数字 ID 或加密 ID)
+            title: 视频标题（可选，用于保存文件名）
+            use_cache: 是否使用缓存的播放列表
+            
+        Returns:
+            VideoInfo 对象，包含视频信息和播放地址
+        """
+        cache_key = f"video:{video_id}"
+        cached = self._cache_get(cache_key) if use_cache else None
+        if cached:
+            print("使用缓存的播放列表")
+            self.cdn_hosts.add_playlist(cached["playlist"])
+            return VideoInfo(
+                video_id=video_id,
+                title=title or cached["title"],
+                duration=cached["duration"],
+                playlist=cached["playlist"]
+            )
+        
+        def parse(data: Dict[str, Any]) -> Optional[VideoInfo]:
+            # 检查是否有播放列表
+            playlist = data.get("playlist", {})
+            
+            # 如果没有 playlist，尝试 playlist_v2
+            if not playlist:
+                playlist = data.get("playlist_v2", {})
+            
+            if not playlist:
+                print(f"  API 返回成功但没有播放列表")
+                return None
+            
+            api_title = data.get("title", f"zhihu_video_{video_id[:20]}")
+            if self.cache:
+                self._cache_set(cache_key, {
+                    "title": api_title,
+                    "duration": data.get("duration", 0),
+                    "playlist": playlist,
+                }, self.cache.playlist_ttl(playlist))
+            
+            # 各清晰度的播放地址可能位于不同的 CDN 节点，都可以作为备用主机
+            self.cdn_hosts.add_playlist(playlist)
+            
+            # 解析视频信息
+            return VideoInfo(
+                video_id=video_id,
+                title=title or api_title,
+                duration=data.get("duration", 0),
+                playlist=playlist
+            )
+        
+        # 知乎有多种视频 API:
+        # 1. 普通视频: https://lens.zhihu.com/api/v4/videos/{numeric_id}
+        # 2. 训练营视频: 需要特殊的认证
+        with self.metrics.phase("lens_video"):
+            video_info = self._probe_endpoints(
+                self.LENS_VIDEO_APIS,
+                {"video_id": video_id},
+                parse
+            )
+        if video_info:
+            return video_info
+        
+        # 如果所有 API 都失败，说明可能需要认证
+        print("\n⚠ 无法获取视频播放信息")
+        print("  可能的原因:")
+        print("  1. 这是付费视频，需要登录并购买")
+        print("  2. cookies 未正确加载或已过期")
+        print("  3. 视频 ID 无效")
+        print("\n  提示: 请尝试以下步骤:")
+        print("  1. 运行 'python export_cookies.py' 导出 cookies")
+        print("  2. 使用 '-c cookies.json' 参数指定 cookies 文件")
+        
+        return None
+    
+    @staticmethod
+    def get_download_options(video_info: VideoInfo) -> List[DownloadOption]:
+        """
+        获取视频的下载选项（不同清晰度）
+        
+        Args:
+            video_info: 视频信息对象
             
-            # 方法1: 从训练营 API 获取视频信息
-            # URL 格式: /xen/market/training/training-video/{productId}/{sectionId}
-            if "/training-video/" in parsed.path:
-                path_parts = parsed.path.rstrip("/").split("/")
-                if len(path_parts) >= 2:
-                    product_id = path_parts[-2]
-                    section_id = path_parts[-1]
-                    
-                    # 尝试多个可能的 API 端点
-                    api_endpoints = [
-                        f"https://www.zhihu.com/api/infinity/training/section/{section_id}",
-                        f"https://www.zhihu.com/api/v4/market/training/section/{section_id}",
-                        f"https://api.zhihu.com/infinity/training/section/{section_id}",
+        Returns:
+            下载选项列表
+        """
+        options = []
+        
+        playlist = video_info.playlist
+        
+        for quality in ZhihuVideoDownloader.QUALITY_ORDER:
+            if quality in playlist:
+                item = playlist[quality]
+                option = DownloadOption(
+                    quality=quality,
+                    width=item.get("width", 0),
+                    height=item.get("height", 0),
+                    format=item.get("format", "m3u8"),
+                    play_url=item.get("play_url", ""),
+                    size=item.get("size")
+                )
+                if option.play_url:
+                    options.append(option)
+        
+        return options
+    
+    @staticmethod
+    def select_download_option(options: List[DownloadOption], quality: str) -> DownloadOption:
+        """
+        选择下载选项: 优先使用请求的清晰度，没有时选择最高清晰度
+        
+        Args:
+            options: get_download_options 返回的下载选项 (不能为空)
+            quality: 期望的视频质量 (uhd/fhd/hd/sd/ld)
+        """
+        # 首先尝试找到请求的清晰度
+        for opt in options:
+            if opt.quality == quality:
+                return opt
+        
+        # 如果没找到，选择最高清晰度
+        for q in ZhihuVideoDownloader.QUALITY_ORDER:
+            for opt in options:
+                if opt.quality == q:
+                    return opt
+        
+        return options[0]
+    
+    @staticmethod
+    def estimate_option_sizes(options: List[DownloadOption],
+                              duration: float) -> List[Optional[float]]:
+        """
+        估计各清晰度的文件大小 (字节)
+        
+        使用播放列表中的 size；没有 size 的清晰度按分辨率 (像素数) 从有 size 的清晰度
+        换算，duration 相同时文件大小大致与像素数成正比。
+        
+        Args:
+            options: 下载选项
+            duration: 视频时长 (秒)，用于在没有任何 size 时返回 None
+            
+        Returns:
+            与 options 一一对应的估计大小，无法估计时为 None
+        """
+        references = [
+            (opt.size, opt.width * opt.height) for opt in options
+            if opt.size and opt.width and opt.height
+        ]
+        sizes = []
+        for opt in options:
+            if opt.size:
+                sizes.append(float(opt.size))
+            elif references and opt.width and opt.height and duration > 0:
+                # 用分辨率最接近的清晰度换算
+                size, pixels = min(
+                    references, key=lambda ref: abs(ref[1] - opt.width * opt.height)
+                )
+                sizes.append(size * opt.width * opt.height / pixels)
+            else:
+                sizes.append(None)
+        return sizes
+    
+    @staticmethod
+    def select_auto_option(options: List[DownloadOption], sizes: List[Optional[float]],
+                           rate: float, time_budget: float) -> Optional[DownloadOption]:
+        """
+        选择能在时间预算内下载完成的最高清晰度
+        
+        Args:
+            options: 下载选项 (从高到低排列，与 get_download_options 一致)
+            sizes: estimate_option_sizes 估计的各清晰度大小
+            rate: 可用带宽 (字节/秒)
+            time_budget: 时间预算 (秒)
+            
+        Returns:
+            选中的下载选项；都无法在预算内完成时返回估计大小最小的选项，
+            没有任何估计大小时返回 None
+        """
+        candidates = [(opt, size) for opt, size in zip(options, sizes) if size]
+        if not candidates or rate <= 0:
+            return None
+        
+        for opt, size in candidates:
+            if size / rate <= time_budget:
+                return opt
+        return min(candidates, key=lambda candidate: candidate[1])[0]
+    
+    def _probe_throughput(self, option: DownloadOption) -> Optional[float]:
+        """
+        计时下载选项开头的一小部分，估计可用带宽 (字节/秒)
+        
+        MP4 视频并发请求开头的几个字节范围，M3U8 视频并发下载前几个分片，用与正式
+        下载相似的并发方式测量总吞吐量。同一主机的结果在 AUTO_PROBE_TTL 秒内复用；
+        多个线程同时测速同一主机时只测一次，其余线程等待并使用同一个结果。
+        
+        Returns:
+            字节/秒，测速失败时返回 None
+        """
+        host = urlparse(option.play_url).netloc
+        with self._throughput_lock:
+            cached = self._throughput.get(host)
+            if cached and time.monotonic() - cached[1] < self.AUTO_PROBE_TTL:
+                return cached[0]
+            probe = self._throughput_probes.get(host)
+            owner = probe is None
+            if owner:
+                probe = Future()
+                self._throughput_probes[host] = probe
+        
+        if not owner:
+            return probe.result()
+        
+        # 测速期间不持有锁，其他主机的测速和缓存读取不受影响
+        rate = None
+        try:
+            rate = self._measure_throughput(option)
+        finally:
+            with self._throughput_lock:
+                if rate:
+                    self._throughput[host] = (rate, time.monotonic())
+                del self._throughput_probes[host]
+            probe.set_result(rate)
+        return rate
+    
+    def _measure_throughput(self, option: DownloadOption) -> Optional[float]:
+        """实际的测速请求 (见 _probe_throughput)，失败时返回 None"""
+        try:
+            with self.metrics.phase("quality_probe"):
+                if option.format == "m3u8" or ".m3u8" in option.play_url:
+                    playlist = self._load_m3u8_playlist(option.play_url)
+                    requests_to_time = [
+                        (segment.absolute_uri, None)
+                        for segment in playlist.segments[:self.AUTO_PROBE_SEGMENTS]
+                    ]
+                else:
+                    size = self.AUTO_PROBE_RANGE_SIZE
+                    requests_to_time = [
+                        (option.play_url, {"Range": f"bytes={index * size}-{(index + 1) * size - 1}"})
+                        for index in range(self.AUTO_PROBE_RANGES)
                     ]
+                if not requests_to_time:
+                    return None
+                
+                def fetch(request: Tuple[str, Optional[Dict[str, str]]]) -> int:
+                    url, headers = request
+                    with self.session.get(url, headers=headers, stream=True,
+                                          timeout=30) as response:
+                        # 文件比测速范围小
+                        if response.status_code == 416:
+                            return 0
+                        response.raise_for_status()
+                        size = 0
+                        for chunk in response.iter_content(chunk_size=65536):
+                            size += len(chunk)
+                            # 服务器不支持 Range 时只读取一个范围的大小
+                            if headers and size >= self.AUTO_PROBE_RANGE_SIZE:
+                                break
+                        return size
+                
+                started = time.monotonic()
+                with ThreadPoolExecutor(max_workers=len(requests_to_time)) as executor:
+                    total = sum(executor.map(fetch, requests_to_time))
+                elapsed = time.monotonic() - started
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠ 测速失败: {e}")
+            return None
+        
+        if not total or elapsed <= 0:
+            return None
+        return total / elapsed
+    
+    def _select_option_automatically(self, options: List[DownloadOption],
+                                     video_info: VideoInfo,
+                                     deadline: Optional[float] = None,
+                                     bandwidth_share: float = 1.0) -> DownloadOption:
+        """
+        自动清晰度: 根据各清晰度的大小和测得的带宽，选择能在时间预算内下载完成的最高清晰度
+        
+        Args:
+            options: 下载选项
+            video_info: 视频信息 (时长)
+            deadline: 时间预算 (秒)，None 表示视频时长 (下载速度不低于播放速度)
+            bandwidth_share: 本视频可以使用的带宽比例 (整课下载时多个视频同时下载)
+        """
+        fallback = self.select_download_option(options, self.AUTO_FALLBACK_QUALITY)
+        duration = video_info.duration / 1000
+        time_budget = deadline if deadline is not None else duration
+        sizes = self.estimate_option_sizes(options, duration)
+        if not time_budget or not any(sizes):
+            print(f"⚠ 缺少视频大小或时长信息，自动清晰度使用 {fallback.quality}")
+            return fallback
+        
+        rate = self._probe_throughput(options[0])
+        if self.max_rate:
+            rate = min(rate, self.max_rate) if rate else self.max_rate
+        if not rate:
+            print(f"⚠ 无法估计带宽，自动清晰度使用 {fallback.quality}")
+            return fallback
+        rate *= bandwidth_share
+        
+        selected = self.select_auto_option(options, sizes, rate, time_budget) or fallback
+        size = sizes[options.index(selected)]
+        print(
+            f"\n自动清晰度: 可用带宽 {rate / 1024 / 1024:.2f} MB/s，时间预算 {time_budget:.0f} 秒"
+        )
+        if size:
+            estimate = size / rate
+            flag = "" if estimate <= time_budget else " (⚠ 最低清晰度也无法在预算内完成)"
+            print(f"  预计大小 {size / 1024 / 1024:.1f} MB，预计耗时 {estimate:.0f} 秒{flag}")
+        return selected
+    
+    @staticmethod
+    def output_path_for(title: str, output_dir: str) -> Path:
+        """根据视频标题生成输出文件路径 (会创建输出目录)"""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        
+        # 清理文件名
+        safe_title = re.sub(r'[<>:"/\\|?*]', '_', title)
+        safe_title = safe_title[:100]  # 限制长度
+        
+        return output_dir / f"{safe_title}.mp4"
+    
+    def _output_path_for_video(self, video_info: VideoInfo, output_dir: str,
+                               clip: Optional[ClipRange] = None) -> Path:
+        """
+        生成视频的输出文件路径
+        
+        标题被截断或重复时，不同的视频可能得到同一个文件名；已下载文件索引显示该文件属于
+        其他视频时，在文件名后加上视频 ID 前缀，避免覆盖。
+        片段下载时在文件名后加上片段范围，如 ``标题 [10m00s-15m00s].mp4``。
+        """
+        output_path = self.output_path_for(video_info.title, output_dir)
+        if clip:
+            output_path = output_path.with_name(
+                f"{output_path.stem} [{clip.label}]{output_path.suffix}"
+            )
+        if self.store and output_path.exists():
+            owner = self.store.owner(str(output_path))
+            if owner and owner[0] != video_info.video_id:
+                output_path = output_path.with_name(
+                    f"{output_path.stem} ({video_info.video_id[:8]}){output_path.suffix}"
+                )
+        return output_path
+    
+    def _reuse_download(self, video_info: VideoInfo, qualities: List[str],
+                        output_dir: str) -> Optional[str]:
+        """
+        同一视频已经下载过时直接复用，不经过网络
+        
+        已有文件不在输出目录中时，创建硬链接 (跨文件系统时复制) 到输出路径。
+        
+        Args:
+            video_info: 视频信息
+            qualities: 可以接受的清晰度，按优先级排列
+            output_dir: 输出目录
+            
+        Returns:
+            复用的文件路径，没有可复用的文件时返回 None
+        """
+        if not self.store:
+            return None
+        
+        found = self.store.find(video_info.video_id, qualities)
+        if not found:
+            return None
+        existing, quality, sha256 = found
+        
+        output_path = os.path.abspath(self._output_path_for_video(video_info, output_dir))
+        if existing != output_path:
+            tmp_path = output_path + ".link"
+            try:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(tmp_path)
+                try:
+                    os.link(existing, tmp_path)
+                except OSError:
+                    shutil.copy2(existing, tmp_path)
+                os.replace(tmp_path, output_path)
+            except OSError as e:
+                print(f"⚠ 无法复用已下载的文件 {existing}: {e}")
+                return None
+            self.store.add(video_info.video_id, quality, output_path, sha256)
+        
+        print(f"\n✓ 已下载过该视频 ({quality})，直接复用: {existing}")
+        return output_path
+    
+    def _download_m3u8_video(self, m3u8_url: str, output_path: str, 
+                             progress: Optional[ProgressTracker] = None,
+                             manifest: Optional[DownloadManifest] = None,
+                             source: Optional[PlayUrlSource] = None,
+                             clip: Optional[ClipRange] = None) -> bool:
+        """
+        下载 M3U8 视频流
+        
+        优先使用内置的分片引擎并发下载所有 .ts 分片，再交给 ffmpeg 合并；
+        播放列表不受支持或分片下载失败时，回退到 ffmpeg 直接下载。
+        
+        Args:
+            m3u8_url: M3U8 播放列表 URL
+            output_path: 输出文件路径
+            progress: 进度统计 (可选)
+            manifest: 断点续传清单 (可选)
+            source: 可以在签名过期时刷新的播放地址 (可选)
+            clip: 只下载其中一段 (可选)
+            
+        Returns:
+            是否下载成功
+        """
+        source = source or PlayUrlSource(m3u8_url)
+        # 检查 ffmpeg 是否可用
+        ffmpeg_path = shutil.which("ffmpeg")
+        if not ffmpeg_path:
+            print("⚠ 未找到 ffmpeg，请先安装: brew install ffmpeg")
+            return False
+        
+        print(f"M3U8 URL: {m3u8_url[:100]}...")
+        
+        if self.segment_workers > 0:
+            result = self._download_m3u8_segments(
+                source, output_path, ffmpeg_path, progress, manifest, clip
+            )
+            if result is not None:
+                return result
+            print("回退到 ffmpeg 直接下载...")
+        
+        return self._download_m3u8_with_ffmpeg(
+            source.play_url, output_path, ffmpeg_path, progress, clip
+        )
+    
+    def _load_m3u8_playlist(self, m3u8_url: str) -> "m3u8.M3U8":
+        """
+        获取并解析 M3U8 播放列表
+        
+        如果是主播放列表 (包含多个码率)，选择码率最高的子播放列表
+        """
+        m3u8 = _load_m3u8_module()
+        response = self._with_retries(
+            "获取播放列表", m3u8_url, lambda: self._get_complete(m3u8_url, timeout=30)
+        )
+        
+        playlist = m3u8.loads(response.text, uri=m3u8_url)
+        if playlist.is_variant:
+            best = max(
+                playlist.playlists,
+                key=lambda p: p.stream_info.bandwidth or 0
+            )
+            return self._load_m3u8_playlist(best.absolute_uri)
+        
+        self.cdn_hosts.add_urls(segment.absolute_uri for segment in playlist.segments)
+        return playlist
+    
+    def _match_segment_urls(self, m3u8_url: str, segment_keys: List[str],
+                            media_sequence: int) -> Optional[List[str]]:
+        """
+        获取刷新后的播放列表，找到与原播放列表各分片对应的新分片地址
+        
+        先按分片路径 (不含签名参数) 对应；路径中也带有签名时按媒体序号对应。
+        
+        Args:
+            m3u8_url: 新的播放列表地址
+            segment_keys: 原播放列表各分片的路径
+            media_sequence: 原播放列表的 EXT-X-MEDIA-SEQUENCE
+            
+        Returns:
+            按原分片顺序排列的新分片地址，无法对应时返回 None
+        """
+        try:
+            playlist = self._load_m3u8_playlist(m3u8_url)
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠ 获取新的播放列表失败: {e}")
+            return None
+        
+        segments = playlist.segments
+        by_key = {urlparse(segment.absolute_uri).path: segment.absolute_uri for segment in segments}
+        if all(key in by_key for key in segment_keys):
+            return [by_key[key] for key in segment_keys]
+        
+        offset = media_sequence - (playlist.media_sequence or 0)
+        if 0 <= offset and offset + len(segment_keys) <= len(segments):
+            return [segment.absolute_uri for segment in segments[offset:offset + len(segment_keys)]]
+        
+        print("⚠ 新的播放列表与原播放列表的分片不一致")
+        return None
+    
+    def _load_segment_keys(self, playlist: "m3u8.M3U8",
+                           selected: Optional[range] = None) -> List[Optional[Tuple[bytes, bytes]]]:
+        """
+        获取加密分片的密钥和 IV (#EXT-X-KEY METHOD=AES-128，见 _segment_key_ivs)
+        
+        每个密钥 URI 只请求一次，在整个播放列表中复用。
+        
+        Args:
+            selected: 只获取这些分片的密钥 (片段下载)，默认为所有分片
+        
+        Returns:
+            每个分片的 (密钥, IV)，未加密或未选中的分片为 None
+            
+        Raises:
+            ValueError: 不支持的加密方式 (如 SAMPLE-AES)，或密钥无效
+            requests.RequestException: 获取密钥失败
+        """
+        keys: Dict[str, bytes] = {}
+        result: List[Optional[Tuple[bytes, bytes]]] = []
+        for uri_iv in _segment_key_ivs(playlist, selected):
+            if uri_iv is None:
+                result.append(None)
+                continue
+            
+            uri, iv = uri_iv
+            if uri not in keys:
+                response = self._with_retries(
+                    "获取解密密钥", uri, lambda: self._get_complete(uri, timeout=30)
+                )
+                if len(response.content) != SegmentDecryptor.BLOCK_SIZE:
+                    raise ValueError(f"解密密钥长度应为 16 字节，实际为 {len(response.content)} 字节")
+                keys[uri] = response.content
+            result.append((keys[uri], iv))
+        
+        return result
+    
+    def _with_retries(self, description: str, url: str, func,
+                      abort: Optional[threading.Event] = None,
+                      source: Optional[PlayUrlSource] = None):
+        """
+        调用 func()，失败可能是暂时性的 (见 _is_retryable) 时按指数退避加随机抖动重试
+        
+        func 每次调用只应请求尚未完成的部分，重试时不会重复下载已经完成的数据。
+        响应带有 Retry-After 时至少等待指定的时间；abort 被设置后不再重试。
+        
+        提供 source 时，func 每次调用都应从 source 读取当前地址；收到 403 且签名地址
+        已经过期时先刷新地址 (见 PlayUrlSource.refresh_after_forbidden)，再立即重试，
+        不计入重试次数。func 抛出 HostFailoverError 时同样立即重试 (最多 MAX_FAILOVERS 次)。
+        
+        Args:
+            description: 失败提示中的操作名称
+            url: 请求的 URL，用于按主机记录重试次数
+            func: 不带参数的下载函数
+            abort: 取消重试的事件 (可选)
+            source: 可以刷新的签名播放地址 (可选)
+            
+        Returns:
+            func 的返回值
+        """
+        attempt = 0
+        failovers = 0
+        while True:
+            generation = source.generation if source else 0
+            try:
+                return func()
+            except requests.RequestException as e:
+                if abort and abort.is_set():
+                    raise
+                
+                response = getattr(e, "response", None)
+                if source and response is not None and response.status_code == 403:
+                    if source.refresh_after_forbidden(response.url or url, generation):
+                        continue
+                
+                if isinstance(e, HostFailoverError) and failovers < self.MAX_FAILOVERS:
+                    failovers += 1
+                    print(f"\n⚠ {description}: {e}")
+                    continue
+                
+                if attempt >= self.PIECE_RETRIES or not _is_retryable(e):
+                    raise
+                
+                delay = _backoff_delay(attempt, self.RETRY_BASE_DELAY, self.RETRY_MAX_DELAY)
+                if response is not None:
+                    delay = max(delay, _parse_retry_after(response.headers.get("Retry-After")) or 0)
+                attempt += 1
+                
+                self.metrics.record_retry(urlparse(url).netloc)
+                print(f"\n⚠ {description}失败: {e}，{delay:.1f} 秒后重试 "
+                      f"({attempt}/{self.PIECE_RETRIES})")
+                if abort:
+                    if abort.wait(delay):
+                        raise
+                else:
+                    time.sleep(delay)
+    
+    def _get_complete(self, url: str, **kwargs) -> requests.Response:
+        """GET 请求并读取完整的响应体，状态码错误或响应不完整时抛出异常"""
+        response = self.session.get(url, **kwargs)
+        response.raise_for_status()
+        _check_length(response, len(response.content))
+        return response
+    
+    def _stream_from_cdn(self, url: str, on_chunk: Callable[[bytes], None],
+                         headers: Optional[Dict[str, str]] = None):
+        """
+        通过 CdnHostSelector 选择的主机下载 url，每收到一个数据块调用 on_chunk
+        
+        状态码错误、传输卡顿或响应不完整时抛出异常 (可能是 HostFailoverError)；
+        带 Range 请求头时服务器必须返回 206
+        """
+        with self.cdn_hosts.transfer(url) as transfer:
+            with self.session.get(transfer.url, headers=headers, stream=True,
+                                  timeout=transfer.timeout) as response:
+                response.raise_for_status()
+                if headers and "Range" in headers and response.status_code != 206:
+                    raise requests.RequestException(
+                        f"服务器没有按 Range 返回数据 (状态码: {response.status_code})"
+                    )
+                transfer.start()
+                for chunk in response.iter_content(chunk_size=65536):
+                    if not chunk:
+                        continue
+                    on_chunk(chunk)
+                    transfer.add(len(chunk))
+                _check_length(response, transfer.bytes)
+    
+    def _fetch_segment(self, source: PlayUrlSource, index: int, path: str,
+                       decryptor_for: Optional[Callable[[int], Optional[SegmentDecryptor]]] = None
+                       ) -> Tuple[int, str]:
+        """
+        下载单个分片到文件，失败时重试 (见 _with_retries)
+        
+        先写入临时文件，完整下载并且长度与 Content-Length 一致后再改名，
+        避免留下不完整的分片。加密的分片在下载线程中边下载边解密，文件中保存明文。
+        
+        Args:
+            decryptor_for: 返回分片解密器的函数 (可选)，分片未加密时返回 None
+        
+        Returns:
+            (分片字节数, SHA-256 校验值)，均按解密后的内容计算
+        """
+        def fetch() -> Tuple[int, str]:
+            decryptor = decryptor_for(index) if decryptor_for else None
+            size = 0
+            digest = hashlib.sha256()
+            tmp_path = path + ".part"
+            with open(tmp_path, 'wb') as f:
+                def write(data: bytes):
+                    nonlocal size
+                    f.write(data)
+                    digest.update(data)
+                    size += len(data)
+                
+                self._stream_from_cdn(
+                    source.segment_urls[index],
+                    lambda chunk: write(decryptor.update(chunk) if decryptor else chunk)
+                )
+                if decryptor:
+                    write(decryptor.finalize())
+            os.replace(tmp_path, path)
+            return size, digest.hexdigest()
+        
+        return self._with_retries(
+            f"分片 {index + 1} 下载", source.segment_urls[index], fetch, source=source
+        )
+    
+    def _download_m3u8_segments(self, source: PlayUrlSource, output_path: str,
+                                ffmpeg_path: str,
+                                progress: Optional[ProgressTracker] = None,
+                                manifest: Optional[DownloadManifest] = None,
+                                clip: Optional[ClipRange] = None) -> Optional[bool]:
+        """
+        使用线程池并发下载 M3U8 分片，按顺序交给 ffmpeg 合并
+        
+        提供断点续传清单时，分片保存在输出文件旁边，已完成且校验一致的分片不再重新下载。
+        分片地址的签名过期时，重新获取播放列表并从失败的分片继续 (见 PlayUrlSource)。
+        片段下载时按 #EXTINF 时长只下载覆盖片段的分片，合并时再按时间裁剪 (-c copy)。
+        单个分片失败不影响其余分片，其余分片下载完后只重新下载失败的分片。
+        
+        Returns:
+            True/False 表示下载和合并是否成功；None 表示该播放列表不适用此方式 (还没有开始下载分片)，
+            需要回退到 ffmpeg 直接下载
+        """
+        try:
+            with self.metrics.phase("playlist"):
+                playlist = self._load_m3u8_playlist(source.play_url)
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠ 解析 M3U8 播放列表失败: {e}")
+            return None
+        
+        segments = playlist.segments
+        if not segments:
+            print("⚠ 播放列表中没有分片")
+            return None
+        
+        # fMP4 初始化分片和字节范围分片暂不支持
+        if playlist.segment_map or any(seg.byterange for seg in segments):
+            print("播放列表包含 fMP4 或字节范围分片")
+            return None
+        
+        # 片段下载: 只保留覆盖片段的分片，clip_offset 为片段开始相对第一个分片的时间
+        first, last, clip_offset = 0, len(segments), 0.0
+        if clip:
+            first, last, clip_offset = _covering_segments(
+                [segment.duration or 0.0 for segment in segments], clip.start, clip.end
+            )
+            if first >= last:
+                print("⚠ 片段开始时间超过了视频时长")
+                return False
+            print(f"片段下载: 第 {first + 1}-{last} 个分片 (共 {len(segments)} 个)")
+        
+        decryptor_for = None
+        if any(key and key.method and key.method != "NONE" for key in playlist.keys):
+            try:
+                new_decryptor = _load_aes_cbc()
+                with self.metrics.phase("playlist"):
+                    segment_keys_ivs = self._load_segment_keys(playlist, range(first, last))
+            except (requests.RequestException, ValueError) as e:
+                print(f"⚠ 无法解密分片: {e}")
+                return None
+            print("播放列表包含 AES-128 加密分片，下载后解密")
+            
+            def decryptor_for(index: int) -> Optional[SegmentDecryptor]:
+                key_iv = segment_keys_ivs[first + index]
+                return SegmentDecryptor(new_decryptor, *key_iv) if key_iv else None
+        
+        segments = segments[first:last]
+        total = len(segments)
+        segment_keys = [urlparse(segment.absolute_uri).path for segment in segments]
+        media_sequence = (playlist.media_sequence or 0) + first
+        source.set_segments(
+            [segment.absolute_uri for segment in segments],
+            lambda play_url: self._match_segment_urls(play_url, segment_keys, media_sequence)
+        )
+        
+        if self.pipe_remux:
+            if not manifest:
+                return self._remux_segments_piped(
+                    source, output_path, ffmpeg_path, progress, decryptor_for, clip, clip_offset
+                )
+            print("断点续传需要保存分片，不使用流式合并")
+        
+        # 断点续传时分片保存在输出文件旁边，否则使用临时目录
+        if manifest:
+            os.makedirs(manifest.segments_dir, exist_ok=True)
+            work_context = contextlib.nullcontext(manifest.segments_dir)
+        else:
+            work_context = tempfile.TemporaryDirectory(prefix="zhihu_hls_")
+        
+        with work_context as work_dir:
+            segment_paths = [
+                os.path.join(work_dir, f"{index:06d}.ts") for index in range(total)
+            ]
+            
+            pending = list(range(total))
+            if manifest:
+                pending = [
+                    index for index in pending
+                    if not manifest.is_segment_done(
+                        index, segment_keys[index], segment_paths[index]
+                    )
+                ]
+                if len(pending) < total:
+                    print(f"断点续传: 已完成 {total - len(pending)}/{total} 个分片")
+            
+            if progress:
+                progress.set_total(segments_total=total)
+                pending_set = set(pending)
+                done_bytes = sum(
+                    os.path.getsize(segment_paths[index])
+                    for index in range(total) if index not in pending_set
+                )
+                progress.advance(done_bytes, total - len(pending), transferred=False)
+            
+            print(f"使用 {self.segment_workers} 个线程下载 {len(pending)} 个分片...")
+            
+            completed = total - len(pending)
+            downloaded_bytes = 0
+            
+            def retryable(error: Exception) -> bool:
+                return isinstance(error, requests.RequestException) and _is_retryable(error)
+            
+            def download_round(indices: List[int]) -> Tuple[List[int], Optional[Exception]]:
+                """
+                下载一轮分片，返回 (没有下载完成的分片, 错误)
+                
+                分片失败时其余分片继续下载；错误不可重试 (如 404、写入失败) 时取消其余分片。
+                """
+                nonlocal completed, downloaded_bytes
+                done = set()
+                error: Optional[Exception] = None
+                with ThreadPoolExecutor(max_workers=self.segment_workers) as executor:
+                    futures = {
+                        executor.submit(
+                            self._fetch_segment, source, index, segment_paths[index],
+                            decryptor_for
+                        ): index
+                        for index in indices
+                    }
                     
-                    for training_api_url in api_endpoints:
-                        print(f"尝试 API: {training_api_url}")
+                    for future in as_completed(futures):
+                        if future.cancelled():
+                            continue
                         try:
-                            api_response = self.session.get(training_api_url, timeout=30)
-                            if api_response.status_code == 200:
-                                api_data = api_response.json()
-                                # 尝试提取视频 ID
-                                resource = api_data.get("resource", {})
-                                if resource.get("type") == "video":
-                                    video_data = resource.get("data", {})
-                                    video_id = video_data.get("id")
-                                    if video_id:
-                                        print(f"✓ 获取到视频 ID: {video_id[:50]}...")
-                                        return {
-                                            "video_id": video_id,
-                                            "title": api_data.get("title", ""),
-                                            "duration": video_data.get("duration", 0),
-                                            "source": "training_api"
-                                        }
-                        except Exception as e:
+                            size, sha256 = future.result()
+                        except (requests.RequestException, OSError, ValueError) as e:
+                            if error is None or retryable(error):
+                                error = e
+                            if not retryable(e):
+                                for other in futures:
+                                    other.cancel()
                             continue
-            
-            # 方法2: 从页面 HTML/JSON 中提取视频 ID
-            # 知乎页面通常在 script 标签中嵌入 JSON 数据
-            
-            # 查找 resource.data.id 格式的视频 ID
-            patterns = [
-                # 加密视频 ID (训练营)
-                r'"resource"\s*:\s*\{[^}]*"data"\s*:\s*\{[^}]*"id"\s*:\s*"([a-zA-Z0-9_-]{20,})"',
-                # 在更大的 JSON 结构中查找
-                r'"id"\s*:\s*"([a-zA-Z0-9_-]{40,})"[^}]*"type"\s*:\s*"video"',
-                r'"type"\s*:\s*"video"[^}]*"data"\s*:\s*\{[^}]*"id"\s*:\s*"([a-zA-Z0-9_-]{20,})"',
-                # 普通数字视频 ID
-                r'"video_id"\s*:\s*"(\d+)"',
-                r'data-lens-id="(\d+)"',
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, html_content, re.DOTALL)
-                if match:
-                    video_id = match.group(1)
-                    # 过滤掉太短的 ID
-                    if len(video_id) > 10:
-                        print(f"从页面匹配到视频 ID: {video_id[:50]}...")
                         
-                        # 尝试提取标题
-                        title = ""
-                        title_match = re.search(r'"title"\s*:\s*"([^"]+)"', html_content)
-                        if title_match:
-                            title = title_match.group(1)
+                        index = futures[future]
+                        done.add(index)
+                        if manifest:
+                            manifest.mark_segment(index, segment_keys[index], size, sha256)
+                        if progress:
+                            try:
+                                progress.advance(size, 1)
+                            except DownloadCancelled:
+                                # 只等待正在下载的分片
+                                for other in futures:
+                                    other.cancel()
+                                if manifest:
+                                    manifest.save()
+                                raise
                         
-                        return {"video_id": video_id, "title": title, "source": "regex"}
+                        completed += 1
+                        downloaded_bytes += size
+                        print(
+                            f"\r下载分片... {completed}/{total} "
+                            f"({downloaded_bytes / 1024 / 1024:.1f} MB)",
+                            end="", flush=True
+                        )
+                return [index for index in indices if index not in done], error
             
-            # 方法3: 查找 __connectedAutoFetch 中的数据
-            connected_match = re.search(
-                r'"__connectedAutoFetch"\s*:\s*\{.*?"trainingVideo"\s*:\s*\{.*?"data"\s*:\s*(\{.*?\})\s*,\s*"error"',
-                html_content,
-                re.DOTALL
-            )
-            if connected_match:
-                try:
-                    data_str = connected_match.group(1)
-                    # 提取视频信息
-                    video_info_match = re.search(r'"videoInfo"\s*:\s*\{[^}]*"resource"\s*:\s*\{[^}]*"data"\s*:\s*\{[^}]*"id"\s*:\s*"([^"]+)"', data_str)
-                    if video_info_match:
-                        video_id = video_info_match.group(1)
-                        print(f"从 trainingVideo 数据获取到视频 ID: {video_id[:50]}...")
-                        return {"video_id": video_id, "source": "trainingVideo"}
-                except:
-                    pass
+            with self.metrics.phase("segments"):
+                missing, error = download_round(pending)
+                for _ in range(self.SEGMENT_RETRY_ROUNDS):
+                    if not missing or not retryable(error):
+                        break
+                    print(f"\n⚠ {len(missing)} 个分片下载失败 ({error})，重新下载这些分片...")
+                    missing, error = download_round(missing)
+            print()
             
-            print("⚠ 无法从页面中提取视频 ID")
-            print("  提示: 请确保已在 Chrome 中登录知乎并购买了该课程")
-            return None
+            if manifest:
+                manifest.save()
             
-        except requests.RequestException as e:
-            print(f"⚠ 获取页面失败: {e}")
-            return None
+            if missing:
+                print(f"⚠ {len(missing)} 个分片下载失败: {error}")
+                if manifest:
+                    # 保留已下载的分片，下次运行时继续
+                    print("  已保存下载进度，重新运行即可继续下载")
+                return False
+            
+            # 按播放顺序生成 concat 列表，交给 ffmpeg 合并 (不重新编码)
+            list_path = os.path.join(work_dir, "segments.txt")
+            with open(list_path, 'w', encoding='utf-8') as f:
+                for path in segment_paths:
+                    f.write(f"file '{path}'\n")
+            
+            # 片段下载时在合并的同时裁剪 (-ss 在 -i 之前为输入端定位)
+            cmd = [
+                ffmpeg_path,
+                "-f", "concat",
+                "-safe", "0",
+                *(clip.seek_args(clip_offset) if clip else []),
+                "-i", list_path,
+                *(clip.length_args() if clip else []),
+                "-c", "copy",
+                "-bsf:a", "aac_adtstoasc",
+                "-y",
+                output_path
+            ]
+            
+            if progress:
+                progress.set_phase("remux")
+            
+            try:
+                returncode, stderr_output = self._run_ffmpeg(cmd, "合并中... 已处理", progress)
+            except subprocess.SubprocessError as e:
+                print(f"⚠ 运行 ffmpeg 失败: {e}")
+                return False
+            
+            if returncode != 0:
+                print(f"⚠ ffmpeg 合并失败 (exit code: {returncode})")
+                error_lines = [l for l in stderr_output if l.strip()][-5:]
+                for line in error_lines:
+                    print(f"  {line.strip()}")
+                return False
+        
+        if manifest:
+            shutil.rmtree(manifest.segments_dir, ignore_errors=True)
+        
+        return True
     
-    def get_video_info(self, video_id: str, title: str = "") -> Optional[VideoInfo]:
+    def _remux_segments_piped(self, source: PlayUrlSource, output_path: str,
+                              ffmpeg_path: str,
+                              progress: Optional[ProgressTracker] = None,
+                              decryptor_for: Optional[Callable[[int], Optional[SegmentDecryptor]]] = None,
+                              clip: Optional[ClipRange] = None,
+                              clip_offset: float = 0.0) -> bool:
         """
-        获取视频信息，包括不同清晰度的播放地址
+        并发下载分片，按播放顺序直接写入 ffmpeg 的标准输入 (-c copy)
+        
+        提前下载完成的分片暂存在内存中的重排缓冲区；下载线程只会领先尚未写入的
+        第一个分片 reorder_limit 个分片，ffmpeg 处理较慢时写入阻塞，下载随之暂停，
+        内存占用有上限。合并与下载同时进行，不需要临时文件。
+        加密的分片在下载线程中解密 (见 SegmentDecryptor)，写入 ffmpeg 的线程只负责按顺序写入。
+        片段下载时标准输入不能定位，先把覆盖片段的分片合并到 ``<输出文件>.part``，
+        再与 MP4 片段相同用 _trim_clip 从第一个分片的 clip_offset 秒处裁剪 (输入端定位，从之前最近的关键帧开始)。
+        
+        与保存分片的方式一样，分片的重试次数用完后还会再下载 SEGMENT_RETRY_ROUNDS 轮
+        (只重新下载这个分片，已经写入 ffmpeg 的数据不受影响)；仍然失败时下载失败，
+        不再回退到 ffmpeg 重新下载整个视频。
         
-        Args:
-            video_id: 知乎 Lens 视频 ID (可能是数字 ID 或加密 ID)
-            title: 视频标题（可选，用于保存文件名）
-            
         Returns:
-            VideoInfo 对象，包含视频信息和播放地址
+            True/False 表示下载和合并是否成功
         """
-        # 知乎有多种视频 API:
-        # 1. 普通视频: https://lens.zhihu.com/api/v4/videos/{numeric_id}
-        # 2. 训练营视频: 需要特殊的认证
+        total = len(source.segment_urls)
+        reorder_limit = max(self.PIPE_REORDER_SEGMENTS, self.segment_workers * 2)
+        if progress:
+            progress.set_total(segments_total=total)
+        print(f"使用 {self.segment_workers} 个线程下载 {total} 个分片 (流式合并)...")
         
-        # 尝试多个 API 端点
-        api_urls = [
-            f"{self.LENS_API_BASE}/{video_id}",
-            f"https://lens.zhihu.com/api/videos/{video_id}",
+        # 标准输入不能定位，片段下载时先合并到未完成文件，之后再裁剪
+        remux_path = output_path + ".part" if clip else output_path
+        cmd = [
+            ffmpeg_path,
+            "-f", "mpegts",
+            "-i", "pipe:0",
+            "-c", "copy",
+            "-bsf:a", "aac_adtstoasc",
+            *(["-f", "mp4"] if clip else []),
+            "-y",
+            remux_path
         ]
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"⚠ 运行 ffmpeg 失败: {e}")
+            return False
+        
+        # 只保留 ffmpeg 最后几行输出，用于显示错误信息
+        stderr_tail = deque(maxlen=5)
+        stderr_reader = threading.Thread(
+            target=lambda: stderr_tail.extend(
+                line.decode("utf-8", errors="replace").strip()
+                for line in process.stderr if line.strip()
+            ),
+            daemon=True
+        )
+        stderr_reader.start()
+        ffmpeg_started = time.monotonic()
+        
+        buffer: Dict[int, bytes] = {}
+        state = {"next": 0, "error": None}
+        condition = threading.Condition()
+        
+        def fetch(index: int):
+            with condition:
+                while index >= state["next"] + reorder_limit and not state["error"]:
+                    condition.wait()
+                if state["error"]:
+                    return
+            
+            def fetch_once() -> bytes:
+                chunks: List[bytes] = []
+                self._stream_from_cdn(source.segment_urls[index], chunks.append)
+                return b"".join(chunks)
+            
+            rounds = 0
+            while True:
+                try:
+                    data = self._with_retries(
+                        f"分片 {index + 1} 下载", source.segment_urls[index], fetch_once, source=source
+                    )
+                    decryptor = decryptor_for(index) if decryptor_for else None
+                    if decryptor:
+                        data = decryptor.decrypt(data)
+                    break
+                except (requests.RequestException, ValueError) as e:
+                    retryable = isinstance(e, requests.RequestException) and _is_retryable(e)
+                    if rounds < self.SEGMENT_RETRY_ROUNDS and retryable and not state["error"]:
+                        # 重试次数用完，稍后再下载一轮 (与保存分片时重新下载失败的分片相同)
+                        rounds += 1
+                        print(f"\n⚠ 分片 {index + 1} 下载失败 ({e})，重新下载该分片...")
+                        time.sleep(_backoff_delay(
+                            self.PIECE_RETRIES, self.RETRY_BASE_DELAY, self.RETRY_MAX_DELAY
+                        ))
+                        continue
+                    with condition:
+                        state["error"] = state["error"] or e
+                        condition.notify_all()
+                    return
+            if progress:
+                try:
+                    progress.advance(len(data), 1)
+                except DownloadCancelled as e:
+                    with condition:
+                        state["error"] = state["error"] or e
+                        condition.notify_all()
+                    return
+            with condition:
+                buffer[index] = data
+                condition.notify_all()
         
-        for api_url in api_urls:
-            print(f"正在尝试 API: {api_url}")
+        error = None
+        written_bytes = 0
+        transfer_started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.segment_workers) as executor:
+            for index in range(total):
+                executor.submit(fetch, index)
             
             try:
-                response = self.session.get(api_url, timeout=30)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # 检查是否有播放列表
-                    playlist = data.get("playlist", {})
-                    
-                    # 如果没有 playlist，尝试 playlist_v2
-                    if not playlist:
-                        playlist = data.get("playlist_v2", {})
-                    
-                    if playlist:
-                        # 解析视频信息
-                        video_info = VideoInfo(
-                            video_id=video_id,
-                            title=title or data.get("title", f"zhihu_video_{video_id[:20]}"),
-                            duration=data.get("duration", 0),
-                            playlist=playlist
-                        )
-                        return video_info
-                    else:
-                        print(f"  API 返回成功但没有播放列表")
-                else:
-                    print(f"  返回状态码: {response.status_code}")
+                for index in range(total):
+                    with condition:
+                        while index not in buffer and not state["error"]:
+                            condition.wait()
+                        if state["error"]:
+                            break
+                        data = buffer.pop(index)
                     
-            except requests.RequestException as e:
-                print(f"  请求失败: {e}")
-            except json.JSONDecodeError as e:
-                print(f"  JSON 解析失败: {e}")
+                    process.stdin.write(data)
+                    written_bytes += len(data)
+                    with condition:
+                        state["next"] = index + 1
+                        condition.notify_all()
+                    print(
+                        f"\r下载分片... {index + 1}/{total} "
+                        f"({written_bytes / 1024 / 1024:.1f} MB)",
+                        end="", flush=True
+                    )
+            except OSError as e:
+                # ffmpeg 提前退出
+                error = e
+            finally:
+                with condition:
+                    state["error"] = state["error"] or error or (
+                        None if state["next"] == total else RuntimeError("下载中断")
+                    )
+                    condition.notify_all()
+                buffer.clear()
+        print()
+        self.metrics.record_phase("segments", time.monotonic() - transfer_started)
         
-        # 如果所有 API 都失败，说明可能需要认证
-        print("\n⚠ 无法获取视频播放信息")
-        print("  可能的原因:")
-        print("  1. 这是付费视频，需要登录并购买")
-        print("  2. cookies 未正确加载或已过期")
-        print("  3. 视频 ID 无效")
-        print("\n  提示: 请尝试以下步骤:")
-        print("  1. 运行 'python export_cookies.py' 导出 cookies")
-        print("  2. 使用 '-c cookies.json' 参数指定 cookies 文件")
+        fetch_error = state["error"] if state["error"] is not error else None
+        if fetch_error:
+            process.kill()
+        try:
+            process.stdin.close()
+        except OSError:
+            pass
+        returncode = process.wait()
+        stderr_reader.join(timeout=5)
+        self.metrics.record_phase("ffmpeg", time.monotonic() - ffmpeg_started)
         
-        return None
+        if isinstance(fetch_error, DownloadCancelled):
+            raise fetch_error
+        if fetch_error:
+            # 已经写入 ffmpeg 的部分不完整，删除输出文件
+            print(f"⚠ 分片下载失败: {fetch_error}")
+            with contextlib.suppress(OSError):
+                os.remove(remux_path)
+            return False
+        if returncode != 0 or error:
+            print(f"⚠ ffmpeg 合并失败 (exit code: {returncode})")
+            for line in stderr_tail:
+                print(f"  {line}")
+            if clip:
+                with contextlib.suppress(OSError):
+                    os.remove(remux_path)
+            return False
+        
+        if clip:
+            trimmed = self._trim_clip(ffmpeg_path, remux_path, output_path, clip, progress, clip_offset)
+            with contextlib.suppress(OSError):
+                os.remove(remux_path)
+            return trimmed
+        return True
     
-    def get_download_options(self, video_info: VideoInfo) -> List[DownloadOption]:
+    def _run_ffmpeg(self, cmd: List[str], status_text: str,
+                    progress: Optional[ProgressTracker] = None,
+                    count_bytes: bool = False) -> Tuple[int, List[str]]:
         """
-        获取视频的下载选项（不同清晰度）
+        运行 ffmpeg 并显示处理进度
         
         Args:
-            video_info: 视频信息对象
+            cmd: ffmpeg 命令
+            status_text: 进度提示文字
+            progress: 进度统计 (可选)，记录 ffmpeg 已处理的媒体时长
+            count_bytes: ffmpeg 直接下载时，把输出大小 (size=) 记为已下载字节数
             
         Returns:
-            下载选项列表
+            (退出码, 最后 FFMPEG_STDERR_LINES 行 stderr 输出)
         """
-        options = []
-        
-        playlist = video_info.playlist
-        
-        # 清晰度优先级
-        quality_order = ["uhd", "fhd", "hd", "sd", "ld"]
+        started = time.monotonic()
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            universal_newlines=True
+        )
         
-        for quality in quality_order:
-            if quality in playlist:
-                item = playlist[quality]
-                option = DownloadOption(
-                    quality=quality,
-                    width=item.get("width", 0),
-                    height=item.get("height", 0),
-                    format=item.get("format", "m3u8"),
-                    play_url=item.get("play_url", ""),
-                    size=item.get("size")
-                )
-                if option.play_url:
-                    options.append(option)
+        # 读取 stderr 获取进度信息，只保留最后几行用于显示错误
+        stderr_output = deque(maxlen=self.FFMPEG_STDERR_LINES)
+        try:
+            while True:
+                line = process.stderr.readline()
+                if not line and process.poll() is not None:
+                    break
+                if line:
+                    stderr_output.append(line)
+                    # 检查是否包含时间信息
+                    if "time=" in line:
+                        # 提取并显示进度
+                        time_match = _FFMPEG_TIME_PATTERN.search(line)
+                        if time_match:
+                            h, m, s = map(int, time_match.groups()[:3])
+                            elapsed = h * 3600 + m * 60 + s
+                            print(f"\r{status_text} {elapsed} 秒", end="", flush=True)
+                            if progress:
+                                progress.set_media_time(elapsed + int(time_match.group(4)) / 100)
+                        size_match = _FFMPEG_SIZE_PATTERN.search(line) if count_bytes else None
+                        if progress and size_match:
+                            progress.set_transferred(int(size_match.group(1)) * 1024)
+        except BaseException:
+            # 下载被取消 (或被中断) 时不留下仍在运行的 ffmpeg
+            process.kill()
+            process.wait()
+            raise
         
-        return options
+        print()  # 换行
+        self.metrics.record_phase("ffmpeg", time.monotonic() - started)
+        return process.returncode, list(stderr_output)
     
-    def _download_m3u8_video(self, m3u8_url: str, output_path: str, 
-                             progress_callback=None) -> bool:
+    def _download_m3u8_with_ffmpeg(self, m3u8_url: str, output_path: str,
+                                   ffmpeg_path: str,
+                                   progress: Optional[ProgressTracker] = None,
+                                   clip: Optional[ClipRange] = None) -> bool:
         """
-        下载 M3U8 视频流
+        直接使用 ffmpeg 下载 M3U8 视频流 (单连接顺序下载)
         
         Args:
             m3u8_url: M3U8 播放列表 URL
             output_path: 输出文件路径
-            progress_callback: 进度回调函数
+            ffmpeg_path: ffmpeg 可执行文件路径
+            progress: 进度统计 (可选)
+            clip: 只下载其中一段 (可选，ffmpeg 定位到片段开始所在的分片)
             
         Returns:
             是否下载成功
         """
-        # 检查 ffmpeg 是否可用
-        ffmpeg_path = shutil.which("ffmpeg")
-        if not ffmpeg_path:
-            print("⚠ 未找到 ffmpeg，请先安装: brew install ffmpeg")
-            return False
-        
         print(f"使用 ffmpeg 下载视频...")
-        print(f"M3U8 URL: {m3u8_url[:100]}...")
         
         # 构建 ffmpeg 命令
         # 添加 headers 以模拟浏览器请求
         cmd = [
             ffmpeg_path,
             "-headers", f"User-Agent: {self.HEADERS['User-Agent']}\r\nReferer: https://www.zhihu.com/\r\n",
+            *(clip.seek_args(clip.start) if clip else []),
             "-i", m3u8_url,
+            *(clip.length_args() if clip else []),
             "-c", "copy",  # 直接复制流，不重新编码
             "-bsf:a", "aac_adtstoasc",  # 处理 AAC 音频
             "-y",  # 覆盖已存在的文件
@@ -427,38 +4275,15 @@ class ZhihuVideoDownloader:
         ]
         
         try:
-            # 运行 ffmpeg，显示进度
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines=True
+            returncode, stderr_output = self._run_ffmpeg(
+                cmd, "下载中... 已下载", progress, count_bytes=True
             )
             
-            # 读取 stderr 获取进度信息
-            stderr_output = []
-            while True:
-                line = process.stderr.readline()
-                if not line and process.poll() is not None:
-                    break
-                if line:
-                    stderr_output.append(line)
-                    # 检查是否包含时间信息
-                    if "time=" in line:
-                        # 提取并显示进度
-                        time_match = re.search(r'time=(\d{2}):(\d{2}):(\d{2})', line)
-                        if time_match:
-                            h, m, s = map(int, time_match.groups())
-                            elapsed = h * 3600 + m * 60 + s
-                            print(f"\r下载中... 已下载 {elapsed} 秒", end="", flush=True)
-            
-            print()  # 换行
-            
-            if process.returncode == 0:
+            if returncode == 0:
                 return True
             else:
                 full_stderr = "".join(stderr_output)
-                print(f"⚠ ffmpeg 下载失败 (exit code: {process.returncode})")
+                print(f"⚠ ffmpeg 下载失败 (exit code: {returncode})")
                 if "403 Forbidden" in full_stderr:
                     print("  错误: 访问被拒绝，可能需要登录或无权限访问此视频")
                 elif "404 Not Found" in full_stderr:
@@ -475,81 +4300,534 @@ class ZhihuVideoDownloader:
             return False
     
     def _download_mp4_video(self, url: str, output_path: str,
-                            progress_callback=None) -> bool:
+                            progress: Optional[ProgressTracker] = None,
+                            manifest: Optional[DownloadManifest] = None,
+                            source: Optional[PlayUrlSource] = None,
+                            clip: Optional[ClipRange] = None) -> bool:
         """
         直接下载 MP4 视频
         
+        服务器支持 Range 请求时，按 content-length 把文件切分成多个字节范围，
+        用多个连接并发下载，各自写入预先分配好大小的文件的对应位置；
+        不支持时回退到单连接下载。数据先写入 ``<输出文件>.part``，完成后再改名。
+        
+        提供断点续传清单时，每下载一个检查点大小就记录一个字节范围；
+        重新运行时校验已记录的范围，只下载缺失的部分。
+        视频地址的签名过期时，获取新的地址后从失败的位置继续 (见 PlayUrlSource)。
+        
+        片段下载时先读取 moov 中的采样表，只下载片段需要的采样数据 (其余部分留空)，
+        再由 ffmpeg 从未完成文件中裁剪出片段 (-c copy)。无法解析文件结构时下载整个文件后裁剪。
+        
         Args:
             url: 视频 URL
             output_path: 输出文件路径
-            progress_callback: 进度回调函数
+            progress: 进度统计 (可选)
+            manifest: 断点续传清单 (可选)
+            source: 可以在签名过期时刷新的播放地址 (可选)
+            clip: 只下载其中一段 (可选)
             
         Returns:
             是否下载成功
         """
+        ffmpeg_path = None
+        if clip:
+            ffmpeg_path = shutil.which("ffmpeg")
+            if not ffmpeg_path:
+                print("⚠ 片段下载需要 ffmpeg 裁剪视频，请先安装: brew install ffmpeg")
+                return False
+        
+        source = source or PlayUrlSource(url)
+        part_path = manifest.part_path if manifest else output_path + ".part"
+        if manifest and manifest.has_progress():
+            manifest.verify_ranges(part_path)
+            done = manifest.completed_bytes()
+            if done:
+                print(f"断点续传: 已完成 {done / 1024 / 1024:.1f} MB")
+        
+        try:
+            with self.metrics.phase("mp4"):
+                total_size, supports_range = self._with_retries(
+                    "探测文件大小", url, lambda: self._probe_mp4(source.play_url), source=source
+                )
+                ranges = None
+                if clip and supports_range and total_size:
+                    ranges = self._prepare_mp4_clip(source, part_path, total_size, clip)
+                # 断点续传时即使只有一个连接也按字节范围下载，只请求清单中缺失的部分
+                if supports_range and total_size and (
+                    self.mp4_connections > 1 or ranges or manifest
+                ):
+                    self._download_mp4_ranges(
+                        source, part_path, total_size, manifest, progress, ranges
+                    )
+                else:
+                    if manifest and manifest.has_progress() and not supports_range:
+                        print("⚠ 服务器不支持断点续传，从头开始下载")
+                    self._download_mp4_stream(source, part_path, manifest, progress)
+            
+        except (requests.RequestException, OSError, DownloadCancelled) as e:
+            if manifest:
+                manifest.save()
+            else:
+                with contextlib.suppress(OSError):
+                    os.remove(part_path)
+            if isinstance(e, DownloadCancelled):
+                raise
+            print(f"⚠ 下载失败: {e}")
+            if manifest:
+                print("  已保存下载进度，重新运行即可继续下载")
+            return False
+        
+        if manifest:
+            manifest.save()
+            # 片段下载时未完成文件中本来就有不需要下载的部分
+            if not clip and manifest.total_size and manifest.missing_ranges():
+                print("⚠ 下载不完整，重新运行即可继续下载")
+                return False
+        
+        if clip:
+            if not self._trim_clip(ffmpeg_path, part_path, output_path, clip, progress):
+                return False
+            with contextlib.suppress(OSError):
+                os.remove(part_path)
+            return True
+        
+        os.replace(part_path, output_path)
+        return True
+    
+    def _trim_clip(self, ffmpeg_path: str, input_path: str, output_path: str,
+                   clip: ClipRange, progress: Optional[ProgressTracker] = None,
+                   start: Optional[float] = None) -> bool:
+        """
+        用 ffmpeg 从下载的文件中裁剪出片段 (-c copy，从片段开始之前最近的关键帧开始)
+        
+        Args:
+            start: 片段在输入文件中的开始时间 (秒)，默认为 clip.start；
+                输入文件只包含覆盖片段的分片时为片段相对第一个分片的时间
+        
+        Returns:
+            是否裁剪成功
+        """
+        cmd = [
+            ffmpeg_path,
+            *clip.seek_args(clip.start if start is None else start),
+            "-i", input_path,
+            *clip.length_args(),
+            "-c", "copy",
+            "-movflags", "+faststart",
+            "-y",
+            output_path
+        ]
+        if progress:
+            progress.set_phase("remux")
+        
+        try:
+            returncode, stderr_output = self._run_ffmpeg(cmd, "裁剪中... 已处理", progress)
+        except subprocess.SubprocessError as e:
+            print(f"⚠ 运行 ffmpeg 失败: {e}")
+            return False
+        
+        if returncode != 0:
+            print(f"⚠ ffmpeg 裁剪失败 (exit code: {returncode})")
+            for line in [l for l in stderr_output if l.strip()][-5:]:
+                print(f"  {line.strip()}")
+            return False
+        return True
+    
+    def _fetch_mp4_bytes(self, source: PlayUrlSource, start: int, end: int) -> bytes:
+        """读取 MP4 文件的一个字节范围 (结束位置包含在内)"""
+        def fetch() -> bytes:
+            chunks: List[bytes] = []
+            self._stream_from_cdn(
+                source.play_url, chunks.append, headers={"Range": f"bytes={start}-{end}"}
+            )
+            return b"".join(chunks)
+        
+        return self._with_retries("读取 MP4 文件结构", source.play_url, fetch, source=source)
+    
+    def _read_mp4_boxes(self, source: PlayUrlSource,
+                        total_size: int) -> Tuple[List[Tuple[int, bytes]], bytes]:
+        """
+        用 Range 请求依次读取 MP4 的顶层 box，跳过 mdat 中的采样数据
+        
+        Returns:
+            (需要写入未完成文件的 (位置, 数据) 列表，moov 的内容)
+        
+        Raises:
+            ValueError: 不是 MP4 文件，或没有找到 moov
+        """
+        pieces: List[Tuple[int, bytes]] = []
+        moov = None
+        found_mdat = False
+        position = 0
+        # 上一次读取的数据，相邻的小 box 不需要重新请求
+        buffer, buffer_start = b"", 0
+        while position < total_size and not (moov is not None and found_mdat):
+            if not (buffer_start <= position and
+                    min(position + 16, total_size) <= buffer_start + len(buffer)):
+                buffer_start = position
+                buffer = self._fetch_mp4_bytes(
+                    source, position, min(position + self.MP4_BOX_READ_SIZE, total_size) - 1
+                )
+            data = buffer[position - buffer_start:]
+            box_type, header_size, size = _mp4_box_header(data, 0)
+            if position == 0 and box_type != b"ftyp":
+                raise ValueError("不是 MP4 文件")
+            if size == 0:
+                size = total_size - position
+            if size < header_size or position + size > total_size:
+                raise ValueError(f"MP4 box {box_type!r} 的大小无效")
+            
+            if box_type == b"mdat":
+                # 采样数据按片段需要另外下载，这里只保留 box 头
+                pieces.append((position, data[:header_size]))
+                found_mdat = True
+            else:
+                if len(data) < size:
+                    data += self._fetch_mp4_bytes(source, position + len(data), position + size - 1)
+                data = data[:size]
+                pieces.append((position, data))
+                if box_type == b"moov":
+                    moov = data
+            position += size
+        
+        if moov is None:
+            raise ValueError("没有找到 moov")
+        return pieces, moov
+    
+    def _prepare_mp4_clip(self, source: PlayUrlSource, part_path: str, total_size: int,
+                          clip: ClipRange) -> Optional[List[Tuple[int, int]]]:
+        """
+        读取 MP4 文件结构，写入未完成文件，计算片段需要下载的字节范围
+        
+        未完成文件预先分配为完整大小 (稀疏文件)，只有文件结构和片段需要的采样数据会被写入。
+        
+        Returns:
+            需要下载的字节范围，无法解析文件结构时为 None (下载整个文件)
+        """
         try:
-            response = self.session.get(url, stream=True, timeout=60)
+            with self.metrics.phase("mp4_index"):
+                pieces, moov = self._read_mp4_boxes(source, total_size)
+                tracks = _parse_mp4_tracks(moov)
+        except ValueError as e:
+            print(f"⚠ 无法读取 MP4 索引 ({e})，下载整个文件后裁剪")
+            return None
+        
+        with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
+            f.truncate(total_size)
+            for position, data in pieces:
+                f.seek(position)
+                f.write(data)
+        
+        ranges = _merge_ranges(
+            _mp4_clip_ranges(tracks, clip.start, clip.end, self.CLIP_MARGIN),
+            self.CLIP_MERGE_GAP
+        )
+        needed = sum(end - start + 1 for start, end in ranges)
+        print(
+            f"片段下载: 需要 {needed / 1024 / 1024:.1f} MB "
+            f"(完整文件 {total_size / 1024 / 1024:.1f} MB)"
+        )
+        return ranges
+    
+    def _probe_mp4(self, url: str) -> Tuple[Optional[int], bool]:
+        """
+        用 ``Range: bytes=0-0`` 请求探测文件大小以及服务器是否支持 Range
+        
+        Returns:
+            (文件大小, 是否支持 Range 请求)
+        """
+        with self.session.get(url, headers={"Range": "bytes=0-0"},
+                              stream=True, timeout=60) as response:
             response.raise_for_status()
+            if response.status_code == 206:
+                return _parse_content_range_total(response.headers.get("Content-Range")), True
+            return int(response.headers.get('content-length', 0)) or None, False
+    
+    def _download_mp4_stream(self, source: PlayUrlSource, part_path: str,
+                             manifest: Optional[DownloadManifest] = None,
+                             progress: Optional[ProgressTracker] = None):
+        """
+        单连接从头下载整个文件
+        
+        服务器不支持 Range 请求，失败时只能从头重新下载 (见 _with_retries)
+        """
+        written = 0
+        
+        def fetch():
+            nonlocal written
+            if written and progress:
+                # 重新下载前撤销上次计入的进度
+                progress.advance(-written, transferred=False)
+            written = 0
             
-            total_size = int(response.headers.get('content-length', 0))
-            downloaded = 0
+            with self.cdn_hosts.transfer(source.play_url) as transfer, \
+                    self.session.get(transfer.url, stream=True, timeout=transfer.timeout) as response:
+                response.raise_for_status()
+                transfer.start()
+                
+                total_size = _expected_length(response)
+                if manifest:
+                    manifest.clear_ranges()
+                    manifest.total_size = total_size
+                
+                on_bytes = None
+                if progress:
+                    progress.set_total(bytes_total=total_size)
+                    on_bytes = progress.advance
+                
+                with open(part_path, 'wb') as f:
+                    try:
+                        self._write_mp4_body(response, f, 0, manifest, on_bytes, transfer=transfer)
+                    finally:
+                        written = f.tell()
+                _check_length(response, written)
+        
+        self._with_retries("下载", source.play_url, fetch, source=source)
+    
+    def _download_mp4_ranges(self, source: PlayUrlSource, part_path: str, total_size: int,
+                             manifest: Optional[DownloadManifest] = None,
+                             progress: Optional[ProgressTracker] = None,
+                             ranges: Optional[List[Tuple[int, int]]] = None):
+        """
+        多连接并发下载尚未完成的字节范围
+        
+        Args:
+            ranges: 只下载这些字节范围 (片段下载)，默认为整个文件
+        """
+        wanted = ranges or [(0, total_size - 1)]
+        if manifest:
+            manifest.total_size = total_size
+            missing = _intersect_ranges(wanted, manifest.missing_ranges())
+        else:
+            missing = wanted
+        
+        # 预先分配文件大小，各连接直接写入自己负责的位置
+        with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
+            f.truncate(total_size)
+        
+        parts = _split_ranges(missing, self.mp4_connections, self.MIN_RANGE_SIZE)
+        if not parts:
+            return
+        
+        wanted_size = sum(end - start + 1 for start, end in wanted)
+        remaining = sum(end - start + 1 for start, end in missing)
+        workers = min(len(parts), self.mp4_connections)
+        print(f"使用 {workers} 个连接下载 {remaining / 1024 / 1024:.1f} MB...")
+        
+        abort = threading.Event()
+        on_bytes = None
+        if progress:
+            progress.set_total(bytes_total=wanted_size)
+            progress.advance(wanted_size - remaining, transferred=False)
+            on_bytes = progress.advance
+        
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    self._fetch_mp4_range, source, part_path, start, end,
+                    manifest, on_bytes, abort
+                )
+                for start, end in parts
+            ]
             
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        if progress_callback and total_size > 0:
-                            progress = downloaded / total_size * 100
-                            progress_callback(progress)
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                # 一个范围失败时让其它连接尽快停止
+                abort.set()
+                for other in futures:
+                    other.cancel()
+                raise
+    
+    def _fetch_mp4_range(self, source: PlayUrlSource, part_path: str, start: int, end: int,
+                         manifest: Optional[DownloadManifest] = None,
+                         on_bytes=None, abort: Optional[threading.Event] = None):
+        """
+        下载一个字节范围并写入未完成文件的对应位置
+        
+        连接中断或收到的数据不完整时，只从中断的位置重新请求剩余的部分 (见 _with_retries)
+        
+        Args:
+            start: 起始字节
+            end: 结束字节 (包含)
+        """
+        position = start
+        
+        def fetch():
+            nonlocal position
+            with self.cdn_hosts.transfer(source.play_url) as transfer:
+                with self.session.get(transfer.url, headers={"Range": f"bytes={position}-{end}"},
+                                      stream=True, timeout=transfer.timeout) as response:
+                    response.raise_for_status()
+                    if response.status_code != 206:
+                        raise requests.RequestException(
+                            f"服务器没有按 Range 返回数据 (状态码: {response.status_code})"
+                        )
+                    transfer.start()
+                    
+                    with open(part_path, 'r+b') as f:
+                        f.seek(position)
+                        try:
+                            self._write_mp4_body(
+                                response, f, position, manifest, on_bytes, abort, transfer
+                            )
+                        finally:
+                            position = f.tell()
+                
+                if position <= end and not (abort and abort.is_set()):
+                    raise IncompleteResponseError(
+                        f"字节范围 {start}-{end} 不完整: 收到 {position - start} 字节"
+                    )
+        
+        self._with_retries(
+            f"字节范围 {start}-{end} 下载", source.play_url, fetch, abort, source
+        )
+    
+    def _write_mp4_body(self, response, f, start: int,
+                        manifest: Optional[DownloadManifest] = None,
+                        on_bytes=None, abort: Optional[threading.Event] = None,
+                        transfer: Optional[HostTransfer] = None):
+        """
+        把响应内容写入文件当前位置，并按检查点大小在清单中记录已完成的字节范围
+        
+        连接中途断开或传输卡顿时，已写入的数据也会记录到清单中，重试时从断开的位置继续
+        """
+        position = piece_start = start
+        digest = hashlib.sha256()
+        try:
+            for chunk in response.iter_content(chunk_size=65536):
+                if abort and abort.is_set():
+                    break
+                if not chunk:
+                    continue
+                
+                f.write(chunk)
+                digest.update(chunk)
+                position += len(chunk)
+                
+                if manifest and position - piece_start >= self.RESUME_CHECKPOINT_SIZE:
+                    f.flush()
+                    manifest.mark_range(piece_start, position - piece_start, digest.hexdigest())
+                    piece_start = position
+                    digest = hashlib.sha256()
+                
+                if on_bytes:
+                    on_bytes(len(chunk))
+                if transfer:
+                    transfer.add(len(chunk))
+        finally:
+            if manifest and position > piece_start:
+                f.flush()
+                manifest.mark_range(piece_start, position - piece_start, digest.hexdigest())
+    
+    def _verify_duration(self, output_path: str, expected: float) -> bool:
+        """
+        用 ffprobe 检查输出文件的时长是否与 API 返回的时长一致
+        
+        没有 ffprobe、API 没有返回时长或无法读取文件时长时跳过检查。
+        
+        Args:
+            output_path: 输出文件路径
+            expected: API 返回的视频时长 (秒)
             
+        Returns:
+            文件时长明显短于预期时返回 False
+        """
+        ffprobe_path = shutil.which("ffprobe")
+        if not ffprobe_path or expected <= 0:
+            return True
+        
+        with self.metrics.phase("verify"):
+            actual = _probe_duration(ffprobe_path, output_path)
+        if actual is None:
+            print("⚠ 无法读取输出文件的时长，跳过时长校验")
             return True
-            
-        except requests.RequestException as e:
-            print(f"⚠ 下载失败: {e}")
+        
+        tolerance = max(self.DURATION_TOLERANCE, expected * self.DURATION_TOLERANCE_RATIO)
+        if expected - actual > tolerance:
+            print(f"⚠ 视频不完整: 时长 {actual:.1f} 秒，应为 {expected:.1f} 秒")
             return False
+        return True
     
-    def download_video(self, url_or_id: str, output_dir: str = ".",
-                       quality: str = "hd", 
-                       progress_callback=None) -> Optional[str]:
+    @staticmethod
+    def is_direct_video_id(url_or_id: str) -> bool:
+        """是否是直接提供的视频 ID（数字 ID 或加密 ID，不是 URL）"""
+        if url_or_id.startswith("http"):
+            return False
+        return url_or_id.isdigit() or (len(url_or_id) > 30 and "_" in url_or_id)
+    
+    def resolve_video_id(self, url_or_id: str) -> Tuple[Optional[str], str]:
         """
-        下载知乎视频
+        解析知乎视频页面 URL 或视频 ID
         
         Args:
             url_or_id: 知乎视频页面 URL 或视频 ID
-            output_dir: 输出目录
-            quality: 期望的视频质量 (uhd/fhd/hd/sd/ld)
-            progress_callback: 进度回调函数
             
         Returns:
-            下载成功时返回输出文件路径，失败返回 None
+            (视频 ID, 视频标题)，无法获取时视频 ID 为 None
         """
         # 提取视频 ID
         video_id = None
         page_info = None
         
         # 首先检查是否是直接的视频 ID（不是 URL）
-        if not url_or_id.startswith("http"):
-            if url_or_id.isdigit() or (len(url_or_id) > 30 and "_" in url_or_id):
-                video_id = url_or_id
-                print(f"使用直接提供的视频 ID")
+        if self.is_direct_video_id(url_or_id):
+            video_id = url_or_id
+            print(f"使用直接提供的视频 ID")
         
         if not video_id:
             # 尝试从 URL 提取（仅适用于普通知乎视频）
-            video_id = self._extract_video_id_from_url(url_or_id)
+            video_id = self.extract_video_id_from_url(url_or_id)
             if video_id:
                 print(f"从 URL 提取到视频 ID")
         
         if not video_id:
             # 尝试从页面获取（训练营视频需要这种方式）
-            print("正在从页面获取视频信息...")
-            page_info = self._get_video_info_from_page(url_or_id)
+            cache_key = f"page:{url_or_id}"
+            page_info = self._cache_get(cache_key)
+            if page_info:
+                print("使用缓存的页面信息")
+            else:
+                print("正在从页面获取视频信息...")
+                page_info = self._get_video_info_from_page(url_or_id)
+                if page_info and page_info.get("video_id"):
+                    self._cache_set(cache_key, page_info, MetadataCache.PAGE_TTL)
             if page_info:
                 video_id = page_info.get("video_id")
                 if video_id:
                     print(f"成功从页面获取视频 ID")
         
+        # 获取视频标题（如果有的话）
+        video_title = ""
+        if page_info:
+            video_title = page_info.get("title", "")
+        
+        return video_id, video_title
+    
+    def download_video(self, url_or_id: str, output_dir: str = ".",
+                       quality: str = "hd", 
+                       progress_callback=None,
+                       deadline: Optional[float] = None,
+                       cancel_event: Optional[threading.Event] = None,
+                       clip: Optional[ClipRange] = None) -> Optional[str]:
+        """
+        下载知乎视频
+        
+        Args:
+            url_or_id: 知乎视频页面 URL 或视频 ID
+            output_dir: 输出目录
+            quality: 期望的视频质量 (uhd/fhd/hd/sd/ld)，auto 表示按测得的带宽自动选择
+            progress_callback: 进度回调函数，接收 ProgressEvent
+            deadline: 自动清晰度的时间预算 (秒)，None 表示视频时长
+            cancel_event: 取消下载的事件 (可选)，设置后下载在下一个数据块之后停止
+            clip: 只下载其中一段 (可选)
+            
+        Returns:
+            下载成功时返回输出文件路径，失败或被取消时返回 None
+        """
+        video_id, video_title = self.resolve_video_id(url_or_id)
+        
         if not video_id:
             print("⚠ 无法获取视频 ID")
             print("  可能的原因:")
@@ -558,15 +4836,60 @@ class ZhihuVideoDownloader:
             print("  3. 视频 URL 格式不正确")
             return None
         
+        return self.download_resolved_video(
+            video_id, video_title, output_dir, quality, progress_callback, deadline,
+            cancel_event=cancel_event, clip=clip
+        )
+    
+    def download_resolved_video(self, video_id: str, video_title: str = "",
+                                output_dir: str = ".", quality: str = "hd",
+                                progress_callback=None,
+                                deadline: Optional[float] = None,
+                                bandwidth_share: float = 1.0,
+                                cancel_event: Optional[threading.Event] = None,
+                                clip: Optional[ClipRange] = None) -> Optional[str]:
+        """
+        下载已解析出视频 ID 的知乎视频 (resolve_download + transfer_download)
+        
+        Args:
+            video_id: 知乎 Lens 视频 ID
+            video_title: 视频标题（可选，用于保存文件名）
+            output_dir: 输出目录
+            quality: 期望的视频质量 (uhd/fhd/hd/sd/ld)，auto 表示按测得的带宽自动选择
+            progress_callback: 进度回调函数，接收 ProgressEvent
+            deadline: 自动清晰度的时间预算 (秒)，None 表示视频时长
+            bandwidth_share: 自动清晰度时本视频可以使用的带宽比例
+            cancel_event: 取消下载的事件 (可选)，设置后下载在下一个数据块之后停止
+            clip: 只下载其中一段 (可选)
+            
+        Returns:
+            下载成功时返回输出文件路径，失败或被取消时返回 None
+        """
+        resolved = self.resolve_download(
+            video_id, video_title, output_dir, quality, deadline, bandwidth_share, clip
+        )
+        if not resolved:
+            return None
+        return self.transfer_download(resolved, progress_callback, cancel_event)
+    
+    def resolve_download(self, video_id: str, video_title: str = "",
+                         output_dir: str = ".", quality: str = "hd",
+                         deadline: Optional[float] = None,
+                         bandwidth_share: float = 1.0,
+                         clip: Optional[ClipRange] = None) -> Optional[ResolvedDownload]:
+        """
+        下载的解析阶段: 获取播放列表、选择清晰度 (自动清晰度时测速) 并确定输出文件
+        
+        同一视频已经下载过时直接复用已有文件，不需要传输阶段 (片段下载不复用)。
+        参数与 download_resolved_video 相同。
+        
+        Returns:
+            解析结果，无法获取视频信息或下载选项时返回 None
+        """
         # 显示视频 ID（截断以便阅读）
         display_id = video_id[:50] + "..." if len(video_id) > 50 else video_id
         print(f"视频 ID: {display_id}")
         
-        # 获取视频标题（如果有的话）
-        video_title = ""
-        if page_info:
-            video_title = page_info.get("title", "")
-        
         # 获取视频信息
         video_info = self.get_video_info(video_id, video_title)
         if not video_info:
@@ -576,6 +4899,12 @@ class ZhihuVideoDownloader:
         print(f"视频标题: {video_info.title}")
         print(f"视频时长: {video_info.duration / 1000:.0f} 秒")
         
+        if clip:
+            if video_info.duration and clip.start >= video_info.duration / 1000:
+                print("⚠ 片段开始时间超过了视频时长")
+                return None
+            print(f"下载片段: {clip.label}")
+        
         # 获取下载选项
         options = self.get_download_options(video_info)
         if not options:
@@ -586,64 +4915,662 @@ class ZhihuVideoDownloader:
         for opt in options:
             print(f"  - {opt.quality}: {opt.width}x{opt.height} ({opt.format})")
         
+        # 同一视频已经下载过时直接复用 (自动清晰度接受任意已下载的清晰度，不再测速)
+        if quality == "auto":
+            acceptable = [opt.quality for opt in options]
+        else:
+            acceptable = [self.select_download_option(options, quality).quality]
+        reused = None if clip else self._reuse_download(video_info, acceptable, output_dir)
+        if reused:
+            return ResolvedDownload(video_info, None, reused)
+        
         # 选择最佳清晰度
-        selected_option = None
-        quality_order = ["uhd", "fhd", "hd", "sd", "ld"]
+        if quality == "auto":
+            selected_option = self._select_option_automatically(
+                options, video_info, deadline, bandwidth_share
+            )
+        else:
+            selected_option = self.select_download_option(options, quality)
         
-        # 首先尝试找到请求的清晰度
-        for opt in options:
-            if opt.quality == quality:
-                selected_option = opt
-                break
+        print(f"\n选择清晰度: {selected_option.quality} ({selected_option.width}x{selected_option.height})")
         
-        # 如果没找到，选择最高清晰度
-        if not selected_option:
-            for q in quality_order:
-                for opt in options:
-                    if opt.quality == q:
-                        selected_option = opt
-                        break
-                if selected_option:
-                    break
+        # 准备输出文件
+        output_path = self._output_path_for_video(video_info, output_dir, clip)
         
-        if not selected_option:
-            selected_option = options[0]
+        print(f"输出文件: {output_path}")
         
-        print(f"\n选择清晰度: {selected_option.quality} ({selected_option.width}x{selected_option.height})")
+        return ResolvedDownload(video_info, selected_option, str(output_path), clip)
+    
+    def transfer_download(self, resolved: ResolvedDownload, progress_callback=None,
+                          cancel_event: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        下载的传输阶段: 下载 resolve_download 选中的清晰度并校验
         
-        # 准备输出文件
-        output_dir = Path(output_dir)
-        output_dir.mkdir(parents=True, exist_ok=True)
+        Args:
+            resolved: resolve_download 的结果
+            progress_callback: 进度回调函数，接收 ProgressEvent
+            cancel_event: 取消下载的事件 (可选)，设置后下载在下一个数据块之后停止
+            
+        Returns:
+            下载成功时返回输出文件路径，失败或被取消时返回 None
+        """
+        video_info = resolved.video_info
+        selected_option = resolved.option
+        output_path = resolved.output_path
+        clip = resolved.clip
+        # 片段下载时进度和时长校验以片段时长为准
+        duration = clip.duration(video_info.duration / 1000) if clip else video_info.duration / 1000
         
-        # 清理文件名
-        safe_title = re.sub(r'[<>:"/\\|?*]', '_', video_info.title)
-        safe_title = safe_title[:100]  # 限制长度
+        if selected_option is None:
+            # 复用了已下载的文件
+            if progress_callback:
+                ProgressTracker(
+                    progress_callback, video_info.video_id, video_info.title,
+                    video_info.duration / 1000
+                ).finish(True)
+            return output_path
         
-        output_path = output_dir / f"{safe_title}.mp4"
+        if self.store and self.store.owner(output_path):
+            # 已记录的文件可能是其他目录中文件的硬链接，先删除，避免下载时改写共享的文件内容
+            with contextlib.suppress(OSError):
+                os.remove(output_path)
+            self.store.remove(output_path)
+        
+        # 断点续传清单 (以视频 ID + 清晰度 (+ 片段范围) 识别同一个下载)
+        manifest = None
+        if self.resume:
+            manifest = DownloadManifest(
+                output_path,
+                f"{video_info.video_id}:{selected_option.quality}"
+                + (f":{clip.label}" if clip else "")
+            )
         
-        print(f"输出文件: {output_path}")
         print(f"\n开始下载...")
         
-        # 根据格式选择下载方式
-        if selected_option.format == "m3u8" or ".m3u8" in selected_option.play_url:
-            success = self._download_m3u8_video(
-                selected_option.play_url,
-                str(output_path),
-                progress_callback
-            )
-        else:
-            success = self._download_mp4_video(
-                selected_option.play_url,
-                str(output_path),
-                progress_callback
+        # 签名地址在下载中途过期时，重新获取同一清晰度的播放地址
+        def resolve_play_url() -> Optional[str]:
+            print("\n播放地址可能已过期，正在重新获取...")
+            fresh_info = self.get_video_info(video_info.video_id, video_info.title, use_cache=False)
+            if not fresh_info:
+                return None
+            for option in self.get_download_options(fresh_info):
+                if option.quality == selected_option.quality:
+                    print("✓ 已获取新的播放地址，继续下载")
+                    return option.play_url
+            return None
+        
+        source = PlayUrlSource(selected_option.play_url, resolve_play_url)
+        
+        progress = None
+        if progress_callback or cancel_event:
+            progress = ProgressTracker(
+                progress_callback, video_info.video_id, video_info.title,
+                duration, cancel_event
             )
         
+        # 根据格式选择下载方式
+        success = False
+        started_at = time.time()
+        try:
+            if selected_option.format == "m3u8" or ".m3u8" in selected_option.play_url:
+                success = self._download_m3u8_video(
+                    selected_option.play_url,
+                    output_path,
+                    progress,
+                    manifest,
+                    source,
+                    clip
+                )
+            else:
+                success = self._download_mp4_video(
+                    selected_option.play_url,
+                    output_path,
+                    progress,
+                    manifest,
+                    source,
+                    clip
+                )
+            
+            if success:
+                if progress:
+                    progress.set_phase("verify")
+                success = self._verify_duration(output_path, duration)
+                if not success:
+                    # 无法确定哪一部分有问题，删除文件 (和断点续传清单)，重新运行时完整下载
+                    with contextlib.suppress(OSError):
+                        os.remove(output_path)
+                    if manifest:
+                        manifest.discard()
+        except DownloadCancelled:
+            # ffmpeg 已经开始写入的输出文件不完整 (断点续传清单保留，可以继续下载)
+            with contextlib.suppress(OSError):
+                if os.path.getmtime(output_path) >= started_at:
+                    os.remove(output_path)
+            print("\n✗ 下载已取消")
+            return None
+        finally:
+            if progress:
+                progress.finish(success)
+        
         if success:
+            if manifest:
+                manifest.discard()
+            # 片段不是完整的视频，不记录到已下载文件索引
+            if self.store and not clip:
+                try:
+                    self.store.add(video_info.video_id, selected_option.quality, output_path)
+                except OSError as e:
+                    print(f"⚠ 无法记录已下载的文件: {e}")
             print(f"✓ 下载完成: {output_path}")
-            return str(output_path)
+            return output_path
         else:
             print("✗ 下载失败")
             return None
+    
+    def list_course_sections(self, product_id: str) -> List[Dict[str, Any]]:
+        """
+        通过训练营 API 列出课程的所有小节
+        
+        Args:
+            product_id: 训练营课程 ID
+            
+        Returns:
+            按课程顺序排列的小节列表，每项包含 section_id/title/video_id
+            (目录中没有视频 ID 时 video_id 为 None)
+        """
+        def parse(data: Any) -> Optional[List[Dict[str, Any]]]:
+            sections = _collect_course_sections(data)
+            
+            # 知乎 API 分页: paging.is_end / paging.next
+            paging = data.get("paging") if isinstance(data, dict) else None
+            while paging and not paging.get("is_end", True) and paging.get("next"):
+                response = self.session.get(paging["next"], timeout=30)
+                response.raise_for_status()
+                data = response.json()
+                sections.extend(_collect_course_sections(data))
+                paging = data.get("paging") if isinstance(data, dict) else None
+            
+            if not sections:
+                return None
+            
+            # 去掉分页重叠导致的重复小节，保持原有顺序
+            unique = {}
+            for section in sections:
+                unique.setdefault(section["section_id"], section)
+            return list(unique.values())
+        
+        # 同时尝试多个可能的目录 API 端点
+        with self.metrics.phase("training_catalog"):
+            sections = self._probe_endpoints(
+                self.TRAINING_CATALOG_APIS,
+                {"product_id": product_id},
+                parse
+            )
+        return sections or []
+    
+    def download_course(self, course_url: str, output_dir: str = ".",
+                        quality: str = "hd",
+                        jobs: int = DEFAULT_COURSE_JOBS,
+                        progress_callback=None,
+                        deadline: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        下载整个训练营课程
+        
+        列出课程的所有小节，并发解析各小节的视频 ID，然后在有限大小的线程池中
+        下载所有视频，最后在输出目录中写入一份汇总报告。
+        
+        Args:
+            course_url: 课程中任意一个视频页面的 URL，或课程 ID
+            output_dir: 输出目录
+            quality: 期望的视频质量 (uhd/fhd/hd/sd/ld)，auto 表示按测得的带宽自动选择
+            jobs: 同时下载的视频数 (连接池按创建下载器时的 parallel_videos 确定大小)
+            progress_callback: 进度回调函数，接收各个视频的 ProgressEvent (可能在多个线程中调用)
+            deadline: 自动清晰度时整个课程的时间预算 (秒)，None 表示每个视频以自身时长为预算
+            
+        Returns:
+            汇总报告，无法获取课程目录时返回 None
+        """
+        training_ids = self.parse_training_url(course_url)
+        if not training_ids:
+            print("⚠ 无法从 URL 中识别课程 ID")
+            return None
+        
+        product_id = training_ids[0]
+        started_at = time.time()
+        
+        print(f"正在获取课程目录: {product_id}")
+        sections = self.list_course_sections(product_id)
+        if not sections:
+            print("⚠ 无法获取课程目录")
+            print("  提示: 请确保已登录知乎并购买了该课程")
+            return None
+        
+        print(f"✓ 课程共 {len(sections)} 个小节")
+        
+        # 并发解析目录中没有视频 ID 的小节
+        unresolved = [section for section in sections if not section["video_id"]]
+        if unresolved:
+            print(f"正在解析 {len(unresolved)} 个小节的视频 ID...")
+            with ThreadPoolExecutor(max_workers=self.COURSE_RESOLVE_WORKERS) as executor:
+                infos = executor.map(
+                    lambda section: self._get_training_section_info(section["section_id"]),
+                    unresolved
+                )
+                for section, info in zip(unresolved, infos):
+                    if info:
+                        section["video_id"] = info["video_id"]
+                        section["title"] = info.get("title") or section["title"]
+        
+        results = [
+            {
+                "index": index,
+                "section_id": section["section_id"],
+                "title": section["title"],
+                "video_id": section["video_id"],
+                "status": "pending" if section["video_id"] else "unresolved",
+                "path": None,
+                "error": None,
+                "elapsed": 0.0,
+            }
+            for index, section in enumerate(sections, start=1)
+        ]
+        
+        # 整课时间预算: 每个视频开始时，把剩余时间平均分给剩余视频需要的轮数
+        jobs = max(1, jobs)
+        budget_lock = threading.Lock()
+        budget_state = {"not_started": 0}
+        course_deadline = time.monotonic() + deadline if deadline is not None else None
+        
+        def video_budget() -> Optional[float]:
+            if course_deadline is None:
+                return None
+            with budget_lock:
+                rounds = math.ceil(budget_state["not_started"] / jobs)
+                budget_state["not_started"] -= 1
+            return max(0.0, course_deadline - time.monotonic()) / max(1, rounds)
+        
+        def download(result: Dict[str, Any]):
+            start = time.monotonic()
+            # 文件名加上小节序号，保持课程顺序并避免同名覆盖
+            title = f"{result['index']:03d} {result['title']}" if result["title"] else ""
+            try:
+                path = self.download_resolved_video(
+                    result["video_id"], title, output_dir, quality, progress_callback,
+                    deadline=video_budget(), bandwidth_share=1 / jobs
+                )
+            except Exception as e:
+                path = None
+                result["error"] = str(e)
+            
+            result["status"] = "downloaded" if path else "failed"
+            result["path"] = path
+            result["elapsed"] = round(time.monotonic() - start, 1)
+        
+        pending = [result for result in results if result["status"] == "pending"]
+        budget_state["not_started"] = len(pending)
+        print(f"\n开始下载 {len(pending)} 个视频 (同时下载 {jobs} 个)...")
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(download, pending))
+        
+        counts = {
+            status: sum(1 for result in results if result["status"] == status)
+            for status in ("downloaded", "failed", "unresolved")
+        }
+        report = {
+            "product_id": product_id,
+            "quality": quality,
+            "started_at": started_at,
+            "elapsed": round(time.time() - started_at, 1),
+            "total": len(results),
+            **counts,
+            "sections": results,
+        }
+        
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        report_path = output_dir / f"course_{product_id}_report.json"
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        
+        print(f"\n课程下载完成: 成功 {counts['downloaded']}，失败 {counts['failed']}，"
+              f"未解析 {counts['unresolved']}，共 {len(results)} 个小节")
+        for result in results:
+            if result["status"] != "downloaded":
+                print(f"  ✗ {result['index']:03d} {result['title'] or result['section_id']} "
+                      f"({result['status']})")
+        print(f"汇总报告: {report_path}")
+        
+        return report
+
+
+class DownloadScheduler:
+    """
+    两级下载调度器: 解析和传输在两个独立的线程池中进行
+    
+    - 解析阶段 (页面、API、播放列表，自动清晰度测速) 主要在等待网络延迟，使用少量线程
+      提前为传输阶段准备好任务，传输线程不再等待解析，解析也不再等待传输
+    - 传输阶段以带宽为主，同时下载 transfer_workers 个视频
+    - 两个阶段都按优先级 (数值小的先执行) 和提交顺序取任务，交互式任务
+      (PRIORITY_INTERACTIVE) 可以插到排队的批量任务之前
+    - 未完成的任务 (排队、解析和下载中) 达到 max_pending 个时，submit 阻塞 (block=True) 或抛出
+      queue.Full，从文件或标准输入流式读取几万个 URL、或服务持续接收任务时，内存中只有有限个
+      任务；已结束的任务交给 on_finish 处理后不再保留
+    - 已解析的任务在排队期间签名播放地址过期时，传输阶段会重新获取 (见 PlayUrlSource)
+    """
+    
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_BULK = 10
+    
+    # 解析阶段的线程数
+    DEFAULT_RESOLVE_WORKERS = 4
+    
+    def __init__(self, downloader: ZhihuVideoDownloader,
+                 transfer_workers: int = 3,
+                 resolve_workers: int = DEFAULT_RESOLVE_WORKERS,
+                 max_pending: Optional[int] = None,
+                 on_finish: Optional[Callable[[DownloadTask], None]] = None,
+                 progress_callback=None):
+        """
+        Args:
+            downloader: 所有任务共享的下载器，创建时的 parallel_videos 应不小于 transfer_workers
+            transfer_workers: 同时下载的视频数
+            resolve_workers: 同时解析的视频数
+            max_pending: 未完成任务数的上限，默认为两个线程池大小之和的两倍
+            on_finish: 任务结束 (完成、失败或取消) 时调用，可能在多个线程中调用
+            progress_callback: 进度回调函数，接收所有任务的 ProgressEvent (可能在多个线程中调用)
+        """
+        self.downloader = downloader
+        self.transfer_workers = max(1, transfer_workers)
+        self.resolve_workers = max(1, resolve_workers)
+        self.max_pending = max_pending or (self.transfer_workers + self.resolve_workers) * 2
+        self.on_finish = on_finish
+        self.progress_callback = progress_callback
+        self.counts = {"done": 0, "failed": 0, "cancelled": 0}
+        
+        self._resolve_queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._transfer_queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._slots = threading.Semaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        
+        self._threads = [
+            threading.Thread(target=self._resolve_loop, name=f"resolve-{index}", daemon=True)
+            for index in range(self.resolve_workers)
+        ] + [
+            threading.Thread(target=self._transfer_loop, name=f"transfer-{index}", daemon=True)
+            for index in range(self.transfer_workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def submit(self, task: DownloadTask, block: bool = False) -> DownloadTask:
+        """
+        提交任务
+        
+        Args:
+            task: 下载任务
+            block: 未完成的任务达到 max_pending 个时，为 True 则等待有任务结束，为 False 则抛出异常
+            
+        Raises:
+            queue.Full: block 为 False 且未完成的任务已达到 max_pending 个
+        """
+        if not self._slots.acquire(blocking=block):
+            raise queue.Full(f"未完成的任务已达到上限 ({self.max_pending} 个)")
+        task.holds_slot = True
+        with self._lock:
+            self._pending += 1
+        self._resolve_queue.put((task.priority, next(self._sequence), task))
+        return task
+    
+    def cancel(self, task: DownloadTask) -> bool:
+        """
+        取消任务: 排队中的任务立即结束，正在解析或下载的任务在下一个数据块之后停止
+        
+        Returns:
+            任务是否还没有结束
+        """
+        task.cancel_event.set()
+        with self._lock:
+            if task.finished:
+                return False
+            if task.status not in ("queued", "resolved"):
+                return True
+            # 还在队列中，工作线程取出时跳过
+            self._finish_locked(task, "cancelled")
+        self._notify_finish(task)
+        return True
+    
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """等待所有已提交的任务结束，返回是否全部结束"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+    
+    def close(self, cancel: bool = False):
+        """停止工作线程 (cancel 为 False 时先等待所有任务结束)"""
+        if not cancel:
+            self.join()
+        for _ in range(self.resolve_workers):
+            self._resolve_queue.put((math.inf, next(self._sequence), None))
+        for _ in range(self.transfer_workers):
+            self._transfer_queue.put((math.inf, next(self._sequence), None))
+        for thread in self._threads:
+            thread.join()
+    
+    def _take(self, tasks: "queue.PriorityQueue", status: str) -> Optional[DownloadTask]:
+        """从队列中取出下一个未结束的任务并标记状态，收到结束标记时返回 None"""
+        while True:
+            _, _, task = tasks.get()
+            if task is None:
+                return None
+            with self._lock:
+                if task.finished:
+                    continue
+                if task.cancel_event.is_set():
+                    self._finish_locked(task, "cancelled")
+                else:
+                    task.status = status
+                    task.started_at = task.started_at or time.time()
+                    return task
+            self._notify_finish(task)
+    
+    def _resolve_loop(self):
+        while True:
+            task = self._take(self._resolve_queue, "resolving")
+            if task is None:
+                return
+            try:
+                video_id, video_title = self.downloader.resolve_video_id(task.url)
+                resolved = None
+                if video_id:
+                    resolved = self.downloader.resolve_download(
+                        video_id, video_title, task.output_dir, task.quality,
+                        task.deadline, 1 / self.transfer_workers, task.clip
+                    )
+            except Exception as e:
+                resolved = None
+                task.error = str(e)
+            
+            if task.cancel_event.is_set():
+                self._finish(task, "cancelled")
+            elif not resolved:
+                task.error = task.error or "无法解析视频"
+                self._finish(task, "failed")
+            elif resolved.option is None:
+                # 复用已下载的文件，不需要传输
+                task.path = resolved.output_path
+                self._finish(task, "done")
+            else:
+                task.resolved = resolved
+                with self._lock:
+                    task.status = "resolved"
+                self._transfer_queue.put((task.priority, next(self._sequence), task))
+    
+    def _transfer_loop(self):
+        while True:
+            task = self._take(self._transfer_queue, "running")
+            if task is None:
+                return
+            
+            def on_progress(event: ProgressEvent, task: DownloadTask = task):
+                task.progress = asdict(event)
+                if self.progress_callback:
+                    self.progress_callback(event)
+            
+            try:
+                task.path = self.downloader.transfer_download(
+                    task.resolved, on_progress, task.cancel_event
+                )
+            except Exception as e:
+                task.error = str(e)
+            
+            if task.path:
+                self._finish(task, "done")
+            elif task.cancel_event.is_set():
+                self._finish(task, "cancelled")
+            else:
+                task.error = task.error or "下载失败"
+                self._finish(task, "failed")
+    
+    def _finish(self, task: DownloadTask, status: str):
+        with self._lock:
+            if task.finished:
+                return
+            self._finish_locked(task, status)
+        self._notify_finish(task)
+    
+    def _finish_locked(self, task: DownloadTask, status: str):
+        """标记任务结束 (调用时需持有锁)"""
+        task.status = status
+        task.finished_at = time.time()
+        # 播放列表等解析结果不再需要
+        task.resolved = None
+        self.counts[status] += 1
+        self._pending -= 1
+        if task.holds_slot:
+            task.holds_slot = False
+            self._slots.release()
+        self._idle.notify_all()
+    
+    def _notify_finish(self, task: DownloadTask):
+        if self.on_finish:
+            try:
+                self.on_finish(task)
+            except Exception as e:
+                print(f"⚠ 处理任务结果失败: {e}")
+
+
+def _report_metrics(metrics: DownloadMetrics, args):
+    """打印性能统计，并按命令行参数导出为 JSON / Prometheus 文本"""
+    metrics.print_summary()
+    
+    try:
+        if args.metrics_json:
+            with open(args.metrics_json, 'w', encoding='utf-8') as f:
+                json.dump(metrics.snapshot(), f, indent=2, ensure_ascii=False)
+        if args.metrics_prometheus:
+            with open(args.metrics_prometheus, 'w', encoding='utf-8') as f:
+                f.write(metrics.to_prometheus())
+    except OSError as e:
+        print(f"⚠ 写入性能统计失败: {e}")
+
+
+def _parse_rate(value: str) -> float:
+    """解析带宽参数 (如 500K、5M、1.5G，单位字节/秒)"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = value.strip().upper()
+    if text.endswith("/S"):
+        text = text[:-2]
+    if text.endswith("B"):
+        text = text[:-1]
+    multiplier = 1
+    if text and text[-1] in units:
+        multiplier = units[text[-1]]
+        text = text[:-1]
+    try:
+        rate = float(text) * multiplier
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的带宽: {value}")
+    if rate <= 0:
+        raise argparse.ArgumentTypeError(f"带宽必须大于 0: {value}")
+    return rate
+
+
+def _parse_clip_time(value: str) -> float:
+    """解析片段时间 (秒数，或 分:秒、时:分:秒，如 90、1:30、1:02:03.5)"""
+    parts = value.strip().split(":")
+    try:
+        if len(parts) > 3 or any(not part for part in parts):
+            raise ValueError
+        numbers = [float(part) for part in parts]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的时间: {value}")
+    if any(number < 0 for number in numbers) or any(number >= 60 for number in numbers[1:]):
+        raise argparse.ArgumentTypeError(f"无效的时间: {value}")
+    seconds = 0.0
+    for number in numbers:
+        seconds = seconds * 60 + number
+    return seconds
+
+
+def _clip_from_args(args) -> Optional[ClipRange]:
+    """--start / --end 指定的片段，没有指定时为 None"""
+    if args.start is None and args.end is None:
+        return None
+    return ClipRange(args.start or 0.0, args.end)
+
+
+def _run_batch(downloader: ZhihuVideoDownloader, args, progress_writer=None) -> bool:
+    """
+    --batch: 从文件或标准输入逐行读取 URL (流式读取，不会一次读入全部 URL)，
+    用 DownloadScheduler 解析和下载，每个任务结束时把结果追加到输出目录的 batch_report.jsonl
+    
+    Returns:
+        是否所有任务都下载成功
+    """
+    try:
+        source = sys.stdin if args.batch == "-" else open(args.batch, 'r', encoding='utf-8')
+    except OSError as e:
+        print(f"⚠ 无法读取 URL 列表: {e}")
+        return False
+    
+    output_dir = Path(args.output)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report_path = output_dir / "batch_report.jsonl"
+    report_lock = threading.Lock()
+    clip = _clip_from_args(args)
+    
+    with source, open(report_path, 'w', encoding='utf-8') as report:
+        def on_finish(task: DownloadTask):
+            entry = task.to_dict()
+            entry.pop("progress")
+            with report_lock:
+                report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                report.flush()
+            mark = "✓" if task.status == "done" else "✗"
+            print(f"\n{mark} [{task.status}] {task.url} {task.path or task.error or ''}")
+        
+        scheduler = DownloadScheduler(
+            downloader, args.jobs, args.resolve_workers,
+            on_finish=on_finish, progress_callback=progress_writer
+        )
+        for line in source:
+            url = line.strip()
+            if not url or url.startswith("#"):
+                continue
+            task = DownloadTask(
+                url, args.output, args.quality, DownloadScheduler.PRIORITY_BULK, args.deadline,
+                clip
+            )
+            scheduler.submit(task, block=True)
+        scheduler.close()
+    
+    counts = scheduler.counts
+    print(f"\n批量下载完成: 成功 {counts['done']}，失败 {counts['failed']}，"
+          f"取消 {counts['cancelled']}")
+    print(f"结果记录: {report_path}")
+    return counts["failed"] == 0 and counts["cancelled"] == 0
 
 
 def main():
@@ -653,7 +5580,8 @@ def main():
     )
     parser.add_argument(
         "url",
-        help="知乎视频页面 URL 或视频 ID"
+        nargs="?",
+        help="知乎视频页面 URL 或视频 ID (使用 --course 时为课程中任意视频的 URL 或课程 ID)"
     )
     parser.add_argument(
         "-o", "--output",
@@ -663,8 +5591,21 @@ def main():
     parser.add_argument(
         "-q", "--quality",
         default="hd",
-        choices=["uhd", "fhd", "hd", "sd", "ld"],
-        help="视频清晰度 (默认: hd)"
+        choices=["uhd", "fhd", "hd", "sd", "ld", "auto"],
+        help="视频清晰度，auto 表示测速后选择能在时间预算内下载完成的最高清晰度 (默认: hd)"
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="-q auto 的时间预算: 单个视频的下载时间，--course 时为整个课程的下载时间 "
+             "(默认: 视频时长)"
+    )
+    parser.add_argument(
+        "--max-rate",
+        type=_parse_rate,
+        metavar="RATE",
+        help="-q auto 的带宽预算，如 2M 表示 2 MB/s (默认: 使用测得的带宽)"
     )
     parser.add_argument(
         "-c", "--cookies",
@@ -675,27 +5616,187 @@ def main():
         action="store_true",
         help="不使用任何 cookies (仅能下载免费公开视频)"
     )
+    parser.add_argument(
+        "--segment-workers",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS,
+        metavar="N",
+        help=f"M3U8 分片并发下载线程数，0 表示直接使用 ffmpeg 下载 "
+             f"(默认: {ZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS})"
+    )
+    
+    parser.add_argument(
+        "--connections",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS,
+        metavar="N",
+        help=f"MP4 视频并发下载的连接数，1 表示单连接下载 "
+             f"(默认: {ZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS})"
+    )
+    parser.add_argument(
+        "--start",
+        type=_parse_clip_time,
+        metavar="TIME",
+        help="只下载从该时间开始的片段，如 90、1:30、1:02:03.5 (只下载覆盖片段的分片或字节范围)"
+    )
+    parser.add_argument(
+        "--end",
+        type=_parse_clip_time,
+        metavar="TIME",
+        help="只下载到该时间为止的片段 (默认: 视频结尾)"
+    )
+    parser.add_argument(
+        "--course",
+        action="store_true",
+        help="下载 URL 所属训练营课程的所有小节，并在输出目录写入汇总报告"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="从文件逐行读取 URL 批量下载 (- 表示标准输入)，解析和下载在两个线程池中同时进行"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_COURSE_JOBS,
+        metavar="N",
+        help=f"整课或批量下载时同时下载的视频数 (默认: {ZhihuVideoDownloader.DEFAULT_COURSE_JOBS})"
+    )
+    parser.add_argument(
+        "--resolve-workers",
+        type=int,
+        default=DownloadScheduler.DEFAULT_RESOLVE_WORKERS,
+        metavar="N",
+        help=f"批量下载时同时解析的视频数 (默认: {DownloadScheduler.DEFAULT_RESOLVE_WORKERS})"
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="忽略已缓存的视频 ID 和播放列表，重新解析"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"元数据缓存目录 (默认: {DEFAULT_CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不使用元数据缓存"
+    )
+    parser.add_argument(
+        "--no-reuse",
+        action="store_true",
+        help="总是重新下载，不复用之前下载过的相同视频 (同一视频 ID 和清晰度)"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="断点续传: 在输出文件旁边保存下载清单，中断后重新运行同一命令只下载缺失部分"
+    )
+    parser.add_argument(
+        "--pipe-remux",
+        action="store_true",
+        help="M3U8 分片下载后直接写入 ffmpeg，边下载边合并，不占用临时磁盘空间"
+    )
+    parser.add_argument(
+        "--fixed-concurrency",
+        action="store_true",
+        help="关闭自适应并发控制，始终使用指定的线程数/连接数"
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="结束时把性能统计 (各阶段耗时、每个主机的请求统计) 写入 JSON 文件"
+    )
+    parser.add_argument(
+        "--metrics-prometheus",
+        metavar="PATH",
+        help="结束时把性能统计以 Prometheus 文本格式写入文件 (可用于 node_exporter textfile)"
+    )
+    parser.add_argument(
+        "--progress-fd",
+        type=int,
+        metavar="FD",
+        help="把进度事件 (字节数、分片数、速度、剩余时间) 以 JSON Lines 格式写入该文件描述符"
+    )
     
     args = parser.parse_args()
+    if not args.url and not args.batch:
+        parser.error("需要指定视频 URL 或 --batch")
+    if args.start is not None and args.end is not None and args.end <= args.start:
+        parser.error("--end 必须晚于 --start")
+    if args.course and (args.start is not None or args.end is not None):
+        parser.error("--course 不支持 --start / --end")
     
     # 创建下载器
+    downloader_options = {
+        "segment_workers": args.segment_workers,
+        "resume": args.resume,
+        "mp4_connections": args.connections,
+        "cache_dir": None if args.no_cache else args.cache_dir,
+        "refresh_cache": args.refresh,
+        "adaptive_concurrency": not args.fixed_concurrency,
+        "pipe_remux": args.pipe_remux,
+        "max_rate": args.max_rate,
+        "reuse_downloads": not args.no_reuse,
+        "parallel_videos": args.jobs,
+    }
     if args.no_cookies:
-        downloader = ZhihuVideoDownloader(use_chrome_cookies=False)
+        downloader = ZhihuVideoDownloader(use_chrome_cookies=False, **downloader_options)
     elif args.cookies:
-        downloader = ZhihuVideoDownloader(use_chrome_cookies=False, cookie_file=args.cookies)
+        downloader = ZhihuVideoDownloader(
+            use_chrome_cookies=False,
+            cookie_file=args.cookies,
+            **downloader_options
+        )
     else:
-        downloader = ZhihuVideoDownloader(use_chrome_cookies=True)
+        downloader = ZhihuVideoDownloader(use_chrome_cookies=True, **downloader_options)
+    
+    progress_writer = None
+    if args.progress_fd is not None:
+        progress_writer = JsonLinesProgressWriter(args.progress_fd)
+    
+    if args.batch:
+        success = _run_batch(downloader, args, progress_writer)
+        _report_metrics(downloader.metrics, args)
+        return 0 if success else 1
+    
+    if args.course:
+        report = downloader.download_course(
+            args.url,
+            output_dir=args.output,
+            quality=args.quality,
+            jobs=args.jobs,
+            progress_callback=progress_writer,
+            deadline=args.deadline
+        )
+        _report_metrics(downloader.metrics, args)
+        if report and report["failed"] == 0 and report["unresolved"] == 0:
+            return 0
+        return 1
     
     # 下载视频
-    def progress_callback(progress):
-        print(f"\r下载进度: {progress:.1f}%", end="", flush=True)
+    def progress_callback(event: ProgressEvent):
+        if progress_writer:
+            progress_writer(event)
+        # M3U8 分片下载和 ffmpeg 会自己显示进度
+        if event.phase == "download" and event.segments_total is None and event.bytes_total:
+            print(
+                f"\r下载进度: {event.percent:.1f}% "
+                f"({event.instant_bps / 1024 / 1024:.1f} MB/s)",
+                end="", flush=True
+            )
     
     result = downloader.download_video(
         args.url,
         output_dir=args.output,
         quality=args.quality,
-        progress_callback=progress_callback
+        progress_callback=progress_callback,
+        deadline=args.deadline,
+        clip=_clip_from_args(args)
     )
+    _report_metrics(downloader.metrics, args)
     
     if result:
         print(f"\n\n✓ 视频已保存到: {result}")
@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+"""
+知乎视频分布式下载
+
+多台机器通过共享存储 (NFS、SMB 等) 上的同一个 SQLite 队列分配下载任务，不需要中心服务:
+每台机器运行一个 worker，从队列中领取任务，用 ZhihuVideoDownloader.download_video 下载，
+再把结果 (输出文件路径或错误) 写回队列。
+
+租约: worker 领取任务时写入租约到期时间，下载过程中由心跳线程定期续约。节点崩溃或断网后
+租约不再续期，过期的任务回到队列，由其他 worker 重新领取 (配合 --resume 和共享输出目录时
+从中断处继续下载)。续约时发现租约已被其他 worker 接手，本地下载会被取消，同一任务不会
+被两个 worker 同时下载。每个任务最多领取 max_attempts 次，一直失败 (或让 worker 崩溃)
+的任务标记为 failed，不会无限重试。
+
+注意:
+- 队列使用 SQLite 的回滚日志 (不使用 WAL，WAL 依赖共享内存，不支持网络文件系统)，
+  共享存储需要支持文件锁
+- 租约到期时间使用各节点的本地时钟，各节点的时钟需要同步 (NTP)，租约时长应远大于时钟误差
+
+使用方法:
+    python zhihu_worker.py /mnt/shared/queue.sqlite3 add urls.txt [-q fhd] [-o 输出目录]
+    python zhihu_worker.py /mnt/shared/queue.sqlite3 work [-j 2] [-o 输出目录] [--exit-when-empty]
+    python zhihu_worker.py /mnt/shared/queue.sqlite3 status
+    python zhihu_worker.py /mnt/shared/queue.sqlite3 retry
+"""
+
+import os
+import sys
+import time
+import uuid
+import socket
+import signal
+import sqlite3
+import argparse
+import threading
+import contextlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+from zhihu_downloader import (
+    DEFAULT_CACHE_DIR,
+    DownloadScheduler,
+    ProgressEvent,
+    ZhihuVideoDownloader,
+)
+
+
+# 队列中任务的状态
+QUEUE_STATUSES = ("queued", "leased", "done", "failed")
+
+
+@dataclass
+class JobLease:
+    """worker 领取到的任务，token 用于确认租约仍属于自己"""
+    id: int
+    url: str
+    quality: str
+    output_dir: Optional[str]  # None 表示使用 worker 的输出目录
+    deadline: Optional[float]
+    attempts: int
+    token: str
+
+
+class SharedJobQueue:
+    """
+    共享任务队列
+    
+    所有状态都保存在一个 SQLite 数据库中，多个进程 (可以在不同机器上) 同时打开同一个文件。
+    领取任务在 BEGIN IMMEDIATE 事务中进行，同一个任务同时只会被一个 worker 领取。
+    """
+    
+    # 租约时长 (秒)，心跳间隔为租约时长的 1/3
+    DEFAULT_LEASE_SECONDS = 120
+    
+    # 每个任务最多领取的次数 (下载失败和租约过期都计入)
+    DEFAULT_MAX_ATTEMPTS = 3
+    
+    def __init__(self, path: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """
+        Args:
+            path: 队列数据库文件路径 (不存在时创建)
+            max_attempts: 每个任务最多领取的次数
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        # 事务由 _transaction 显式控制
+        self._conn = sqlite3.connect(
+            path, timeout=60, check_same_thread=False, isolation_level=None
+        )
+        # 日志模式不能在事务中修改
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, "
+                "quality TEXT NOT NULL, output_dir TEXT, deadline REAL, "
+                "priority INTEGER NOT NULL, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, token TEXT, "
+                "lease_expires REAL, progress REAL, path TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, id)"
+            )
+    
+    @contextlib.contextmanager
+    def _transaction(self):
+        """写事务: 开始时即获取数据库的写锁，避免两个进程读到同一个待领取的任务"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+    
+    def enqueue(self, urls: Iterable[str], quality: str = "hd",
+                output_dir: Optional[str] = None, deadline: Optional[float] = None,
+                priority: int = DownloadScheduler.PRIORITY_BULK) -> int:
+        """
+        把 URL 加入队列
+        
+        Returns:
+            加入的任务数
+        """
+        now = time.time()
+        rows = [
+            (url, quality, output_dir, deadline, priority, "queued", now, now)
+            for url in urls
+        ]
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT INTO jobs (url, quality, output_dir, deadline, priority, status, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+        return len(rows)
+    
+    def lease(self, worker: str,
+              lease_seconds: float = DEFAULT_LEASE_SECONDS) -> Optional[JobLease]:
+        """
+        领取一个任务: 排队中的任务，或租约已过期的任务 (原 worker 已失联)
+        
+        Returns:
+            领取到的任务，队列中没有可领取的任务时返回 None
+        """
+        with self._transaction() as conn:
+            while True:
+                now = time.time()
+                row = conn.execute(
+                    "SELECT id, url, quality, output_dir, deadline, attempts, status, worker "
+                    "FROM jobs WHERE status = 'queued' "
+                    "OR (status = 'leased' AND lease_expires < ?) "
+                    "ORDER BY priority, id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if not row:
+                    return None
+                
+                job_id, url, quality, output_dir, deadline, attempts, status, previous = row
+                if attempts >= self.max_attempts:
+                    error = (f"租约过期 (worker {previous} 可能已停止)" if status == "leased"
+                             else "超过最大尝试次数")
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', token = NULL, "
+                        "error = COALESCE(error, ?), updated_at = ? WHERE id = ?",
+                        (error, now, job_id)
+                    )
+                    continue
+                
+                token = uuid.uuid4().hex
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', attempts = attempts + 1, worker = ?, "
+                    "token = ?, lease_expires = ?, progress = NULL, updated_at = ? "
+                    "WHERE id = ?",
+                    (worker, token, now + lease_seconds, now, job_id)
+                )
+                return JobLease(job_id, url, quality, output_dir, deadline, attempts + 1, token)
+    
+    def renew(self, leases: List[JobLease], lease_seconds: float = DEFAULT_LEASE_SECONDS,
+              progress: Optional[Dict[str, float]] = None) -> List[JobLease]:
+        """
+        续约 (心跳)，同时记录下载进度
+        
+        Args:
+            leases: 要续约的任务
+            lease_seconds: 新的租约时长
+            progress: 租约 token -> 下载进度百分比
+        
+        Returns:
+            已经失去的租约 (已过期并被其他 worker 领取，或任务已被重置)
+        """
+        progress = progress or {}
+        lost = []
+        now = time.time()
+        with self._transaction() as conn:
+            for lease in leases:
+                updated = conn.execute(
+                    "UPDATE jobs SET lease_expires = ?, progress = COALESCE(?, progress), "
+                    "updated_at = ? WHERE id = ? AND token = ? AND status = 'leased'",
+                    (now + lease_seconds, progress.get(lease.token), now, lease.id, lease.token)
+                ).rowcount
+                if not updated:
+                    lost.append(lease)
+        return lost
+    
+    def complete(self, lease: JobLease, path: str) -> bool:
+        """记录下载成功，租约已失去时返回 False"""
+        return self._finish(lease, "done", path=path)
+    
+    def fail(self, lease: JobLease, error: str) -> bool:
+        """记录下载失败: 未达到最大尝试次数时重新排队，否则标记为 failed"""
+        status = "queued" if lease.attempts < self.max_attempts else "failed"
+        return self._finish(lease, status, error=error)
+    
+    def release(self, lease: JobLease) -> bool:
+        """放弃租约 (worker 正常退出)，任务重新排队且不计入尝试次数"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = attempts - 1, token = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ? AND token = ?",
+                (time.time(), lease.id, lease.token)
+            ).rowcount == 1
+    
+    def _finish(self, lease: JobLease, status: str, path: Optional[str] = None,
+                error: Optional[str] = None) -> bool:
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = ?, path = ?, error = ?, token = NULL, "
+                "lease_expires = NULL, updated_at = ? WHERE id = ? AND token = ?",
+                (status, path, error, time.time(), lease.id, lease.token)
+            ).rowcount == 1
+    
+    def retry_failed(self) -> int:
+        """把失败的任务重新排队 (尝试次数清零)，返回任务数"""
+        with self._transaction() as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'queued', attempts = 0, error = NULL, "
+                "updated_at = ? WHERE status = 'failed'",
+                (time.time(),)
+            ).rowcount
+    
+    def counts(self) -> Dict[str, int]:
+        """各状态的任务数，expired 为租约已过期、等待重新领取的任务数 (包含在 leased 中)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+            expired = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_expires < ?",
+                (time.time(),)
+            ).fetchone()[0]
+        counts = {status: 0 for status in QUEUE_STATUSES}
+        counts.update(dict(rows))
+        counts["expired"] = expired
+        return counts
+    
+    def active(self) -> List[Dict[str, object]]:
+        """租约中的任务 (用于显示各 worker 的进度)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, url, worker, attempts, lease_expires, progress FROM jobs "
+                "WHERE status = 'leased' ORDER BY id"
+            ).fetchall()
+        keys = ("id", "url", "worker", "attempts", "lease_expires", "progress")
+        return [dict(zip(keys, row)) for row in rows]
+    
+    def failed(self) -> List[Dict[str, object]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, url, worker, attempts, error FROM jobs "
+                "WHERE status = 'failed' ORDER BY id"
+            ).fetchall()
+        keys = ("id", "url", "worker", "attempts", "error")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+class QueueWorker:
+    """
+    从共享队列领取任务并下载
+    
+    jobs 个下载线程共享同一个下载器 (cookies、连接池和自适应并发状态)，每个线程领取一个任务，
+    下载完成后写回结果再领取下一个。心跳线程为所有正在下载的任务续约，发现租约已失去时
+    取消对应的下载。
+    """
+    
+    # 队列暂时没有可领取的任务时，再次查询的间隔 (秒)
+    POLL_INTERVAL = 5.0
+    
+    def __init__(self, queue: SharedJobQueue, downloader: ZhihuVideoDownloader,
+                 jobs: int = 1, output_dir: str = ".",
+                 lease_seconds: float = SharedJobQueue.DEFAULT_LEASE_SECONDS,
+                 worker_id: Optional[str] = None,
+                 poll_interval: float = POLL_INTERVAL):
+        """
+        Args:
+            queue: 共享任务队列
+            downloader: 所有任务共享的下载器
+            jobs: 同时下载的视频数
+            output_dir: 任务没有指定输出目录时使用的目录
+            lease_seconds: 租约时长 (秒)
+            worker_id: worker 名称，默认为 主机名:进程号
+            poll_interval: 队列为空时再次查询的间隔 (秒)
+        """
+        self.queue = queue
+        self.downloader = downloader
+        self.jobs = max(1, jobs)
+        self.output_dir = output_dir
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = poll_interval
+        self.counts = {"done": 0, "failed": 0, "lost": 0}
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # token -> (租约, 取消事件, 最新进度百分比)
+        self._active: Dict[str, list] = {}
+    
+    def run(self, exit_when_empty: bool = False) -> Dict[str, int]:
+        """
+        运行到 stop() 被调用 (或队列中的任务全部结束)
+        
+        Args:
+            exit_when_empty: 队列中没有排队和租约中的任务时退出。其他 worker 的租约
+                             过期后会被本 worker 接手，所以要等所有租约都结束才退出
+        
+        Returns:
+            本 worker 完成、失败和失去租约的任务数
+        """
+        heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+        heartbeat.start()
+        threads = [
+            threading.Thread(target=self._work_loop, args=(exit_when_empty,), daemon=True)
+            for _ in range(self.jobs)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            # 主线程等待时仍能响应 KeyboardInterrupt
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+        finally:
+            self.stop()
+            for thread in threads:
+                thread.join()
+            heartbeat.join()
+        with self._lock:
+            return dict(self.counts)
+    
+    def stop(self):
+        """停止领取新任务，取消正在下载的任务并归还租约"""
+        self._stop.set()
+        with self._lock:
+            for _, cancel_event, _ in self._active.values():
+                cancel_event.set()
+    
+    def _work_loop(self, exit_when_empty: bool):
+        while not self._stop.is_set():
+            try:
+                lease = self.queue.lease(self.worker_id, self.lease_seconds)
+            except sqlite3.Error as e:
+                print(f"⚠ 无法访问任务队列: {e}")
+                lease = None
+            
+            if lease is None:
+                if exit_when_empty and self._queue_finished():
+                    return
+                self._stop.wait(self.poll_interval)
+                continue
+            
+            self._download(lease)
+    
+    def _queue_finished(self) -> bool:
+        try:
+            counts = self.queue.counts()
+        except sqlite3.Error:
+            return False
+        return counts["queued"] == 0 and counts["leased"] == 0
+    
+    def _download(self, lease: JobLease):
+        cancel_event = threading.Event()
+        entry = [lease, cancel_event, None]
+        with self._lock:
+            self._active[lease.token] = entry
+        
+        def on_progress(event: ProgressEvent):
+            if event.percent is not None:
+                entry[2] = round(event.percent, 1)
+        
+        print(f"\n[{self.worker_id}] 领取任务 #{lease.id} (第 {lease.attempts} 次): {lease.url}")
+        path, error = None, None
+        try:
+            path = self.downloader.download_video(
+                lease.url,
+                output_dir=lease.output_dir or self.output_dir,
+                quality=lease.quality,
+                progress_callback=on_progress,
+                deadline=lease.deadline,
+                cancel_event=cancel_event
+            )
+        except Exception as e:
+            error = str(e)
+        finally:
+            with self._lock:
+                self._active.pop(lease.token, None)
+        
+        try:
+            self._report(lease, path, error, cancel_event)
+        except sqlite3.Error as e:
+            # 租约到期后任务会被重新领取
+            print(f"⚠ 无法写回任务 #{lease.id} 的结果: {e}")
+    
+    def _report(self, lease: JobLease, path: Optional[str], error: Optional[str],
+                cancel_event: threading.Event):
+        if path:
+            if self.queue.complete(lease, path):
+                self._count("done")
+                print(f"✓ 任务 #{lease.id} 完成: {path}")
+            else:
+                self._count("lost")
+                print(f"⚠ 任务 #{lease.id} 已下载，但租约已被其他 worker 接手")
+        elif cancel_event.is_set():
+            if self._stop.is_set() and self.queue.release(lease):
+                print(f"任务 #{lease.id} 已归还队列")
+            else:
+                self._count("lost")
+        else:
+            error = error or "下载失败"
+            self.queue.fail(lease, error)
+            self._count("failed")
+            retry = "，已重新排队" if lease.attempts < self.queue.max_attempts else ""
+            print(f"⚠ 任务 #{lease.id} 失败{retry}: {error}")
+    
+    def _count(self, outcome: str):
+        """统计结果，多个下载线程同时写回结果"""
+        with self._lock:
+            self.counts[outcome] += 1
+    
+    def _heartbeat_loop(self):
+        interval = self.lease_seconds / 3
+        while not self._stop.wait(interval):
+            with self._lock:
+                entries = list(self._active.values())
+            if not entries:
+                continue
+            
+            leases = [lease for lease, _, _ in entries]
+            progress = {lease.token: percent for lease, _, percent in entries}
+            try:
+                lost = self.queue.renew(leases, self.lease_seconds, progress)
+            except sqlite3.Error as e:
+                # 下一次心跳再试，租约时长是心跳间隔的 3 倍
+                print(f"⚠ 续约失败: {e}")
+                continue
+            
+            lost_tokens = {lease.token for lease in lost}
+            for lease, cancel_event, _ in entries:
+                if lease.token in lost_tokens:
+                    print(f"⚠ 任务 #{lease.id} 的租约已失去，停止下载")
+                    cancel_event.set()
+
+
+def _read_urls(source: str) -> List[str]:
+    """从文件或标准输入 (-) 读取 URL，忽略空行和 # 开头的注释"""
+    f = sys.stdin if source == "-" else open(source, 'r', encoding='utf-8')
+    with f:
+        return [
+            line.strip() for line in f
+            if line.strip() and not line.strip().startswith("#")
+        ]
+
+
+def _print_status(queue: SharedJobQueue):
+    counts = queue.counts()
+    print(f"排队: {counts['queued']}  下载中: {counts['leased'] - counts['expired']}  "
+          f"租约过期: {counts['expired']}  完成: {counts['done']}  失败: {counts['failed']}")
+    
+    now = time.time()
+    for job in queue.active():
+        progress = f"{job['progress']:.1f}%" if job["progress"] is not None else "-"
+        remaining = job["lease_expires"] - now
+        lease = f"租约剩余 {remaining:.0f} 秒" if remaining >= 0 else "租约已过期"
+        print(f"  #{job['id']} [{job['worker']}] {progress} ({lease}) {job['url']}")
+    
+    for job in queue.failed():
+        print(f"  ✗ #{job['id']} [{job['worker']}] 尝试 {job['attempts']} 次: "
+              f"{job['error']} {job['url']}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(
+        description="知乎视频分布式下载 - 多台机器通过共享存储上的任务队列分配下载任务"
+    )
+    parser.add_argument("queue", help="任务队列数据库路径 (放在所有机器都能访问的共享存储上)")
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        default=SharedJobQueue.DEFAULT_MAX_ATTEMPTS,
+        metavar="N",
+        help=f"每个任务最多领取的次数 (默认: {SharedJobQueue.DEFAULT_MAX_ATTEMPTS})"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    add_parser = commands.add_parser("add", help="把 URL 列表加入队列")
+    add_parser.add_argument("file", help="URL 列表文件，每行一个 URL (- 表示标准输入)")
+    add_parser.add_argument("-q", "--quality", default="hd",
+                            choices=ZhihuVideoDownloader.QUALITY_ORDER + ["auto"],
+                            help="视频清晰度 (默认: hd)")
+    add_parser.add_argument("-o", "--output",
+                            help="输出目录 (默认: 各 worker 的 -o 目录)")
+    add_parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                            help="-q auto 的时间预算 (默认: 视频时长)")
+    add_parser.add_argument("--priority", type=int, default=DownloadScheduler.PRIORITY_BULK,
+                            help=f"优先级，数值小的先下载 (默认: {DownloadScheduler.PRIORITY_BULK})")
+    
+    work_parser = commands.add_parser("work", help="启动 worker，领取并下载任务")
+    work_parser.add_argument("-o", "--output", default=".", help="输出目录 (默认为当前目录)")
+    work_parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="同时下载的视频数 (默认: 1)"
+    )
+    work_parser.add_argument(
+        "--lease",
+        type=float,
+        default=SharedJobQueue.DEFAULT_LEASE_SECONDS,
+        metavar="SECONDS",
+        help=f"租约时长，worker 失联这么久后任务被重新分配 "
+             f"(默认: {SharedJobQueue.DEFAULT_LEASE_SECONDS})"
+    )
+    work_parser.add_argument("--worker-id", help="worker 名称 (默认: 主机名:进程号)")
+    work_parser.add_argument("--exit-when-empty", action="store_true",
+                             help="队列中的任务全部结束后退出 (默认: 一直等待新任务)")
+    work_parser.add_argument("-c", "--cookies", help="cookies 文件路径 (JSON 格式)，如果指定则优先使用")
+    work_parser.add_argument("--no-cookies", action="store_true",
+                             help="不使用任何 cookies (仅能下载免费公开视频)")
+    work_parser.add_argument(
+        "--segment-workers",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS,
+        metavar="N",
+        help=f"M3U8 分片并发下载线程数 (默认: {ZhihuVideoDownloader.DEFAULT_SEGMENT_WORKERS})"
+    )
+    work_parser.add_argument(
+        "--connections",
+        type=int,
+        default=ZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS,
+        metavar="N",
+        help=f"MP4 视频并发下载的连接数 (默认: {ZhihuVideoDownloader.DEFAULT_MP4_CONNECTIONS})"
+    )
+    work_parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                             help=f"元数据缓存目录 (默认: {DEFAULT_CACHE_DIR})")
+    work_parser.add_argument("--no-cache", action="store_true", help="不使用元数据缓存")
+    work_parser.add_argument("--resume", action="store_true",
+                             help="断点续传: 接手其他 worker 的任务时只下载缺失部分 (需要共享输出目录)")
+    work_parser.add_argument("--pipe-remux", action="store_true",
+                             help="M3U8 分片下载后直接写入 ffmpeg，不占用临时磁盘空间")
+    
+    commands.add_parser("status", help="查看队列状态")
+    commands.add_parser("retry", help="把失败的任务重新排队")
+    
+    args = parser.parse_args()
+    
+    try:
+        queue = SharedJobQueue(args.queue, args.max_attempts)
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠ 无法打开任务队列: {e}")
+        return 1
+    
+    if args.command == "add":
+        try:
+            urls = _read_urls(args.file)
+        except OSError as e:
+            print(f"⚠ 无法读取 URL 列表: {e}")
+            return 1
+        output_dir = os.path.abspath(args.output) if args.output else None
+        count = queue.enqueue(urls, args.quality, output_dir, args.deadline, args.priority)
+        print(f"✓ 已加入 {count} 个任务")
+        return 0
+    
+    if args.command == "status":
+        _print_status(queue)
+        return 0
+    
+    if args.command == "retry":
+        print(f"✓ 已重新排队 {queue.retry_failed()} 个失败的任务")
+        return 0
+    
+    downloader = ZhihuVideoDownloader(
+        use_chrome_cookies=not (args.no_cookies or args.cookies),
+        cookie_file=None if args.no_cookies else args.cookies,
+        segment_workers=args.segment_workers,
+        resume=args.resume,
+        mp4_connections=args.connections,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        pipe_remux=args.pipe_remux,
+        parallel_videos=args.jobs,
+    )
+    worker = QueueWorker(
+        queue, downloader, args.jobs, args.output, args.lease, args.worker_id
+    )
+    # 被 kill (SIGTERM) 时同样归还租约，任务可以立即被其他 worker 领取
+    signal.signal(signal.SIGTERM, lambda *_: worker.stop())
+    
+    print(f"✓ worker {worker.worker_id} 已启动 (同时下载 {worker.jobs} 个视频)")
+    try:
+        counts = worker.run(args.exit_when_empty)
+    except KeyboardInterrupt:
+        print("\n正在停止 worker...")
+        worker.stop()
+        counts = worker.counts
+    
+    print(f"\nworker 结束: 完成 {counts['done']}，失败 {counts['failed']}，"
+          f"失去租约 {counts['lost']}")
+    return 0 if counts["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    exit(main())